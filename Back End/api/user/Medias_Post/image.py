@@ -0,0 +1,52 @@
+import os
+import flask
+from flask_restful import Resource, reqparse
+import config
+import images
+import user, post
+import errors
+
+
+class PostImage(Resource):
+    """
+    Image of a post. The file is sent from the disk as it is read (see flask.send_file()), never loaded whole in
+    memory, and the response is conditional : clients sending the ETag of the image they have get a 304 without the
+    file being read, and Range requests get only the bytes asked.
+    """
+
+    def get(self, id):
+        """
+        Headers :
+            - Authorization : Token of the current user.
+            - Accept : Image formats the client can read.
+        Parameters :
+            - size : Width and height in pixels wanted, the smallest image at least as big is sent. Optional, the
+            largest image is sent when not provided.
+        :return:
+        """
+        parser = reqparse.RequestParser()
+        parser.add_argument("Authorization", location="headers")
+        parser.add_argument("size")
+        params = parser.parse_args()
+
+        try:
+            size = int(params["size"]) if params["size"] else config.IMAGE_DIMENSION
+        except ValueError:
+            return errors.MissingInformation.get_response()
+
+        try:
+            userobj = user.User(token=params["Authorization"])
+            postobj = post.Post(id, userobj)
+            path, format = postobj.image_file(size, flask.request.accept_mimetypes)
+        except errors.BestagramException as e:
+            return e.get_response()
+
+        # Relative paths would be read from the directory of the app instead of the working directory.
+        response = flask.send_file(os.path.abspath(path), mimetype=images.FORMATS[format][0], conditional=True,
+                                   cache_timeout=0)
+        # Posts of private accounts must not be kept by shared caches. Clients revalidate with the ETag.
+        response.cache_control.public = False
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        response.vary.add("Accept")
+        return response
@@ -10,10 +10,9 @@ class Like_Unlike(Resource):
         parser.add_argument("Authorization", location="headers")
         params = parser.parse_args()
 
-        userobj = user.User(token=params["Authorization"])
-        postobj = post.Post(id, userobj)
-
         try:
+            userobj = user.User(token=params["Authorization"])
+            postobj = post.Post(id, userobj)
             postobj.like()
         except errors.BestagramException as e:
             return e.get_response()
@@ -26,10 +25,9 @@ class Like_Unlike(Resource):
         parser.add_argument("Authorization", location="headers")
         params = parser.parse_args()
 
-        userobj = user.User(token=params["Authorization"])
-        postobj = post.Post(id, userobj)
-
         try:
+            userobj = user.User(token=params["Authorization"])
+            postobj = post.Post(id, userobj)
             postobj.unlike()
         except errors.BestagramException as e:
             return e.get_response()
@@ -1,11 +1,10 @@
 from flask_restful import Resource, reqparse
 import werkzeug
 import user, post
-from database import request_utils
 from errors import *
 import tag
 import json
-from PIL import Image
+import media_pipeline
 
 
 class CreatePost(Resource):
@@ -75,10 +74,8 @@ class CreatePost(Resource):
             for i in tags:
                 thistag = tags[i]
                 try:
-                    id = thistag["id"]
-                    if not request_utils.user_existing(id):
-                        continue
-                    thistag = tag.Tag(user_id=id, pos_x=thistag["pos_x"], pos_y=thistag["pos_y"])
+                    # Tags of users not existing are skipped when the post is saved.
+                    thistag = tag.Tag(user_id=int(thistag["id"]), pos_x=thistag["pos_x"], pos_y=thistag["pos_y"])
                     if thistag not in tags_list:  # Prevent redundant tags_list with the same person tagged.
                         tags_list.append(thistag)
                 except UserNotExisting:
@@ -91,6 +88,7 @@ class CreatePost(Resource):
             # tags in this case.
             print("Error while parsing json : ", e)
 
-        img = Image.open(params["image"].stream)
-        postobj = post.Post.create(userobj, img, caption=params["caption"], tags=tags_list)
-        return {"success": True, "id" : postobj.id}, 200
+        # The image is processed in the background, the post is created with the processing status.
+        upload = media_pipeline.spool(params["image"].stream)
+        postobj = post.Post.create(userobj, upload, caption=params["caption"], tags=tags_list)
+        return {"success": True, "id" : postobj.id, "status": postobj.status}, 200
@@ -1,9 +1,11 @@
 import flask
+import config
+import images
 
-from errors import BestagramException
-from profile import Profile
+from errors import BestagramException, MissingInformation
+from profile import Profile, picture_route
 
-from flask_restful import Resource
+from flask_restful import Resource, reqparse
 
 
 class ProfilePicture(Resource):
@@ -11,20 +13,52 @@ class ProfilePicture(Resource):
     Endpoint that holds the profile pictures.
     """
 
-    def get(self, id):
+    def get(self, id, version: int = None):
         """
-        Returns the profile picture.
+        Returns the profile picture, in the best format accepted by the client (see images.negotiate()).
+
+        The route with the version of the picture (see profile.picture_route()) always sends the same picture, clients
+        and CDNs can cache it forever. An outdated version is redirected to the current one.
+        Headers :
+            - Accept : Image formats the client can read.
+        Parameters :
+            - size : Width and height in pixels wanted, the smallest picture at least as big is sent. Optional, the
+            largest picture is sent when not provided.
         :param id:
+        :param version: Version of the picture, None for the current one.
         :return:
         """
+        parser = reqparse.RequestParser()
+        parser.add_argument("size")
+        params = parser.parse_args()
+
         profile = Profile(id=id)
         try:
-            profile_picture = profile.profile_picture
+            size = int(params["size"]) if params["size"] else config.PROFILE_PICTURE_DIMENSION
+            profile_picture, format, current_version = profile.sized_profile_picture(
+                size, flask.request.accept_mimetypes, version)
+        except ValueError:
+            return MissingInformation.get_response()
         except BestagramException as e:
             return e.get_response()
 
+        if profile_picture is None:
+            location = picture_route(id, current_version)
+            if flask.request.query_string:
+                location += "?" + flask.request.query_string.decode("ascii")
+            response = flask.redirect(location)
+            response.headers.set('Cache-Control', 'no-cache')
+            return response
+
+        mimetype, extension = images.FORMATS[format]
         response = flask.make_response(profile_picture)
-        response.headers.set('Content-Type', 'image/png')
+        response.headers.set('Content-Type', mimetype)
         response.headers.set(
-            'Content-Disposition', 'attachment', filename='picture.png')
+            'Content-Disposition', 'attachment', filename=f'picture{extension}')
+        # The content depends on the Accept header, caches must not send a WebP picture to another client.
+        response.headers.set('Vary', 'Accept')
+        if version is None:
+            response.headers.set('Cache-Control', 'no-cache')
+        else:
+            response.headers.set('Cache-Control', f'public, max-age={config.PROFILE_PICTURE_MAX_AGE}, immutable')
         return response
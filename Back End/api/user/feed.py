@@ -0,0 +1,39 @@
+from flask_restful import Resource, reqparse
+import config
+import user
+from errors import *
+
+
+class Feed(Resource):
+    """
+    Home feed of the current user (see timeline.py).
+    """
+
+    def get(self):
+        """
+        Headers :
+            - Authorization : Token of the current user.
+        Parameters :
+            - rowCount : Number of posts to send.
+            - cursor : nextCursor of the previous page. Not provided for the first page.
+        :return:
+        """
+        parser = reqparse.RequestParser()
+        parser.add_argument("Authorization", location="headers")
+        parser.add_argument("rowCount")
+        parser.add_argument("cursor")
+        params = parser.parse_args()
+
+        if not (params["Authorization"] and params["rowCount"]):
+            return MissingInformation.get_response()
+        try:
+            row_count = min(int(params["rowCount"]), config.FEED_MAX_ROW_COUNT)
+        except ValueError:
+            return MissingInformation.get_response()
+
+        try:
+            userobj = user.User(token=params["Authorization"])
+            posts, next_cursor = userobj.feed(row_count, params["cursor"])
+        except BestagramException as e:
+            return e.get_response()
+        return {"result": posts, "nextCursor": next_cursor, "success": True}, 200
@@ -1,4 +1,7 @@
+import json
+import flask
 from flask_restful import Resource, reqparse
+import config
 import user
 from errors import *
 
@@ -31,3 +34,109 @@ class Follow(Resource):
         except BestagramException as e:
             return e.get_response()
         return {"success": True}, 200
+
+
+class FollowBatch(Resource):
+    """
+    Follow several users at once (e.g. contacts imported when registering).
+    """
+
+    def post(self):
+        """
+        Headers :
+            - Authorization : Token of the current user.
+        Parameters :
+            - ids : Json list of the ids of the users to follow.
+        :return:
+        """
+        parser = reqparse.RequestParser()
+        parser.add_argument("Authorization", location="headers")
+        parser.add_argument("ids")
+        params = parser.parse_args()
+
+        if not (params["ids"] and params["Authorization"]):
+            return MissingInformation.get_response()
+        try:
+            ids = [int(i) for i in json.loads(params["ids"])]
+        except (ValueError, TypeError):
+            return MissingInformation.get_response()
+
+        try:
+            userobj = user.User(token=params["Authorization"])
+            result = userobj.follow_many(ids)
+        except BestagramException as e:
+            return e.get_response()
+        return dict(result, success=True), 200
+
+
+class FollowList(Resource):
+    """
+    List of the followers of a user, or of the users it follows (see relation). The users are sorted by id and paginated
+    with a cursor.
+    """
+    relation = None
+
+    def get(self, id):
+        """
+        Headers :
+            - Authorization : Token of the current user.
+        Parameters :
+            - rowCount : Number of users to send.
+            - cursor : nextCursor of the previous page. Not provided for the first page.
+        :return:
+        """
+        parser = reqparse.RequestParser()
+        parser.add_argument("Authorization", location="headers")
+        parser.add_argument("rowCount")
+        parser.add_argument("cursor")
+        params = parser.parse_args()
+
+        if not (params["Authorization"] and params["rowCount"]):
+            return MissingInformation.get_response()
+        try:
+            id = int(id)
+            row_count = min(int(params["rowCount"]), config.FOLLOW_LIST_MAX_ROW_COUNT)
+        except ValueError:
+            return MissingInformation.get_response()
+        try:
+            after = int(params["cursor"]) if params["cursor"] else 0
+        except ValueError:
+            return InvalidCursor.get_response()
+
+        try:
+            userobj = user.User(token=params["Authorization"])
+            if not user.can_access(userobj.id, id):
+                raise ProfileAccessRestricted
+        except BestagramException as e:
+            return e.get_response()
+
+        # The list is sent while it is read from the database, it is never entirely held in memory.
+        return flask.Response(flask.stream_with_context(self.stream(id, after, row_count)),
+                              mimetype="application/json")
+
+    def stream(self, id: int, after: int, row_count: int) -> iter:
+        """
+        Generate the response body, by chunks of config.FOLLOW_LIST_CHUNK_SIZE users.
+        """
+        yield '{"success": true, "result": ['
+        count = 0
+        chunk = []
+        for row in user.follow_list(id, self.relation, after, row_count):
+            chunk.append(json.dumps(row))
+            count += 1
+            after = row["id"]
+            if len(chunk) == config.FOLLOW_LIST_CHUNK_SIZE:
+                yield ("" if count == len(chunk) else ", ") + ", ".join(chunk)
+                chunk = []
+        if chunk:
+            yield ("" if count == len(chunk) else ", ") + ", ".join(chunk)
+        next_cursor = str(after) if row_count > 0 and count == row_count else None
+        yield '], "nextCursor": ' + json.dumps(next_cursor) + "}"
+
+
+class Followers(FollowList):
+    relation = "followers"
+
+
+class Following(FollowList):
+    relation = "following"
@@ -12,19 +12,27 @@ class Search(Resource):
         parser = reqparse.RequestParser()
         parser.add_argument("search")
         parser.add_argument("offset")
+        parser.add_argument("cursor")
         parser.add_argument("rowCount")
         parser.add_argument("Authorization", location="headers")
 
         params = parser.parse_args()
 
         # Search string is optional. User can search with an empty string.
-        if not (params["offset"] and params["rowCount"] and params["Authorization"]):
+        search = params["search"] or ""
+        # Pages are either selected with an offset or with a cursor (empty for the first page).
+        cursor_pagination = params["cursor"] is not None
+        if not ((params["offset"] or cursor_pagination) and params["rowCount"] and params["Authorization"]):
             return MissingInformation.get_response()
         try:
             userobj = user.User(token=params["Authorization"])
+            if cursor_pagination:
+                results, next_cursor = userobj.search_page(search, row_count=int(params["rowCount"]),
+                                                           cursor=params["cursor"])
+                return {"result": results, "nextCursor": next_cursor, "success": True}, 200
         except BestagramException as e:
             return e.get_response()
 
-        results = userobj.search_for(params["search"], offset=int(params["offset"]), row_count=int(params["rowCount"]))
+        results = userobj.search_for(search, offset=int(params["offset"]), row_count=int(params["rowCount"]))
         response = {"result": results, "success": True}
         return response, 200
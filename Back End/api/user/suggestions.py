@@ -0,0 +1,36 @@
+from flask_restful import Resource, reqparse
+import config
+import user
+from errors import *
+
+
+class Suggestions(Resource):
+    """
+    Users the current user may know (see suggestions.py).
+    """
+
+    def get(self):
+        """
+        Headers :
+            - Authorization : Token of the current user.
+        Parameters :
+            - rowCount : Number of users to send.
+        :return:
+        """
+        parser = reqparse.RequestParser()
+        parser.add_argument("Authorization", location="headers")
+        parser.add_argument("rowCount")
+        params = parser.parse_args()
+
+        if not (params["Authorization"] and params["rowCount"]):
+            return MissingInformation.get_response()
+        try:
+            row_count = min(int(params["rowCount"]), config.SUGGESTION_COUNT)
+        except ValueError:
+            return MissingInformation.get_response()
+
+        try:
+            userobj = user.User(token=params["Authorization"])
+        except BestagramException as e:
+            return e.get_response()
+        return {"result": userobj.suggestions(row_count), "success": True}, 200
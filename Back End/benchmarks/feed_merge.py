@@ -0,0 +1,99 @@
+import random
+import sys
+import time
+import database.instrumentation
+import database.mysql_connection
+import timeline
+from database import query
+
+"""
+Feed benchmark. Measures the time to read the first pages of a feed built when it is read, for users following 10, 100
+and 1000 users :
+    - merge : timeline.merged_timeline(), the newest posts of each user followed merged with a heap.
+    - sort : a single query joining Follow and Post, sorted by post_time.
+
+Random users, posts and follows are added to the given database the first time : never run it on the production
+database.
+
+Usage (from the "Back End" directory) :
+    python -m benchmarks.feed_merge <database name> [posts per user]
+"""
+
+FOLLOWING = (10, 100, 1000)
+PAGES = 5
+ROW_COUNT = 20
+REPETITIONS = 20
+INSERT_CHUNK_SIZE = 5000
+
+
+def bench_users(posts_per_user: int) -> ([int], [int]):
+    """
+    Add the users followed and their posts, and one viewer for each number of users followed, unless they exist.
+    :return: Ids of the users followed and ids of the viewers.
+    """
+    names = [f"feed_bench_{i}" for i in range(max(FOLLOWING))] + [f"feed_bench_viewer_{n}" for n in FOLLOWING]
+    existing = query.fetch_all(f"""
+    SELECT id, username FROM UserTable WHERE username IN ({query.placeholders(len(names))});
+    """, names, prepared=False)
+    if len(existing) == len(names):
+        ids = {row["username"]: row["id"] for row in existing}
+        return [ids[name] for name in names[:max(FOLLOWING)]], [ids[name] for name in names[max(FOLLOWING):]]
+
+    ids = []
+    for name in names:
+        ids.append(query.execute("""
+        INSERT INTO UserTable (username, name, email, hash, refresh_token) VALUES (%s, %s, %s, "hash", %s);
+        """, (name, name, f"{name}@bestagram.com", name)).lastrowid)
+    followed, viewers = ids[:max(FOLLOWING)], ids[max(FOLLOWING):]
+
+    start = time.time() - 365 * 24 * 3600
+    posts = [(id, time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(start + random.randrange(365 * 24 * 3600))))
+             for id in followed for _ in range(posts_per_user)]
+    for first in range(0, len(posts), INSERT_CHUNK_SIZE):
+        chunk = posts[first:first + INSERT_CHUNK_SIZE]
+        query.execute(f"""INSERT INTO Post (user_id, post_time) VALUES {", ".join(["(%s, %s)"] * len(chunk))};""",
+                      [value for row in chunk for value in row], prepared=False)
+    for (viewer, count) in zip(viewers, FOLLOWING):
+        query.execute(f"""INSERT INTO Follow (user_id, user_id_followed) VALUES {", ".join(["(%s, %s)"] * count)};""",
+                      [value for id in followed[:count] for value in (viewer, id)], prepared=False)
+    return followed, viewers
+
+
+def sorted_feed(viewer_id: int, row_count: int, before: tuple) -> [dict]:
+    return query.fetch_all("""
+    SELECT Post.id, Post.post_time FROM Follow
+    JOIN Post ON Post.user_id = Follow.user_id_followed
+    WHERE Follow.user_id = %(viewer_id)s
+    AND (Post.post_time < %(post_time)s OR (Post.post_time = %(post_time)s AND Post.id < %(id)s))
+    ORDER BY Post.post_time DESC, Post.id DESC
+    LIMIT %(row_count)s;
+    """, {"viewer_id": viewer_id, "post_time": before[0], "id": before[1], "row_count": row_count})
+
+
+def measure(feed, viewer_id: int) -> (float, float):
+    """
+    :return: Milliseconds and number of queries per page.
+    """
+    queries = 0
+    start = time.perf_counter()
+    for _ in range(REPETITIONS):
+        before = timeline.FEED_START
+        for page in range(PAGES):
+            database.instrumentation.start()
+            rows = feed(viewer_id, ROW_COUNT, before)
+            queries += database.instrumentation.stop().count
+            before = (rows[-1]["post_time"], rows[-1]["id"])
+    pages = REPETITIONS * PAGES
+    return (time.perf_counter() - start) * 1000 / pages, queries / pages
+
+
+if __name__ == "__main__":
+    database.mysql_connection.pool = database.mysql_connection.create_pool(sys.argv[1])
+    _, viewers = bench_users(int(sys.argv[2]) if len(sys.argv) > 2 else 50)
+    print(f"{'following':>9} | {'merge':>20} | {'sort':>20}")
+    for (viewer, count) in zip(viewers, FOLLOWING):
+        merge = measure(timeline.merged_timeline, viewer)
+        sort = measure(sorted_feed, viewer)
+        print(f"{count:>9} | {merge[0]:7.2f} ms {merge[1]:4.1f} queries | {sort[0]:7.2f} ms {sort[1]:4.1f} queries")
+    database.mysql_connection.release_connection()
+    database.mysql_connection.pool.close()
@@ -0,0 +1,51 @@
+import glob
+import io
+import time
+import PIL.Image
+import config
+import images
+
+"""
+Image formats benchmark. Resizes each image of the tests directory to config.IMAGE_DIMENSION and measures the size and
+the encoding time of the image in each format, with the options of images.save() (config.IMAGE_QUALITY) :
+    - PNG : how the images were stored before.
+    - JPEG : baseline and progressive.
+    - WebP and AVIF, when the installed Pillow can write them.
+
+Usage (from the "Back End" directory) :
+    python -m benchmarks.image_formats
+"""
+
+REPETITIONS = 5
+ENCODINGS = (
+    ("PNG", "PNG", {}),
+    ("JPEG", "JPEG", {"quality": config.IMAGE_QUALITY, "optimize": True}),
+    ("JPEG progressive", "JPEG", {"quality": config.IMAGE_QUALITY, "optimize": True, "progressive": True}),
+    ("WebP", "WEBP", {"quality": config.IMAGE_QUALITY}),
+    ("AVIF", "AVIF", {"quality": config.IMAGE_QUALITY}),
+)
+
+
+def measure(image: PIL.Image, format: str, options: dict) -> (float, float):
+    """
+    :return: Size in kilobytes and milliseconds per encoding.
+    """
+    start = time.perf_counter()
+    for _ in range(REPETITIONS):
+        output = io.BytesIO()
+        image.save(output, format=format, **options)
+    return len(output.getvalue()) / 1024, (time.perf_counter() - start) * 1000 / REPETITIONS
+
+
+if __name__ == "__main__":
+    PIL.Image.init()
+    print(f"{'image':>24} | {'format':>16} | {'size':>10} | {'encoding':>10}")
+    for path in sorted(glob.glob("tests/*.png")):
+        with PIL.Image.open(path) as image:
+            resized_image = images.resize_image(image, config.IMAGE_DIMENSION).convert("RGB")
+        for (name, format, options) in ENCODINGS:
+            if format not in PIL.Image.SAVE:
+                print(f"{path:>24} | {name:>16} | {'not available':>23}")
+                continue
+            size, duration = measure(resized_image, format, options)
+            print(f"{path:>24} | {name:>16} | {size:7.1f} KB | {duration:7.2f} ms")
@@ -0,0 +1,48 @@
+import io
+import time
+import PIL.Image
+import config
+import images
+from benchmarks.image_resize import IMAGES, encoded
+
+"""
+Image sizes benchmark. Measures the time to open a test image and resize it to every size of config.IMAGE_SIZES, from
+PNG and from JPEG :
+    - ladder : images.resize_ladder(), one decode, each size resampled from the previous one.
+    - separate : one images.resize_image() of a freshly opened image per size.
+
+Usage (from the "Back End" directory) :
+    python -m benchmarks.image_ladder
+"""
+
+REPETITIONS = 10
+
+
+def ladder(data: bytes):
+    with PIL.Image.open(io.BytesIO(data)) as image:
+        images.resize_ladder(image, config.IMAGE_SIZES)
+
+
+def separate(data: bytes):
+    for size in config.IMAGE_SIZES:
+        with PIL.Image.open(io.BytesIO(data)) as image:
+            images.resize_image(image, size)
+
+
+def measure(resize, data: bytes) -> float:
+    """
+    :return: Milliseconds per image.
+    """
+    start = time.perf_counter()
+    for _ in range(REPETITIONS):
+        resize(data)
+    return (time.perf_counter() - start) * 1000 / REPETITIONS
+
+
+if __name__ == "__main__":
+    print(f"sizes : {config.IMAGE_SIZES}")
+    print(f"{'image':>24} | {'ladder':>10} | {'separate':>10}")
+    for path in IMAGES:
+        for format in ("PNG", "JPEG"):
+            data = encoded(path, format)
+            print(f"{path + ' ' + format:>24} | {measure(ladder, data):7.2f} ms | {measure(separate, data):7.2f} ms")
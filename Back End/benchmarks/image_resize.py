@@ -0,0 +1,69 @@
+import io
+import sys
+import time
+import PIL.Image
+import PIL.ImageChops
+import PIL.ImageStat
+import config
+import images
+
+"""
+Image resizing benchmark. Measures the time to open and resize the test images to config.IMAGE_DIMENSION, from PNG and
+from JPEG (the test images converted in memory) :
+    - crop first : images.resize_image(), only the centered square is resampled.
+    - resize first : the whole image is resampled, then cropped (how images were resized before).
+
+The difference column is the mean difference between the two outputs, on a 0 to 255 scale.
+
+Usage (from the "Back End" directory) :
+    python -m benchmarks.image_resize [length]
+"""
+
+IMAGES = ("tests/3840-2160.png", "tests/1280-1920.png", "tests/474-266.png")
+REPETITIONS = 10
+
+
+def resize_first(image: PIL.Image, length: int) -> PIL.Image:
+    width, height = image.size
+    if width < height:
+        resized_image = image.resize((length, int(height * (length / width))))
+        required_loss = resized_image.size[1] - length
+        return resized_image.crop(box=(0, required_loss / 2, length, resized_image.size[1] - required_loss / 2))
+    resized_image = image.resize((int(width * (length / height)), length))
+    required_loss = resized_image.size[0] - length
+    return resized_image.crop(box=(required_loss / 2, 0, resized_image.size[0] - required_loss / 2, length))
+
+
+def encoded(path: str, format: str) -> bytes:
+    with PIL.Image.open(path) as image:
+        output = io.BytesIO()
+        image.convert("RGB").save(output, format=format)
+        return output.getvalue()
+
+
+def measure(resize, data: bytes, length: int) -> (float, PIL.Image):
+    """
+    :return: Milliseconds per image and the last output.
+    """
+    start = time.perf_counter()
+    for _ in range(REPETITIONS):
+        with PIL.Image.open(io.BytesIO(data)) as image:
+            output = resize(image, length)
+    return (time.perf_counter() - start) * 1000 / REPETITIONS, output
+
+
+def difference(first: PIL.Image, second: PIL.Image) -> float:
+    first, second = first.convert("RGB"), second.convert("RGB")
+    return sum(PIL.ImageStat.Stat(PIL.ImageChops.difference(first, second)).mean) / 3
+
+
+if __name__ == "__main__":
+    length = int(sys.argv[1]) if len(sys.argv) > 1 else config.IMAGE_DIMENSION
+    print(f"{'image':>24} | {'crop first':>10} | {'resize first':>12} | {'difference':>10}")
+    for path in IMAGES:
+        for format in ("PNG", "JPEG"):
+            data = encoded(path, format)
+            crop_first = measure(images.resize_image, data, length)
+            resize_then_crop = measure(resize_first, data, length)
+            print(f"{path + ' ' + format:>24} | {crop_first[0]:7.2f} ms | {resize_then_crop[0]:9.2f} ms | "
+                  f"{difference(crop_first[1], resize_then_crop[1]):10.2f}")
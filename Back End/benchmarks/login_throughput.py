@@ -0,0 +1,85 @@
+import concurrent.futures
+import os
+import sys
+import time
+import config
+import database.mysql_connection
+import hashing
+import main
+from database import query
+
+"""
+Login throughput benchmark. Every login and registration computes one server-side hash, which is what bounds the number
+of logins per second a process can serve. This sends logins to POST /user/login/<username> through the Flask test client
+(hash, token update, response) with 1, 4 and N (number of cores) hashing processes, with enough concurrent clients to
+keep them busy. The inline mode (hashes computed in the request threads) is measured too for comparison.
+
+Users are added to the given database the first time : never run it on the production database.
+
+Usage (from the "Back End" directory) :
+    python -m benchmarks.login_throughput <database name> [number of logins per run]
+"""
+
+USERS = 64
+CLIENT_HASH = "hash"
+
+
+def bench_users() -> [str]:
+    """
+    Add the users logging in, unless they exist.
+    :return: Their usernames.
+    """
+    names = [f"login_bench_{i}" for i in range(USERS)]
+    existing = {row["username"] for row in query.fetch_all(f"""
+    SELECT username FROM UserTable WHERE username IN ({query.placeholders(len(names))});
+    """, names, prepared=False)}
+    for name in names:
+        if name not in existing:
+            query.execute("""
+            INSERT INTO UserTable (username, name, email, hash, refresh_token) VALUES (%s, %s, %s, %s, %s);
+            """, (name, name, f"{name}@bestagram.com", hashing.make_server_side_hash(CLIENT_HASH, name), name))
+    database.mysql_connection.release_connection()
+    return names
+
+
+def login(username: str):
+    response = main.app.test_client().post(f"/user/login/{username}", query_string={"hash": CLIENT_HASH})
+    if response.status_code != 200:
+        raise RuntimeError(f"Login failed : {response.get_json()}")
+
+
+def run(workers: int, usernames: [str], logins: int) -> float:
+    """
+    :param workers: Number of hashing processes, 0 for inline hashing.
+    :param logins: Number of logins to make.
+    :return: Logins per second.
+    """
+    hashing.shutdown()
+    config.HASHING_WORKERS = workers
+    # Clients never get rejected : the benchmark measures throughput, not the queue limit.
+    config.HASHING_QUEUE_SIZE = logins
+    clients = max(workers, 1) * 2
+
+    # Warming up, spawning the processes is not part of the measure.
+    login(usernames[0])
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=clients) as threads:
+        list(threads.map(lambda i: login(usernames[i % len(usernames)]), range(logins)))
+    elapsed = time.perf_counter() - start
+    hashing.shutdown()
+    return logins / elapsed
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        sys.exit("Usage : python -m benchmarks.login_throughput <database name> [number of logins per run]")
+    logins = int(sys.argv[2]) if len(sys.argv) > 2 else 400
+    database.mysql_connection.pool = database.mysql_connection.create_pool(sys.argv[1])
+    usernames = bench_users()
+    cores = os.cpu_count() or 1
+    print(f"{logins} logins per run, {cores} cores available.")
+    for workers in (0, 1, 4, cores):
+        label = "inline" if workers == 0 else f"{workers} process" + ("es" if workers > 1 else "")
+        print(f"{label:>14} : {run(workers, usernames, logins):8.1f} logins/s")
+    database.mysql_connection.pool.close()
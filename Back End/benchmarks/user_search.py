@@ -0,0 +1,110 @@
+import random
+import sys
+import time
+import config
+import database.mysql_connection
+import search_cache
+import search_index
+import user
+from database import query
+
+"""
+User search benchmark. Measures the number of typeahead searches per second answered by the in-memory search index and
+by the SQL search (LIKE "%a%b%c%" on UserTable). The SQL search is measured without and with the typeahead cache (see
+search_cache.py), which answers most of the prefixes typed after the first one without a query.
+
+Without argument only the index is measured, on randomly generated users. With a database name the users of that
+database are searched with both. If it holds fewer users than asked, random users are added to it first : never run it
+on the production database.
+
+Usage (from the "Back End" directory) :
+    python -m benchmarks.user_search [database name] [number of users]
+"""
+
+LETTERS = "abcdefghijklmnopqrstuvwxyz "
+INSERT_CHUNK_SIZE = 5000
+
+
+def random_user(id: int) -> dict:
+    name = "".join(random.choice(LETTERS) for _ in range(random.randint(5, 20))).strip() or "a"
+    return {"id": id, "username": f"user{id}", "name": name, "follower_count": int(random.paretovariate(1.2)) - 1}
+
+
+def typeahead_searches(names: [str], count: int) -> [str]:
+    """
+    Searches typed by a user looking for an existing name : each prefix of the beginning of the name.
+    """
+    searches = []
+    while len(searches) < count:
+        name = random.choice(names).replace(" ", "")
+        searches += [name[:length] for length in range(1, min(len(name), 6) + 1)]
+    return searches[:count]
+
+
+def populate(users: int):
+    """
+    Add random users to the database until it holds the given number of users.
+    """
+    existing = query.fetch_one("SELECT COUNT(*) AS count FROM UserTable;")["count"]
+    for first in range(existing, users, INSERT_CHUNK_SIZE):
+        rows = [random_user(id) for id in range(first, min(first + INSERT_CHUNK_SIZE, users))]
+        values = ", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(rows))
+        params = []
+        for row in rows:
+            # refresh_token is unique and has no default.
+            params += [row["username"], row["name"], f"{row['username']}@bestagram.com", "hash", row["username"],
+                       row["follower_count"]]
+        query.execute(f"""
+        INSERT INTO UserTable (username, name, email, hash, refresh_token, follower_count) VALUES {values};
+        """, params, prepared=False)
+
+
+def measure(viewer: user.User, searches: [str], index: bool, cache: bool = False) -> float:
+    """
+    :param cache: Answer the SQL searches from the typeahead cache when possible. The index never uses it.
+    :return: Searches per second.
+    """
+    config.SEARCH_INDEX_ENABLED = index
+    candidates = config.SEARCH_CACHE_CANDIDATES
+    if not cache:
+        config.SEARCH_CACHE_CANDIDATES = 0
+    search_cache.searches.clear()
+    try:
+        start = time.perf_counter()
+        for search in searches:
+            viewer.search_for(search, offset=0, row_count=10)
+        return len(searches) / (time.perf_counter() - start)
+    finally:
+        config.SEARCH_CACHE_CANDIDATES = candidates
+
+
+if __name__ == "__main__":
+    users = int(sys.argv[2]) if len(sys.argv) > 2 else 1000000
+    viewer = user.User.__new__(user.User)
+    viewer.id = 0
+
+    if len(sys.argv) > 1:
+        database.mysql_connection.pool = database.mysql_connection.create_pool(sys.argv[1])
+        populate(users)
+        start = time.perf_counter()
+        search_index.index.load()
+    else:
+        # The index doesn't need the database, only the list of the users followed by the viewer does.
+        rows = [random_user(id) for id in range(1, users + 1)]
+        start = time.perf_counter()
+        search_index.index.replace(rows)
+    print(f"{len(search_index.index)} users indexed in {time.perf_counter() - start:.1f} s.")
+
+    names = list(search_index.index._names.values())
+    searches = typeahead_searches(names, 1000)
+    if len(sys.argv) > 1:
+        print(f"{'SQL':>12} : {measure(viewer, searches[:100], index=False):8.1f} searches/s")
+        print(f"{'SQL + cache':>12} : {measure(viewer, searches[:100], index=False, cache=True):8.1f} searches/s")
+        print(f"{'index':>12} : {measure(viewer, searches, index=True):8.1f} searches/s")
+        database.mysql_connection.release_connection()
+        database.mysql_connection.pool.close()
+    else:
+        start = time.perf_counter()
+        for search in searches:
+            search_index.index.search(search, id=viewer.id, followed=set(), offset=0, row_count=10)
+        print(f"{'index':>12} : {len(searches) / (time.perf_counter() - start):8.1f} searches/s")
@@ -0,0 +1,125 @@
+import collections
+import threading
+import time
+
+
+class LRUCache:
+    """
+    Thread-safe in-memory cache. When it is full the least recently used entry is evicted. Entries can also expire after
+    a given number of seconds.
+
+    The cache can also be limited by the total weight of its entries (e.g. their size in bytes) : the least recently used
+    entries are evicted until the weight fits.
+    """
+
+    def __init__(self, max_size: int, ttl: float = None, max_weight: int = None, weigher=None):
+        """
+        :param max_size: Maximum number of entries.
+        :param ttl: Default number of seconds after which an entry expires. None means entries never expire.
+        :param max_weight: Maximum total weight of the entries. None means no limit.
+        :param weigher: Function taking a value and returning its weight. Values weigh 1 by default.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_weight = max_weight
+        self._weigher = weigher
+        # Key -> (value, expiration time, weight). Most recently used last.
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.weight = 0
+
+    def get(self, key, default=None):
+        """
+        Return the value cached for this key, or default if there is none (or it expired).
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expiration, weight = entry
+            if expiration is not None and expiration <= time.monotonic():
+                del self._entries[key]
+                self.weight -= weight
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, ttl: float = None):
+        """
+        Cache a value. A value heavier than the maximum weight is not cached.
+        :param ttl: Number of seconds after which this entry expires. Defaults to the ttl of the cache.
+        """
+        if ttl is None:
+            ttl = self.ttl
+        expiration = time.monotonic() + ttl if ttl is not None else None
+        weight = self._weigher(value) if self._weigher else 1
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.weight -= previous[2]
+            if self.max_weight is not None and weight > self.max_weight:
+                return
+            self._entries[key] = (value, expiration, weight)
+            self.weight += weight
+            while len(self._entries) > self.max_size or (self.max_weight is not None and self.weight > self.max_weight):
+                self.weight -= self._entries.popitem(last=False)[1][2]
+
+    def pop(self, key, default=None):
+        """
+        Remove an entry and return its value.
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.weight -= entry[2]
+        if entry is None:
+            return default
+        return entry[0]
+
+    def discard_if(self, predicate):
+        """
+        Remove every entry whose value matches the predicate.
+        :param predicate: Function taking a value and returning True if it must be removed.
+        """
+        with self._lock:
+            keys = [key for (key, (value, _, _)) in self._entries.items() if predicate(value)]
+            for key in keys:
+                self.weight -= self._entries.pop(key)[2]
+
+    def discard_keys_if(self, predicate):
+        """
+        Remove every entry whose key matches the predicate.
+        :param predicate: Function taking a key and returning True if it must be removed.
+        """
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                self.weight -= self._entries.pop(key)[2]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.weight = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def stats(self) -> dict:
+        """
+        Usage statistics : number of entries, total weight, hits, misses and hit ratio.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "weight": self.weight,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0
+            }
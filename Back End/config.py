@@ -24,4 +24,218 @@ IMAGE_DIMENSION = 1080
 """
 Dimension to resize the images to when an upload is made.
 """
+IMAGE_SIZES = (IMAGE_DIMENSION, 640, 320, 150)
+"""
+Sizes the images posted are stored in, largest first (see images.resize_ladder()). Each one is resampled from the
+previous one. Clients ask for a size, they get the smallest one at least as big.
+"""
+IMAGE_FORMATS = ("WEBP",)
+"""
+Formats the images are stored in on top of JPEG (PNG for images with transparent pixels), which every client can read.
+Clients get the first of them they accept. "AVIF" can be added first : it needs a Pillow built with libavif (it is
+skipped otherwise) and encodes about 10 times slower than WebP (see benchmarks/image_formats.py).
+"""
+IMAGE_QUALITY = 80
+"""
+Quality of the JPEG, WebP and AVIF images, from 0 to 100.
+"""
+IMAGE_PROGRESSIVE_JPEG = True
+"""
+Write progressive JPEG images : a blurry version of the image shows up before the whole image is downloaded.
+"""
+MEDIA_X_SENDFILE = False
+"""
+Let the web server in front of the api send the image files : responses only carry their path in the X-Sendfile
+header. The server must support it (e.g. mod_xsendfile). Otherwise the files are handed to the WSGI server, which can
+use sendfile() too (wsgi.file_wrapper).
+"""
+MEDIA_WORKERS = 2
+"""
+Number of threads resizing and encoding the images posted (see media_pipeline.py). 0 processes them in the request
+creating the post.
+"""
+MEDIA_PROCESSING_TIMEOUT = 3600
+"""
+Number of seconds after which a post still being processed is considered lost (the process handling it stopped) : when
+the api starts, such posts are marked as failed and the uploads spooled that long ago are removed.
+"""
 PROFILE_PICTURE_DIMENSION = 150
+PROFILE_PICTURE_SIZES = (PROFILE_PICTURE_DIMENSION, 75)
+"""
+Sizes the profile pictures are stored in, largest first. Same as IMAGE_SIZES.
+"""
+PROFILE_PICTURE_MAX_AGE = 365 * 24 * 3600
+"""
+Number of seconds clients and CDNs keep a version of a profile picture (see profile.picture_route()). A version never
+changes, a new picture gets a new version.
+"""
+PROFILE_PICTURE_CACHE_BYTES = 64 * 1024 * 1024
+"""
+Maximum number of bytes of profile pictures kept in memory by each process (see profile.pictures). The default picture
+is loaded once and shared, it isn't counted.
+"""
+PROFILE_PICTURE_CACHE_SIZE = 100000
+"""
+Maximum number of profile pictures kept in memory by each process.
+"""
+
+DATABASE_POOL_SIZE = 10
+"""
+Maximum number of connections to the database opened at the same time by one process. This is also the maximum number
+of requests running a query at the same time.
+"""
+DATABASE_POOL_TIMEOUT = 5
+"""
+Number of seconds a request waits for a free connection before failing with a ServerBusy error.
+"""
+DATABASE_POOL_HEALTH_CHECK_INTERVAL = 60
+"""
+Number of seconds a connection can stay unused before it is pinged (and reconnected if needed) when checked out.
+"""
+PREPARED_STATEMENT_CACHE_SIZE = 64
+"""
+Number of server-side prepared statements kept open on each database connection. The least recently used one is
+closed when a new statement needs to be prepared.
+"""
+
+SQL_QUERY_COUNT_BUDGET = 15
+"""
+Number of queries a request can execute before it is logged as too expensive.
+"""
+SQL_TIME_BUDGET = 0.1
+"""
+Number of seconds a request can spend in the database before it is logged as too slow.
+"""
+SQL_N_PLUS_ONE_THRESHOLD = 3
+"""
+Number of times the same query can be executed in one request before it is reported as an N+1 pattern.
+"""
+
+SESSION_CACHE_SIZE = 10000
+"""
+Maximum number of sessions (token -> user) kept in memory by each process.
+"""
+SESSION_CACHE_TTL = 60
+"""
+Number of seconds a session stays cached. A token invalidated by another process (or directly in the database) can
+still be accepted by this process for that long.
+"""
+
+HASHING_WORKERS = None
+"""
+Number of processes computing the server-side password hashes. None uses one process per core, 0 computes the hashes
+in the request thread.
+"""
+HASHING_QUEUE_SIZE = 32
+"""
+Number of hashes that can wait for a free hashing process. Logins and registrations coming when the queue is full are
+rejected with a ServerBusy error instead of piling up.
+"""
+
+SEARCH_INDEX_ENABLED = False
+"""
+Answer the user searches from an index kept in memory (see search_index.py) instead of scanning UserTable. The index is
+loaded when the api starts and only sees the changes made through the api of this process.
+"""
+SEARCH_INDEX_RERANK_INTERVAL = 60
+"""
+Number of seconds between two sorts of the search index. New follower counts only change the ranking of the results
+after the next sort.
+"""
+SEARCH_INDEX_LOAD_CHUNK_SIZE = 10000
+"""
+Number of users fetched per query when loading the search index.
+"""
+
+SEARCH_CACHE_SIZE = 10000
+"""
+Maximum number of users whose last searches are kept in memory by each process (see search_cache.py).
+"""
+SEARCH_CACHE_SEARCHES = 4
+"""
+Number of searches kept for each user. The next search typed is answered from one of them when it extends it.
+"""
+SEARCH_CACHE_CANDIDATES = 200
+"""
+Number of results kept for each search. Pages going deeper than that are not cached. 0 disables the cache.
+"""
+SEARCH_CACHE_TTL = 30
+"""
+Number of seconds the searches of a user stay cached. New users, new names and new follower counts show up in the
+results of a cached search after that.
+"""
+
+MAX_FOLLOW_BATCH_SIZE = 500
+"""
+Maximum number of users that can be followed in one request to the batch follow endpoint.
+"""
+
+SOCIAL_GRAPH_ENABLED = False
+"""
+Answer "does this user follow that one" and "who does this user follow" from a copy of the Follow table kept in memory
+(see social_graph.py). The graph is loaded when the api starts and only sees the follows made through the api of this
+process.
+"""
+SOCIAL_GRAPH_LOAD_CHUNK_SIZE = 100000
+"""
+Number of follow relations fetched per query when loading the social graph.
+"""
+SOCIAL_GRAPH_COMPACTION_THRESHOLD = 100000
+"""
+Number of follow relations added since the social graph was built from which they are merged into its arrays.
+"""
+
+FOLLOW_LIST_MAX_ROW_COUNT = 100000
+"""
+Maximum number of users sent in one page of a followers / following list.
+"""
+FOLLOW_LIST_CHUNK_SIZE = 500
+"""
+Number of users fetched per query while a page of a followers / following list is sent.
+"""
+
+SUGGESTION_COUNT = 30
+"""
+Number of follow suggestions computed and kept for each user (see suggestions.py). Also the maximum number of
+suggestions sent by the api.
+"""
+SUGGESTION_CHUNK_SIZE = 1000
+"""
+Number of users whose suggestions are computed and written together by the suggestion job.
+"""
+SUGGESTION_PROCESSES = None
+"""
+Number of processes computing the suggestions in parallel. None starts one per core.
+"""
+
+TIMELINE_FAN_OUT_MAX_FOLLOWERS = 10000
+"""
+Number of followers from which the posts of a user are no longer written into the timelines of its followers but merged
+into their feeds when they are read (see timeline.py).
+"""
+TIMELINE_FAN_OUT_BATCH_SIZE = 1000
+"""
+Number of timelines a post is written into per statement.
+"""
+TIMELINE_FOLLOW_POST_COUNT = 100
+"""
+Number of the newest posts of a user written into the timeline of a user who starts following it.
+"""
+TIMELINE_FAN_OUT_WORKERS = 2
+"""
+Number of threads writing new posts into the timelines. Each of them uses a connection of the pool while it works. 0
+writes them in the request creating the post.
+"""
+FEED_MAX_ROW_COUNT = 100
+"""
+Maximum number of posts sent in one page of the feed.
+"""
+FEED_MERGE_MAX_FOLLOWING = 0
+"""
+Users following at most this number of users get their feed built when it is read, by merging the newest posts of the
+users they follow, instead of reading their timeline (see timeline.merged_timeline()). 0 always reads the timelines.
+"""
+FEED_MERGE_BATCH_SIZE = 10
+"""
+Number of posts of each user followed fetched at once when a feed is built when it is read.
+"""
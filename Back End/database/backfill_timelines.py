@@ -0,0 +1,57 @@
+import sys
+import config
+import database.mysql_connection
+from database import query
+
+"""
+Write the existing posts into the timelines (see timeline.py). New posts are written by the api when they are created,
+this is only needed for the posts created before the Timeline table existed, or whose fan-out failed. Posts already in a
+timeline are skipped, so it can be run again safely.
+
+Usage (from the "Back End" directory) :
+    python -m database.backfill_timelines [database name]
+"""
+
+CHUNK_SIZE = 1000
+"""
+Number of posts written per statement. Keeps each INSERT short so it doesn't lock the tables for long.
+"""
+
+
+def backfill() -> int:
+    """
+    Write every post whose image is processed into the timeline of its poster and, unless it has too many followers, of its followers.
+    :return: Number of rows added to Timeline.
+    """
+    last_id = query.fetch_one("SELECT MAX(id) AS last_id FROM Post;")["last_id"] or 0
+    added = 0
+    for first in range(1, last_id + 1, CHUNK_SIZE):
+        params = {"first": first, "last": first + CHUNK_SIZE - 1,
+                  "max_followers": config.TIMELINE_FAN_OUT_MAX_FOLLOWERS}
+        with query.transaction():
+            added += query.execute("""
+            INSERT IGNORE INTO Timeline (viewer_id, post_time, post_id)
+            SELECT user_id, post_time, id FROM Post
+            WHERE id BETWEEN %(first)s AND %(last)s AND status = 'ready';
+            """, params).rowcount
+            added += query.execute("""
+            INSERT IGNORE INTO Timeline (viewer_id, post_time, post_id)
+            SELECT Follow.user_id, Post.post_time, Post.id FROM Post
+            JOIN UserTable ON UserTable.id = Post.user_id
+            JOIN Follow ON Follow.user_id_followed = Post.user_id
+            WHERE Post.id BETWEEN %(first)s AND %(last)s AND Post.status = 'ready'
+            AND UserTable.follower_count < %(max_followers)s;
+            """, params).rowcount
+    return added
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        database.mysql_connection.pool = database.mysql_connection.create_pool(sys.argv[1])
+    else:
+        database.mysql_connection.pool = database.mysql_connection.create_pool()
+    try:
+        print(f"{backfill()} timeline row(s) added.")
+    finally:
+        database.mysql_connection.release_connection()
+        database.mysql_connection.pool.close()
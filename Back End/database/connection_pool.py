@@ -0,0 +1,191 @@
+import collections
+import queue
+import threading
+import time
+import mysql.connector
+import errors
+
+
+class PooledConnection:
+    """
+    A connection owned by the pool. Keeps track of when it was last handed out so the pool knows when it needs to be
+    health checked again.
+    """
+
+    def __init__(self, cnx: mysql.connector.MySQLConnection):
+        self.cnx = cnx
+        self.last_checked = time.monotonic()
+        # Prepared statements of this connection, most recently used last. Managed by database/query.py.
+        self.statements = collections.OrderedDict()
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of MySQL connections.
+
+    Each request checks a connection out of the pool and gives it back when it is done with it (see
+    database/mysql_connection.py). Connections are only opened when they are first needed, so creating the pool never
+    touches the database. When a connection has been idle for longer than health_check_interval seconds it is pinged
+    before being handed out, and replaced by a fresh one if the server doesn't answer.
+    """
+
+    def __init__(self, user: str, password: str, host: str, database: str, size: int = 10, timeout: float = 5,
+                 health_check_interval: float = 60):
+        """
+        :param user: Database user name.
+        :param password: Database password.
+        :param host: Database host.
+        :param database: Name of the database to use.
+        :param size: Maximum number of connections opened at the same time.
+        :param timeout: Number of seconds to wait for a connection when all of them are in use.
+        :param health_check_interval: Number of seconds a connection can stay idle before being pinged again.
+        """
+        self._connection_arguments = dict(user=user, password=password, host=host, database=database, use_pure=True)
+        self.size = size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+
+        self._idle = queue.LifoQueue()  # Most recently used connections are the most likely to still be alive.
+        self._lock = threading.Lock()
+        self._opened = 0
+
+        # Statistics.
+        self._in_use = 0
+        self._checkouts = 0
+        self._exhausted = 0
+        self._reconnects = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    def _connect(self) -> PooledConnection:
+        cnx = mysql.connector.connect(**self._connection_arguments)
+        cnx.autocommit = True
+        return PooledConnection(cnx)
+
+    def _healthy(self, connection: PooledConnection) -> bool:
+        if time.monotonic() - connection.last_checked < self.health_check_interval:
+            return True
+        try:
+            # is_connected() pings the server.
+            return connection.cnx.is_connected()
+        except mysql.connector.Error:
+            return False
+
+    def acquire(self) -> PooledConnection:
+        """
+        Check a connection out of the pool. Waits for another thread to release one if they are all in use.
+
+        :raise ServerBusy: When no connection was released before the timeout.
+        :return: The connection, it must be given back with release().
+        """
+        start = time.monotonic()
+        connection = None
+        try:
+            connection = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                can_open = self._opened < self.size
+                if can_open:
+                    self._opened += 1
+            if not can_open:
+                with self._lock:
+                    self._exhausted += 1
+                try:
+                    connection = self._idle.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise errors.ServerBusy
+        if connection is None:
+            try:
+                connection = self._connect()
+            except Exception:
+                with self._lock:
+                    self._opened -= 1
+                raise
+        elif not self._healthy(connection):
+            connection = self._reconnect(connection)
+
+        wait = time.monotonic() - start
+        with self._lock:
+            self._in_use += 1
+            self._checkouts += 1
+            self._total_wait += wait
+            self._max_wait = max(self._max_wait, wait)
+        return connection
+
+    def _reconnect(self, connection: PooledConnection) -> PooledConnection:
+        """
+        Replace a dead connection by a new one. A new connection object is created (instead of reconnecting the old
+        one) so nothing tied to the old session survives.
+        """
+        try:
+            connection.cnx.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._reconnects += 1
+        try:
+            return self._connect()
+        except Exception:
+            with self._lock:
+                self._opened -= 1
+            raise
+
+    def release(self, connection: PooledConnection):
+        """
+        Give a connection back to the pool.
+        """
+        try:
+            if connection.cnx.in_transaction:
+                # Something went wrong in the middle of a transaction, it must not leak to the next user.
+                connection.cnx.rollback()
+            if connection.cnx.unread_result:
+                connection.cnx.get_rows()
+        except Exception:
+            # Forces a health check on next checkout.
+            connection.last_checked = float("-inf")
+        else:
+            connection.last_checked = time.monotonic()
+        with self._lock:
+            self._in_use -= 1
+        self._idle.put(connection)
+
+    def close(self):
+        """
+        Close every idle connection.
+        """
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            with self._lock:
+                self._opened -= 1
+            try:
+                connection.cnx.close()
+            except Exception:
+                pass
+
+    @property
+    def stats(self) -> dict:
+        """
+        Usage statistics of the pool :
+            size : Maximum number of connections.
+            opened : Number of connections currently opened.
+            in_use : Number of connections currently checked out.
+            checkouts : Number of times a connection was checked out.
+            exhausted : Number of checkouts that had to wait because every connection was in use.
+            reconnects : Number of dead connections that were replaced.
+            total_wait : Total number of seconds spent waiting for a connection.
+            max_wait : Longest wait for a connection, in seconds.
+        """
+        with self._lock:
+            return {
+                "size": self.size,
+                "opened": self._opened,
+                "in_use": self._in_use,
+                "checkouts": self._checkouts,
+                "exhausted": self._exhausted,
+                "reconnects": self._reconnects,
+                "total_wait": self._total_wait,
+                "max_wait": self._max_wait
+            }
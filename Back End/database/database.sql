@@ -14,6 +14,10 @@ CREATE TABLE UserTable(
     token_registration_date DATETIME,
     caption VARCHAR(1000),
     use_default_picture BOOLEAN DEFAULT TRUE,
+    picture_version INT NOT NULL DEFAULT 0,
+    follower_count BIGINT NOT NULL DEFAULT 0,
+    following_count BIGINT NOT NULL DEFAULT 0,
+    post_count BIGINT NOT NULL DEFAULT 0,
     PRIMARY KEY (id)
 )
 ENGINE=INNODB;
@@ -29,6 +33,8 @@ CREATE TABLE Post(
     user_id BIGINT NOT NULL,
     post_time DATETIME NOT NULL,
     caption VARCHAR(2200),
+    like_count BIGINT NOT NULL DEFAULT 0,
+    status ENUM('processing', 'ready', 'failed') NOT NULL DEFAULT 'ready',
     PRIMARY KEY(id)
 )
 ENGINE=INNODB;
@@ -47,6 +53,23 @@ CREATE TABLE Tag(
 )
 ENGINE=INNODB;
 
+CREATE TABLE Timeline(
+    viewer_id BIGINT NOT NULL,
+    post_time DATETIME NOT NULL,
+    post_id BIGINT NOT NULL,
+    PRIMARY KEY (viewer_id, post_time, post_id)
+)
+ENGINE=INNODB;
+
+CREATE TABLE Suggestion(
+    user_id BIGINT NOT NULL,
+    position SMALLINT NOT NULL,
+    user_id_suggested BIGINT NOT NULL,
+    score INT NOT NULL,
+    PRIMARY KEY (user_id, position)
+)
+ENGINE=INNODB;
+
 -- Indexes
 ALTER TABLE UserTable
 ADD UNIQUE ind_username (username);
@@ -57,6 +80,10 @@ ADD UNIQUE ind_email (email);
 ALTER TABLE UserTable
 ADD INDEX ind_name (name);
 
+-- Search results are sorted by follower count then name, paginated searches start from a position in this index.
+ALTER TABLE UserTable
+ADD INDEX ind_follower_count_name (follower_count DESC, name);
+
 ALTER TABLE UserTable
 ADD UNIQUE ind_token (token);
 
@@ -72,8 +99,10 @@ ADD INDEX ind_user_id (user_id);
 ALTER TABLE LikeTable
 ADD INDEX ind_post_id (post_id);
 
+-- Secondary indexes of InnoDB tables end with the primary key : ind_user_id_followed is sorted by (user_id_followed,
+-- user_id), so the followers of a user can be paginated by id from the index.
 ALTER TABLE Follow
-ADD UNIQUE ind_user_id_user_id_followed (user_id, user_id_followed);
+ADD PRIMARY KEY (user_id, user_id_followed);
 
 ALTER TABLE Follow
 ADD INDEX ind_user_id (user_id);
@@ -81,8 +110,14 @@ ADD INDEX ind_user_id (user_id);
 ALTER TABLE Follow
 ADD INDEX ind_user_id_followed (user_id_followed);
 
+-- The posts of a user are read newest first (feeds merged at read time), ind_user_id_post_time is sorted by
+-- (user_id, post_time, id).
 ALTER TABLE Post
-ADD INDEX ind_user_id (user_id);
+ADD INDEX ind_user_id_post_time (user_id, post_time);
+
+-- Few posts are being processed at a time, the startup sweep of media_pipeline.py finds them without reading every post.
+ALTER TABLE Post
+ADD INDEX ind_status (status);
 
 ALTER TABLE Tag
 ADD INDEX ind_user_id (user_id);
@@ -90,6 +125,12 @@ ADD INDEX ind_user_id (user_id);
 ALTER TABLE Tag
 ADD INDEX ind_post_id (post_id);
 
+ALTER TABLE Suggestion
+ADD INDEX ind_user_id_suggested (user_id_suggested);
+
+ALTER TABLE Timeline
+ADD INDEX ind_post_id (post_id);
+
 -- Foreign Keys
 
 ALTER TABLE LikeTable
@@ -112,3 +153,15 @@ ADD CONSTRAINT fk_Tag_user_id_id FOREIGN KEY (user_id) REFERENCES UserTable(id);
 
 ALTER TABLE Tag
 ADD CONSTRAINT fk_Tag_post_id_id FOREIGN KEY (post_id) REFERENCES Post(id);
+
+ALTER TABLE Suggestion
+ADD CONSTRAINT fk_Suggestion_user_id_id FOREIGN KEY (user_id) REFERENCES UserTable(id);
+
+ALTER TABLE Suggestion
+ADD CONSTRAINT fk_Suggestion_user_id_suggested_id FOREIGN KEY (user_id_suggested) REFERENCES UserTable(id);
+
+ALTER TABLE Timeline
+ADD CONSTRAINT fk_Timeline_viewer_id_id FOREIGN KEY (viewer_id) REFERENCES UserTable(id);
+
+ALTER TABLE Timeline
+ADD CONSTRAINT fk_Timeline_post_id_id FOREIGN KEY (post_id) REFERENCES Post(id);
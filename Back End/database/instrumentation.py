@@ -0,0 +1,105 @@
+import collections
+import functools
+import re
+import threading
+
+"""
+Records the statements executed while a request is processed. main.py starts a recording before each request and reads
+the summary once the response is ready. Statements executed outside of a recording (tests, commands...) are not
+recorded.
+"""
+
+_local = threading.local()
+
+_WHITESPACES = re.compile(r"\s+")
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAMETER = re.compile(r"%\(\w+\)s|%s")
+_VALUE_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))*")
+
+Statement = collections.namedtuple("Statement", ["text", "duration", "rows"])
+"""
+A statement executed during a request. Text is the normalized statement, duration is in seconds.
+"""
+
+
+@functools.lru_cache(maxsize=1024)
+def normalize(statement: str) -> str:
+    """
+    Normalize a statement so two executions of the same query with different values give the same text. Literals and
+    parameters are replaced by "?" and lists of values (IN lists, multi-row VALUES...) by "(?+)".
+    """
+    text = _STRING_LITERAL.sub("?", statement)
+    text = _NUMBER_LITERAL.sub("?", text)
+    text = _PARAMETER.sub("?", text)
+    text = _VALUE_LIST.sub("(?+)", text)
+    return _WHITESPACES.sub(" ", text).strip().rstrip(";")
+
+
+class Recording:
+    """
+    Statements executed during one request.
+    """
+
+    def __init__(self):
+        self.statements: [Statement] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    @property
+    def duration(self) -> float:
+        """
+        Time spent in the database in seconds.
+        """
+        return sum(statement.duration for statement in self.statements)
+
+    def repeated(self, threshold: int) -> dict:
+        """
+        Statements executed at least threshold times. Executing the same query over and over in a request usually
+        means it is run once per item of a list (N+1 pattern) and should be batched.
+        :return: Dictionary mapping the normalized statement to the number of executions.
+        """
+        counter = collections.Counter(statement.text for statement in self.statements)
+        return {text: count for (text, count) in counter.items() if count >= threshold}
+
+    def summary(self, threshold: int) -> dict:
+        """
+        :param threshold: Number of executions of a statement from which it is reported as an N+1 pattern.
+        """
+        return {
+            "count": self.count,
+            "duration": self.duration,
+            "rows": sum(statement.rows for statement in self.statements),
+            "n_plus_one": self.repeated(threshold)
+        }
+
+
+def start():
+    """
+    Start recording the statements executed by the current thread.
+    """
+    _local.recording = Recording()
+
+
+def stop() -> Recording:
+    """
+    Stop the recording of the current thread.
+    :return: The recording, None if nothing was being recorded.
+    """
+    recording = getattr(_local, "recording", None)
+    _local.recording = None
+    return recording
+
+
+def record(statement: str, duration: float, rows: int):
+    """
+    Add an executed statement to the recording of the current thread, if any.
+    :param statement: The statement as sent to the database.
+    :param duration: Execution time in seconds.
+    :param rows: Number of rows returned or affected.
+    """
+    recording = getattr(_local, "recording", None)
+    if recording is not None:
+        recording.statements.append(Statement(normalize(statement), duration, max(rows, 0)))
@@ -1,10 +1,64 @@
+import threading
 import config
 import mysql.connector
+import database.connection_credentials
+from database.connection_pool import ConnectionPool, PooledConnection
 
 """
-This variable is the connection to the database. It is not defined here as its content depends on the context.
+This variable is the pool of connections to the database. It is not defined here as its content depends on the context.
 If what is running is the production version (main.py) then it is defined in main.py.
 If what is running is tests then it is defined in tests/tests.py pointing to the test database.
 This enable testing without altering the production database.
 """
-cnx : mysql.connector.MySQLConnection = None
+pool: ConnectionPool = None
+
+# Connection checked out by the current thread (i.e. the current request).
+_local = threading.local()
+
+
+def create_pool(database_name: str = database.connection_credentials.databaseName) -> ConnectionPool:
+    """
+    Create a pool using the credentials in connection_credentials.py and the settings in config.py.
+    :param database_name: Name of the database the connections point to.
+    """
+    return ConnectionPool(
+        user=database.connection_credentials.databaseUserName,
+        password=database.connection_credentials.password,
+        host=database.connection_credentials.host,
+        database=database_name,
+        size=config.DATABASE_POOL_SIZE,
+        timeout=config.DATABASE_POOL_TIMEOUT,
+        health_check_interval=config.DATABASE_POOL_HEALTH_CHECK_INTERVAL)
+
+
+def get_pooled_connection() -> PooledConnection:
+    """
+    Return the connection of the current thread. The first call checks a connection out of the pool, the next ones
+    return the same connection until release_connection() is called. Flask calls it at the end of every request.
+
+    :raise ServerBusy: When every connection of the pool is in use.
+    """
+    connection = getattr(_local, "connection", None)
+    if connection is None:
+        connection = pool.acquire()
+        _local.connection = connection
+        _local.pool = pool
+    return connection
+
+
+def get_connection() -> mysql.connector.MySQLConnection:
+    """
+    Same as get_pooled_connection() but return the underlying MySQL connection.
+    """
+    return get_pooled_connection().cnx
+
+
+def release_connection():
+    """
+    Give the connection of the current thread back to the pool. Does nothing if this thread has no connection.
+    """
+    connection = getattr(_local, "connection", None)
+    if connection is None:
+        return
+    _local.connection = None
+    _local.pool.release(connection)
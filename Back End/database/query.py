@@ -0,0 +1,187 @@
+import collections
+import contextlib
+import functools
+import re
+import time
+import mysql.connector.cursor
+import mysql.connector.version
+import config
+import database.mysql_connection
+from database import instrumentation
+
+"""
+Every query sent to the database goes through this module. Values are never formatted into the SQL string, they are
+sent as parameters instead. Parameters can either be positional (%s and a tuple) or named (%(name)s and a dictionary).
+
+By default statements are sent as server-side prepared statements : MySQL parses and plans them once per connection and
+each following execution only sends the parameters. The prepared statements are kept in a LRU cache on each connection
+(see config.PREPARED_STATEMENT_CACHE_SIZE).
+Statements whose text changes from one call to the other (e.g. an IN list with a variable number of values) should be
+sent with prepared=False so they don't evict the hot statements from the cache.
+"""
+
+Result = collections.namedtuple("Result", ["rowcount", "lastrowid"])
+"""
+Result of a statement that doesn't return rows.
+"""
+
+_NAMED_PARAMETER = re.compile(r"%\((\w+)\)s")
+
+_SKIP_STATEMENT_RESET = (8, 0, 22) <= tuple(mysql.connector.version.VERSION[:3]) < (8, 1, 0)
+"""
+_PreparedCursor relies on private attributes of the connector's prepared cursor, only checked with the 8.0 versions of
+mysql-connector-python (see requirements.txt). Other versions use the stock execute(), with its extra round trip.
+"""
+
+
+class _PreparedCursor(mysql.connector.cursor.MySQLCursorPrepared):
+    """
+    Prepared cursor which doesn't send COM_STMT_RESET before each execution. That command only clears parameters sent
+    as long data, which this module never does, and it costs a round trip to the server.
+    """
+
+    def execute(self, operation, params=(), multi=False):
+        if not _SKIP_STATEMENT_RESET or operation is not self._executed or not self._prepared:
+            # First execution, let the connector prepare the statement.
+            return super().execute(operation, params)
+
+        if len(self._prepared['parameters']) != len(params):
+            raise mysql.connector.errors.ProgrammingError(
+                errno=1210, msg="Incorrect number of arguments executing prepared statement")
+        result = self._connection.cmd_stmt_execute(self._prepared['statement_id'], data=params,
+                                                   parameters=self._prepared['parameters'])
+        self._handle_result(result)
+
+
+@functools.lru_cache(maxsize=512)
+def _positional(statement: str) -> (str, tuple):
+    """
+    Convert the named parameters of a statement to positional ones.
+    :return: The statement using %s and the names of the parameters in the order they appear.
+    """
+    names = tuple(_NAMED_PARAMETER.findall(statement))
+    return _NAMED_PARAMETER.sub("%s", statement), names
+
+
+def _parameters(statement: str, params) -> (str, tuple):
+    if params is None:
+        return statement, ()
+    if isinstance(params, dict):
+        statement, names = _positional(statement)
+        return statement, tuple(params[name] for name in names)
+    return statement, tuple(params)
+
+
+def _prepared_cursor(statement: str) -> (str, _PreparedCursor):
+    """
+    Return the prepared cursor of the current connection for this statement, creating it if needed.
+    :return: The statement object the cursor was prepared with (the connector compares statements by identity) and the
+    cursor.
+    """
+    connection = database.mysql_connection.get_pooled_connection()
+    statements = connection.statements
+    entry = statements.get(statement)
+    if entry:
+        statements.move_to_end(statement)
+        return entry
+
+    if len(statements) >= config.PREPARED_STATEMENT_CACHE_SIZE:
+        # Deallocating the least recently used statement on the server.
+        _, (_, oldest) = statements.popitem(last=False)
+        oldest.close()
+    entry = (statement, connection.cnx.cursor(cursor_class=_PreparedCursor))
+    statements[statement] = entry
+    return entry
+
+
+def _run(statement: str, params, prepared: bool):
+    """
+    Execute a statement on the connection of the current thread.
+    :return: The cursor used, with the result not fetched yet.
+    """
+    statement, params = _parameters(statement, params)
+    if prepared:
+        statement, cursor = _prepared_cursor(statement)
+        try:
+            cursor.execute(statement, params)
+        except mysql.connector.errors.ProgrammingError:
+            # The statement couldn't be prepared, it must not stay in the cache.
+            database.mysql_connection.get_pooled_connection().statements.pop(statement, None)
+            raise
+    else:
+        cursor = database.mysql_connection.get_connection().cursor()
+        cursor.execute(statement, params)
+    return cursor
+
+
+def fetch_all(statement: str, params=None, prepared: bool = True) -> [dict]:
+    """
+    Execute a query and return its rows.
+
+    :param statement: SQL query, using %s or %(name)s for parameters.
+    :param params: Tuple or dictionary of parameters.
+    :param prepared: Send the query as a prepared statement.
+    :return: List of rows. Each row is a dictionary whose keys are the column names.
+    """
+    start = time.perf_counter()
+    cursor = _run(statement, params, prepared)
+    rows = cursor.fetchall()
+    instrumentation.record(statement, time.perf_counter() - start, len(rows))
+    columns = cursor.column_names
+    if not prepared:
+        cursor.close()
+    return [dict(zip(columns, row)) for row in rows]
+
+
+def fetch_one(statement: str, params=None, prepared: bool = True) -> dict:
+    """
+    Same as fetch_all() but only return the first row, or None if there is no result.
+    """
+    rows = fetch_all(statement, params, prepared)
+    if len(rows) == 0:
+        return None
+    return rows[0]
+
+
+def execute(statement: str, params=None, prepared: bool = True) -> Result:
+    """
+    Execute a statement which doesn't return rows (INSERT, UPDATE, DELETE...).
+
+    :param statement: SQL statement, using %s or %(name)s for parameters.
+    :param params: Tuple or dictionary of parameters.
+    :param prepared: Send the statement as a prepared statement.
+    :return: Number of rows affected and id of the inserted row.
+    """
+    start = time.perf_counter()
+    cursor = _run(statement, params, prepared)
+    result = Result(cursor.rowcount, cursor.lastrowid)
+    instrumentation.record(statement, time.perf_counter() - start, result.rowcount)
+    if not prepared:
+        cursor.close()
+    return result
+
+
+def placeholders(count: int) -> str:
+    """
+    Return count positional placeholders separated by commas. Used to build IN lists.
+    """
+    return ", ".join(["%s"] * count)
+
+
+@contextlib.contextmanager
+def transaction():
+    """
+    Run the statements executed in this block in a transaction. It is committed at the end of the block or rolled back
+    if an exception is raised. When a transaction is already running, the block is part of it.
+    """
+    cnx = database.mysql_connection.get_connection()
+    if cnx.in_transaction:
+        yield
+        return
+    cnx.start_transaction()
+    try:
+        yield
+    except BaseException:
+        cnx.rollback()
+        raise
+    cnx.commit()
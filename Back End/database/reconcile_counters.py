@@ -0,0 +1,68 @@
+import sys
+import database.mysql_connection
+from database import query
+
+"""
+Recompute the follower_count, following_count and post_count columns of UserTable and the like_count column of Post
+from the Follow, Post and LikeTable tables. The counters are maintained by the api in the same transaction as the rows
+they count, so they only drift if the tables are modified by hand.
+
+Usage (from the "Back End" directory) :
+    python -m database.reconcile_counters [database name]
+"""
+
+CHUNK_SIZE = 1000
+"""
+Number of ids repaired per statement. Keeps each UPDATE short so it doesn't lock the tables for long.
+"""
+
+
+def _reconcile(table: str, counters: dict) -> int:
+    """
+    Repair the counters of a table, chunk by chunk.
+    :param table: Table holding the counters.
+    :param counters: Dictionary mapping each counter column to the subquery computing its real value.
+    :return: Number of rows which had at least one wrong counter.
+    """
+    last_id = query.fetch_one(f"SELECT MAX(id) AS last_id FROM {table};")["last_id"] or 0
+    assignments = ", ".join(f"{column} = {count}" for (column, count) in counters.items())
+    drift = " OR ".join(f"{column} != {count}" for (column, count) in counters.items())
+    statement = f"""
+    UPDATE {table}
+    SET {assignments}
+    WHERE id BETWEEN %(first)s AND %(last)s AND ({drift});
+    """
+
+    repaired = 0
+    for first in range(1, last_id + 1, CHUNK_SIZE):
+        repaired += query.execute(statement, {"first": first, "last": first + CHUNK_SIZE - 1}).rowcount
+    return repaired
+
+
+def reconcile() -> dict:
+    """
+    Repair every counter.
+    :return: Number of rows repaired in each table.
+    """
+    users = _reconcile("UserTable", {
+        "follower_count": "(SELECT COUNT(*) FROM Follow WHERE Follow.user_id_followed = UserTable.id)",
+        "following_count": "(SELECT COUNT(*) FROM Follow WHERE Follow.user_id = UserTable.id)",
+        "post_count": "(SELECT COUNT(*) FROM Post WHERE Post.user_id = UserTable.id AND Post.status != 'failed')"
+    })
+    posts = _reconcile("Post", {
+        "like_count": "(SELECT COUNT(*) FROM LikeTable WHERE LikeTable.post_id = Post.id)"
+    })
+    return {"UserTable": users, "Post": posts}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        database.mysql_connection.pool = database.mysql_connection.create_pool(sys.argv[1])
+    else:
+        database.mysql_connection.pool = database.mysql_connection.create_pool()
+    try:
+        for (table, repaired) in reconcile().items():
+            print(f"{table} : {repaired} row(s) repaired.")
+    finally:
+        database.mysql_connection.release_connection()
+        database.mysql_connection.pool.close()
@@ -1,4 +1,4 @@
-import database.mysql_connection
+from database import query
 import errors
 
 
@@ -11,32 +11,25 @@ def value_in_database(table: str, field: str, value: str) -> bool:
     :param value: Value to look for.
     :return: Return if the value was found.
     """
+    # Table and field are never user input, only the value is sent as a parameter.
     request = f"""
-    SELECT * FROM {table}
-    WHERE {field} = \"{value}\";
+    SELECT 1 FROM {table}
+    WHERE {field} = %s
+    LIMIT 1;
     """
-    cursor = database.mysql_connection.cnx.cursor(dictionary=True)
-
     try:
-        cursor.execute(request)
+        result = query.fetch_one(request, (value,))
     except Exception as e:
         print(e)
-        cursor.close()
         return False
-    result = cursor.fetchall()
-    cursor.close()
-    return len(result) > 0
+    return result is not None
 
 
 def user_existing(id : int) -> bool:
-    query = f"""
-    SELECT * FROM UserTable
-    WHERE id = {id};"""
-    cursor = database.mysql_connection.cnx.cursor(dictionary=True)
-    cursor.execute(query)
-    result = cursor.fetchall()
-    cursor.close()
-    return len(result) == 1
+    result = query.fetch_one("""
+    SELECT 1 FROM UserTable
+    WHERE id = %s;""", (id,))
+    return result is not None
 
 def get_user_id_from_username(username: str) -> int:
     """
@@ -47,16 +40,12 @@ def get_user_id_from_username(username: str) -> int:
 
     :return: Return the user id.
     """
-    id_query = f"""
+    id_query = """
     SELECT id, username FROM UserTable
-    WHERE username = "{username}";
+    WHERE username = %s;
     """
-    cursor = database.mysql_connection.cnx.cursor(dictionary=True)
-    cursor.execute(id_query)
-    result = cursor.fetchall()
-    cursor.close()
-    if len(result) == 0:
+    result = query.fetch_one(id_query, (username,))
+    if result is None:
         raise errors.UserNotExisting(username=username)
     else:
-        return result[0]["id"]
-
+        return result["id"]
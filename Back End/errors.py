@@ -195,3 +195,57 @@ class PostNotLiked(BestagramException):
     success = False
     errorCode = 12
     description = "Post not liked"
+
+
+class ServerBusy(BestagramException):
+    """
+    The server is overloaded and couldn't process the request in time. The request can be retried later.
+    """
+    success = False
+    errorCode = 13
+    description = "Server busy"
+
+
+class InvalidCursor(BestagramException):
+    """
+    The pagination cursor sent is not one returned by the api.
+    """
+    success = False
+    errorCode = 14
+    description = "Invalid cursor"
+
+
+class BatchTooLarge(BestagramException):
+    """
+    Too many items were sent in one request.
+    """
+    success = False
+    errorCode = 15
+    description = "Batch too large"
+
+
+class ProfileAccessRestricted(BestagramException):
+    """
+    The profile is private and the user is not following it.
+    """
+    success = False
+    errorCode = 16
+    description = "Profile access restricted"
+
+
+class PostNotExisting(BestagramException):
+    """
+    There is no post with this id.
+    """
+    success = False
+    errorCode = 17
+    description = "Post not existing"
+
+
+class ImageNotAvailable(BestagramException):
+    """
+    The image of the post is still processing, its processing failed or its file is missing.
+    """
+    success = False
+    errorCode = 18
+    description = "Image not available"
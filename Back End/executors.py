@@ -0,0 +1,46 @@
+import concurrent.futures
+import threading
+
+
+class LazyExecutor:
+    """
+    Pool of workers (threads or processes) started when it is first used. Shutting it down waits for the pending work
+    and stops the workers, the next use starts a new pool.
+    """
+
+    def __init__(self, create):
+        """
+        :param create: Function returning a new concurrent.futures executor. Called on first use, so the settings it reads
+        (e.g. the number of workers in config.py) are read when the pool starts.
+        """
+        self._create = create
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def get(self) -> concurrent.futures.Executor:
+        """
+        Return the pool, started if needed.
+        """
+        with self._lock:
+            if self._executor is None:
+                self._executor = self._create()
+            return self._executor
+
+    def discard(self, executor: concurrent.futures.Executor):
+        """
+        Drop a pool that can't be used anymore (e.g. a broken process pool) without waiting for it, so the next use
+        starts a new one. Does nothing if another thread already replaced it.
+        """
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False)
+
+    def shutdown(self):
+        """
+        Wait for the pending work and stop the workers.
+        """
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
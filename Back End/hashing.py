@@ -0,0 +1,81 @@
+import concurrent.futures
+import concurrent.futures.process
+import hashlib
+import multiprocessing
+import os
+import threading
+import config
+import errors
+import executors
+
+"""
+Server-side password hashing. PBKDF2 is deliberately slow, running it in the request threads would let a burst of logins
+hold every worker (and the GIL) while cheap requests wait. Hashes are computed in a pool of processes instead, and
+when too many of them are already waiting the request is rejected right away with a ServerBusy error.
+"""
+
+_slots: threading.BoundedSemaphore = None
+
+
+def make_server_side_hash(old_hash: str, username: str) -> str:
+    """
+    Calculate the hash for a given password. This hashing process is described in the global readme.
+    :param old_hash:
+    :param username:
+    :return: The new hash.
+    """
+    new_hash = hashlib.pbkdf2_hmac("sha256", password=old_hash.encode("utf-8"), salt=username.encode("utf-8"),
+                                   iterations=10000, dklen=32).hex()
+    return new_hash
+
+
+def workers() -> int:
+    """
+    Number of processes used to hash passwords.
+    """
+    if config.HASHING_WORKERS is None:
+        return os.cpu_count() or 1
+    return config.HASHING_WORKERS
+
+
+def _create_executor() -> concurrent.futures.ProcessPoolExecutor:
+    global _slots
+    # Each pool gets its own slots : a pool started after the settings changed gets the new queue size.
+    _slots = threading.BoundedSemaphore(workers() + config.HASHING_QUEUE_SIZE)
+    # Processes are spawned rather than forked : forking a process running threads can copy locks held by other threads.
+    return concurrent.futures.ProcessPoolExecutor(max_workers=workers(), mp_context=multiprocessing.get_context("spawn"))
+
+
+_pool = executors.LazyExecutor(_create_executor)
+
+
+def hash_password(old_hash: str, username: str) -> str:
+    """
+    Same as make_server_side_hash() but computed in the hashing pool.
+
+    :raise ServerBusy: When the hashing pool already has too many hashes to compute, or its processes keep dying.
+    """
+    if workers() == 0:
+        return make_server_side_hash(old_hash, username)
+
+    for attempt in range(2):
+        executor = _pool.get()
+        # Released to the semaphore acquired, even if the pool is replaced in the meantime.
+        slots = _slots
+        if not slots.acquire(blocking=False):
+            raise errors.ServerBusy
+        try:
+            return executor.submit(make_server_side_hash, old_hash, username).result()
+        except concurrent.futures.process.BrokenProcessPool:
+            # A hashing process died (e.g. killed when out of memory), the pool can't be used anymore.
+            _pool.discard(executor)
+        finally:
+            slots.release()
+    raise errors.ServerBusy
+
+
+def shutdown():
+    """
+    Stop the hashing processes. They are started again on the next hash.
+    """
+    _pool.shutdown()
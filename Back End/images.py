@@ -1,4 +1,58 @@
+import os
 import PIL.Image
+import config
+
+"""
+Resizing of the images to squares.
+
+Only the centered square of the image is kept, so it is the only part resampled : resizing the whole image and then
+cropping it resamples pixels thrown away right after. On top of that :
+    - JPEG images can be decoded at 1/2, 1/4 or 1/8 of their size (see PIL.Image.Image.draft()), which is much faster
+      than decoding them fully and resampling them down. The output differs slightly from a full decode (0.5 / 255 on
+      average for tests/3840-2160.png at 1080 pixels).
+    - When the image is much bigger than the square wanted, it is first reduced by an integer factor, averaging blocks
+      of pixels, and only the last step is resampled with the bicubic filter (see REDUCING_GAP).
+
+Images are stored in several sizes (see resize_ladder()) so clients showing a thumbnail don't download the full image.
+Each size is stored in several formats (see save()) : the compressed formats of config.IMAGE_FORMATS, far smaller than
+PNG, and JPEG which every client can read (PNG for images with transparent pixels). Clients get the best format they
+accept (see negotiate()).
+"""
+
+FORMATS = {
+    "AVIF": ("image/avif", ".avif"),
+    "WEBP": ("image/webp", ".webp"),
+    "JPEG": ("image/jpeg", ".jpg"),
+    "PNG": ("image/png", ".png"),
+}
+"""
+Mime type and file extension of the formats the images can be stored in.
+"""
+
+RESAMPLE = PIL.Image.BICUBIC
+"""
+Filter used to resample the images, the default filter of PIL.Image.Image.resize().
+"""
+
+REDUCING_GAP = 3.0
+"""
+Images more than REDUCING_GAP times bigger than the square wanted are first reduced by an integer factor, leaving a
+ratio of at least REDUCING_GAP for the resampling. This changes the output slightly (about 0.2 / 255 on average for the
+test images resized to 320 and 150 pixels), from 3 it can't be told apart from a full resampling by eye.
+"""
+
+
+def crop_box(size: (int, int)) -> (float, float, float, float):
+    """
+    Centered square of an image, as big as possible.
+    :param size: Width and height of the image.
+    :return: Left, upper, right and lower coordinates of the square.
+    """
+    width, height = size
+    side = min(width, height)
+    left = (width - side) / 2
+    upper = (height - side) / 2
+    return left, upper, left + side, upper + side
 
 
 def resize_image(image: PIL.Image, length: int) -> PIL.Image:
@@ -12,37 +66,128 @@ def resize_image(image: PIL.Image, length: int) -> PIL.Image:
     """
 
     """
-    Resizing strategy : 
-     1) We resize the smallest side to the desired dimension (e.g. 1080)
-     2) We crop the other side so as to make it fit with the same length as the smallest side (e.g. 1080)
+    Resizing strategy :
+     1) We keep the centered square of the image, the smallest side and the same length of the other side
+     2) We resample this square only to the desired dimension (e.g. 1080)
+    """
+    if image.format == "JPEG":
+        # Decode the image at the smallest scale keeping the smallest side at least LENGTH pixels. Does nothing when the
+        # image is already loaded.
+        side = min(image.size)
+        image.draft(None, (image.size[0] * length // side, image.size[1] * length // side))
+
+    # The size changes when the image is decoded at a smaller scale.
+    return image.resize((length, length), RESAMPLE, box=crop_box(image.size), reducing_gap=REDUCING_GAP)
+
+
+def resize_ladder(image: PIL.Image, sizes: [int]) -> [PIL.Image]:
+    """
+    Resize an image to squares of several sizes. The image is decoded once, and each size is resampled from the previous
+    one, which has far less pixels than the image.
+    :param sizes: Width and height of the output images, largest first.
+    :return: The resized images, in the order of sizes.
+    """
+    resized_images = []
+    for size in sizes:
+        if resized_images and resized_images[-1].size[0] <= min(image.size):
+            resized_images.append(resized_images[-1].resize((size, size), RESAMPLE, reducing_gap=REDUCING_GAP))
+        else:
+            # The previous size was made bigger than the image, resampling it again would only blur it more.
+            resized_images.append(resize_image(image, size))
+    return resized_images
+
+
+def closest_size(size: int, sizes: [int]) -> int:
+    """
+    Size of the smallest image at least as big as the size asked, or of the largest image if none is.
+    :param sizes: Sizes of the images available, largest first.
     """
-    if image.size[0] < image.size[1]:
-        # The image is in portrait mode. Height is bigger than width.
+    return min((available for available in sizes if available >= size), default=sizes[0])
 
-        # This makes the width fit the LENGTH in pixels while conserving the ration.
-        resized_image = image.resize((length, int(image.size[1] * (length / image.size[0]))))
 
-        # Amount of pixel to lose in total on the height of the image.
-        required_loss = (resized_image.size[1] - length)
+def sized_path(path: str, size: int, sizes: [int]) -> str:
+    """
+    Path of one of the images written by resize_ladder(). The largest is written at path, the others next to it with
+    their size appended (e.g. picture.png, picture_75.png).
+    :param path: Path of the largest image.
+    :param sizes: Sizes of the images, largest first.
+    """
+    if size == sizes[0]:
+        return path
+    root, extension = os.path.splitext(path)
+    return f"{root}_{size}{extension}"
 
-        # Crop the height of the image so as to keep the center part.
-        resized_image = resized_image.crop(
-            box=(0, required_loss / 2, length, resized_image.size[1] - required_loss / 2))
 
-        # We now have a 1080x1080 pixels image.
-        return resized_image
-    else:
-        # This image is in landscape mode or already squared. The width is bigger than the heihgt.
+def stored_formats(transparent: bool) -> [str]:
+    """
+    Formats an image is stored in : those of config.IMAGE_FORMATS the installed Pillow can write, then JPEG, or PNG if
+    the image has transparent pixels.
+    """
+    PIL.Image.init()
+    formats = [format for format in config.IMAGE_FORMATS if format in PIL.Image.SAVE]
+    fallback = "PNG" if transparent else "JPEG"
+    if fallback not in formats:
+        formats.append(fallback)
+    return formats
+
 
-        # This makes the height fit the LENGTH in pixels while conserving the ration.
-        resized_image = image.resize((int(image.size[0] * (length / image.size[1])), length))
+def _save_options(format: str) -> dict:
+    if format == "JPEG":
+        return {"quality": config.IMAGE_QUALITY, "optimize": True, "progressive": config.IMAGE_PROGRESSIVE_JPEG}
+    if format in ("WEBP", "AVIF"):
+        return {"quality": config.IMAGE_QUALITY}
+    return {}
 
-        # Amount of pixel to lose in total on the width of the image.
-        required_loss = resized_image.size[0] - length
 
-        # Crop the width of the image so as to keep 1080 pixels of the center part.
-        resized_image = resized_image.crop(
-            box=(required_loss / 2, 0, resized_image.size[0] - required_loss / 2, length))
+def save(image: PIL.Image, path: str):
+    """
+    Write an image in each of its stored_formats(). The files of the other formats, left by a previous image written
+    at the same path, are removed.
+    :param path: Path of the image without extension, each format adds its own.
+    """
+    if image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info:
+        image = image.convert("RGBA")
+    if image.mode == "RGBA" and image.getchannel("A").getextrema()[0] == 255:
+        # Fully opaque, the alpha channel is dropped.
+        image = image.convert("RGB")
+    elif image.mode != "RGBA":
+        image = image.convert("RGB")
 
-        # We now have a 1080x1080 pixels image.
-        return resized_image
+    formats = stored_formats(transparent=image.mode == "RGBA")
+    for (format, (_, extension)) in FORMATS.items():
+        file_path = path + extension
+        if format in formats:
+            # Written under another name first, so the image is never read half written.
+            image.save(file_path + ".partial", format=format, **_save_options(format))
+            os.replace(file_path + ".partial", file_path)
+        elif os.path.isfile(file_path):
+            os.remove(file_path)
+
+
+def accepted_formats(accept) -> (str,):
+    """
+    Formats of config.IMAGE_FORMATS a client accepts. Clients are only sent a format they name, "*/*" doesn't mean they
+    can read WebP.
+    :param accept: (mime type, quality) pairs of the Accept header of the request, e.g. flask.request.accept_mimetypes.
+    """
+    accepted = {mimetype for (mimetype, quality) in accept if quality > 0}
+    return tuple(format for format in config.IMAGE_FORMATS if FORMATS[format][0] in accepted)
+
+
+def negotiate(path: str, accept) -> (str, str):
+    """
+    Choose the file of an image written by save() to send to a client.
+    :param path: Path of the image without extension.
+    :param accept: Accept header of the request (see accepted_formats()).
+    :return: Path of the file and its format : the first format of config.IMAGE_FORMATS the client accepts, else JPEG
+    or PNG.
+    :raise FileNotFoundError: When there is no file for this image.
+    """
+    available = [format for (format, (_, extension)) in FORMATS.items() if os.path.isfile(path + extension)]
+    if not available:
+        raise FileNotFoundError(path)
+    for format in accepted_formats(accept):
+        if format in available:
+            return path + FORMATS[format][1], format
+    format = "JPEG" if "JPEG" in available else available[-1]
+    return path + FORMATS[format][1], format
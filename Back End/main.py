@@ -1,14 +1,18 @@
-from flask import Flask
+import json
+from flask import Flask, request
 from flask_restful import Api
 import api.email
-from api.user import follow, profile, search
-from api.user.Medias_Post import posts, like_unlike
+from api.user import feed, follow, profile, search, suggestions
+from api.user.Medias_Post import image, posts, like_unlike
 from api.user.Login import login, refresh
 from api.user.Medias_ProfilePicture import Profile_Picture
 import database.mysql_connection
-import mysql.connector
+import database.instrumentation
+import config
 import files
-import database.connection_credentials
+import media_pipeline
+import search_index
+import social_graph
 
 PORT = 5002
 HOST = "0.0.0.0"
@@ -22,21 +26,60 @@ Consult that file to get information on how to contact these endpoints in order
 # Creating media directory if doesn't exist :
 files.prepare_directory("Medias/profile_picture")
 files.prepare_directory("Medias/image")
+files.prepare_directory(media_pipeline.SPOOL_DIRECTORY)
 
 app = Flask(__name__)
 
 app.config['MAX_CONTENT_LENGTH'] = 5 * 1024 * 1024  # Limit contents upload to 5 megabytes.
+app.config['USE_X_SENDFILE'] = config.MEDIA_X_SENDFILE
 
 api_app = Api(app)
 
-# Establishing connection.
-database.mysql_connection.cnx = mysql.connector.connect(
-    user=database.connection_credentials.databaseUserName,
-    password=database.connection_credentials.password,
-    host=database.connection_credentials.host,
-    database=database.connection_credentials.databaseName,
-    use_pure=True)
-database.mysql_connection.cnx.autocommit = True
+# Creating the connection pool. Connections are opened when first needed.
+database.mysql_connection.pool = database.mysql_connection.create_pool()
+
+if config.SEARCH_INDEX_ENABLED:
+    search_index.index.load()
+if config.SOCIAL_GRAPH_ENABLED:
+    social_graph.graph.load()
+database.mysql_connection.release_connection()
+
+
+@app.teardown_appcontext
+def release_connection(exception):
+    # Each request checks out its own connection, it is given back to the pool once the request is done.
+    database.mysql_connection.release_connection()
+
+
+@app.before_request
+def start_sql_recording():
+    database.instrumentation.start()
+
+
+@app.after_request
+def report_sql_recording(response):
+    """
+    Log the requests which go over the query budget (see config.py) and, in debug mode, attach the summary of the
+    queries executed to the response headers.
+    """
+    recording = database.instrumentation.stop()
+    if recording is None:
+        return response
+    summary = recording.summary(config.SQL_N_PLUS_ONE_THRESHOLD)
+
+    if summary["count"] > config.SQL_QUERY_COUNT_BUDGET or summary["duration"] > config.SQL_TIME_BUDGET:
+        app.logger.warning("%s %s executed %d queries in %.1f ms", request.method, request.path, summary["count"],
+                           summary["duration"] * 1000)
+    for (statement, count) in summary["n_plus_one"].items():
+        app.logger.warning("%s %s executed %d times : %s", request.method, request.path, count, statement)
+
+    if app.debug:
+        response.headers["X-SQL-Query-Count"] = str(summary["count"])
+        response.headers["X-SQL-Time"] = f"{summary['duration'] * 1000:.1f}ms"
+        response.headers["X-SQL-Rows"] = str(summary["rows"])
+        response.headers["X-SQL-N-Plus-One"] = json.dumps(summary["n_plus_one"])
+    return response
+
 
 # Defining api resources.
 api_app.add_resource(login.Login, "/user/login/<username>")
@@ -44,12 +87,23 @@ api_app.add_resource(refresh.Refresh, "/user/login/refresh/<refresh_token>")
 api_app.add_resource(posts.CreatePost, "/user/post")
 api_app.add_resource(search.Search, "/user/search")
 api_app.add_resource(follow.Follow, "/user/<id>/follow")
+api_app.add_resource(follow.FollowBatch, "/user/follow/batch")
+api_app.add_resource(follow.Followers, "/user/<id>/followers")
+api_app.add_resource(follow.Following, "/user/<id>/following")
+api_app.add_resource(suggestions.Suggestions, "/user/suggestions")
+api_app.add_resource(feed.Feed, "/user/feed")
 api_app.add_resource(api.email.Email, "/email/<email>/taken")
 api_app.add_resource(profile.ProfileUpdate, "/user/profile")
 api_app.add_resource(profile.ProfileRetrieving, "/user/<id>/profile/data")
-api_app.add_resource(Profile_Picture.ProfilePicture, "/user/<id>/profile/picture")
+api_app.add_resource(Profile_Picture.ProfilePicture, "/user/<id>/profile/picture",
+                     "/user/<id>/profile/picture/<int:version>")
 api_app.add_resource(like_unlike.Like_Unlike, "/media/<id>/like")
+api_app.add_resource(image.PostImage, "/media/<id>/image")
 
 if __name__ == "__main__":
+    # Posts left processing by a previous run. Not done on import, the tests import this module with their own database.
+    media_pipeline.sweep()
+    database.mysql_connection.release_connection()
+
     # Running the api.
-    app.run(host=HOST, port=PORT, ssl_context=("ApiCertificate/0.0.0.0:5002.crt", "ApiCertificate/0.0.0.0:5002.key"))
+    app.run(host=HOST, port=PORT, threaded=True, ssl_context=("ApiCertificate/0.0.0.0:5002.crt", "ApiCertificate/0.0.0.0:5002.key"))
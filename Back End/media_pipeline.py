@@ -0,0 +1,155 @@
+import concurrent.futures
+import datetime
+import os
+import shutil
+import tempfile
+import time
+import PIL.Image
+import config
+import database.mysql_connection
+import executors
+import files
+import images
+import timeline
+from database import query
+
+"""
+Background processing of the images posted. Decoding a big upload, resizing it and compressing it takes far longer
+than the rest of a request, so creating a post only spools the upload to disk (see spool()) and saves the post with
+the "processing" status. A pool of threads (see config.MEDIA_WORKERS) then resizes the image to each size of
+config.IMAGE_SIZES, writes them next to the other images of the user and sets the status to "ready", or "failed" if
+the upload isn't a readable image or its processing fails. Pillow releases the GIL while it decodes, resamples and encodes, so these threads
+don't slow the requests down.
+
+Posts are only written into the timelines (see timeline.py) once they are ready. Failed posts are not counted in the
+post_count of their user.
+
+Uploads whose processing never ended, because the process handling them stopped, are cleaned up when the api starts
+(see sweep(), called by main.py, servers importing the app should call it once too).
+"""
+
+PROCESSING = "processing"
+READY = "ready"
+FAILED = "failed"
+
+SPOOL_DIRECTORY = "Medias/spool"
+"""
+Directory where the uploads wait to be processed.
+"""
+
+_pool = executors.LazyExecutor(lambda: concurrent.futures.ThreadPoolExecutor(
+    max_workers=config.MEDIA_WORKERS, thread_name_prefix="media"))
+
+
+def spool(stream) -> str:
+    """
+    Write an upload to the spool directory.
+    :param stream: File object of the upload.
+    :return: Path of the spooled file.
+    """
+    files.prepare_directory(SPOOL_DIRECTORY)
+    descriptor, path = tempfile.mkstemp(dir=SPOOL_DIRECTORY)
+    with os.fdopen(descriptor, "wb") as file:
+        shutil.copyfileobj(stream, file)
+    return path
+
+
+def process(post_id: int, user_id: int, post_time: datetime.datetime, upload: str, destination: str):
+    """
+    Resize the upload of a post, write its images (one per size of config.IMAGE_SIZES, see images.save()) and mark it
+    as ready (or failed). The upload is removed.
+    :param upload: Path of the spooled upload.
+    :param destination: Path of the largest image of the post without extension, the others are written next to it.
+    """
+    try:
+        with PIL.Image.open(upload) as image:
+            resized_images = images.resize_ladder(image, config.IMAGE_SIZES)
+        for (size, resized_image) in zip(config.IMAGE_SIZES, resized_images):
+            images.save(resized_image, images.sized_path(destination, size, config.IMAGE_SIZES))
+    except (OSError, ValueError, PIL.Image.DecompressionBombError) as e:
+        print(f"Image processing failed. post_id : {post_id}, error : {e}")
+        fail(post_id, user_id)
+        return
+    finally:
+        _remove_upload(upload)
+
+    query.execute("""UPDATE Post SET status = %s WHERE id = %s;""", (READY, post_id))
+    timeline.fan_out_async(post_id, user_id, post_time)
+
+
+def _remove_upload(upload: str):
+    try:
+        os.remove(upload)
+    except OSError as e:
+        # Left in the spool directory, sweep() removes it later.
+        print(f"Spooled upload not removed. path : {upload}, error : {e}")
+
+
+def fail(post_id: int, user_id: int):
+    """
+    Mark a post still being processed as failed, and take it out of the post_count of its user. Does nothing if the post
+    is no longer being processed.
+    """
+    with query.transaction():
+        if query.execute("""UPDATE Post SET status = %s WHERE id = %s AND status = %s;""",
+                         (FAILED, post_id, PROCESSING)).rowcount:
+            query.execute("""UPDATE UserTable SET post_count = post_count - 1 WHERE id = %s;""", (user_id,))
+
+
+def _process_job(post_id: int, user_id: int, *args):
+    try:
+        process(post_id, user_id, *args)
+    except Exception as e:
+        print(f"Image processing failed. post_id : {post_id}, error : {e}")
+        try:
+            fail(post_id, user_id)
+        except Exception as e:
+            # The post stays in processing until sweep() marks it as failed.
+            print(f"Post not marked as failed. post_id : {post_id}, error : {e}")
+    finally:
+        database.mysql_connection.release_connection()
+
+
+def sweep() -> (int, int):
+    """
+    Clean up after processing stopped for good, e.g. when the process was killed with uploads still queued : posts
+    processing for more than config.MEDIA_PROCESSING_TIMEOUT seconds are marked as failed (see fail()) and the spooled
+    uploads that old are removed.
+    :return: Number of posts marked as failed and number of uploads removed.
+    """
+    rows = query.fetch_all("""
+    SELECT id, user_id FROM Post
+    WHERE status = %s AND post_time < NOW() - INTERVAL %s SECOND;
+    """, (PROCESSING, config.MEDIA_PROCESSING_TIMEOUT))
+    for row in rows:
+        fail(row["id"], row["user_id"])
+
+    removed = 0
+    if os.path.isdir(SPOOL_DIRECTORY):
+        oldest = time.time() - config.MEDIA_PROCESSING_TIMEOUT
+        for entry in os.scandir(SPOOL_DIRECTORY):
+            if entry.is_file() and entry.stat().st_mtime < oldest:
+                os.remove(entry.path)
+                removed += 1
+    return len(rows), removed
+
+
+def process_async(post_id: int, user_id: int, post_time: datetime.datetime, upload: str, destination: str):
+    """
+    Same as process() but run in the media pool. Runs right away when config.MEDIA_WORKERS is 0.
+    """
+    if config.MEDIA_WORKERS == 0:
+        try:
+            process(post_id, user_id, post_time, upload, destination)
+        except Exception:
+            fail(post_id, user_id)
+            raise
+        return
+    _pool.get().submit(_process_job, post_id, user_id, post_time, upload, destination)
+
+
+def shutdown():
+    """
+    Wait for the images being processed and stop the media threads. They are started again on the next post.
+    """
+    _pool.shutdown()
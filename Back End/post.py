@@ -1,13 +1,27 @@
 import os
-import database.mysql_connection
+from database import query
 import config
-from PIL import Image
 import errors
 import files
 import images
+import media_pipeline
 import tag
 
 
+POST_QUERY = """
+SELECT Post.id, Post.user_id, Post.post_time, Post.caption, Post.like_count, Post.status,
+(Post.user_id = %s OR UserTable.public_profile OR EXISTS (
+    SELECT 1 FROM Follow WHERE Follow.user_id = %s AND Follow.user_id_followed = Post.user_id
+)) AS can_access
+FROM Post
+JOIN UserTable ON UserTable.id = Post.user_id
+"""
+"""
+Select the data of posts and whether the user accessing them can see them : the original poster, and everyone when the
+account is public, its followers otherwise. The parameters are the id of the user twice, followed by the WHERE clause.
+"""
+
+
 class Post:
     """
     This class is managing a post uploaded by a user. You will note that the api calls refer to them as "medias". They
@@ -22,7 +36,7 @@ class Post:
     leading to an image (if you have the post id and the user id), that's why this path is not stored in the database.
     """
 
-    def __init__(self, id: int, user):
+    def __init__(self, id: int, user, row: dict = None):
         """
         User object is used as a way to allow to get the post data. If the original poster's account is private then
         only its follower can see the post.
@@ -31,48 +45,58 @@ class Post:
         :param id: Post's id.
         :param user: User who is accessing the post.
         :type user: user.User
-        :type cursor: mysql.connector.connection.MySQLCursor
-        """
-        self.cursor = database.mysql_connection.cnx.cursor(dictionary=True)
+        :param row: Row of the post selected with POST_QUERY, when already fetched (see load_many()).
 
+        :raise PostNotExisting:
+        :raise PostAccessRestricted:
+        """
         self._user = user
         self._id = id
 
-        original_poster_id_query = f"""SELECT user_id FROM Post WHERE id = {id};"""
-        self.cursor.execute(original_poster_id_query)
-        self._original_poster_id = self.cursor.fetchall()[0]["user_id"]
-
-        self._can_modify = False
-        self._can_access_post = False
-        if self._user.id == self._original_poster_id:  # User accessing post is OP.
-            self._can_modify = True
-            self._can_access_post = True
-
-        original_poster_account_status_query = f"""SELECT public_profile FROM UserTable WHERE id = {self._original_poster_id};"""
-        self.cursor.execute(original_poster_account_status_query)
-        public_profile = self.cursor.fetchall()[0]["public_profile"]
-        self._can_access_post = public_profile
-
-        if not self._can_access_post:  # At that point it means the account is private. The user accessing the post
-            # must be following the OP to access the post.
-            is_following_query = f"""SELECT * FROM Follow WHERE user_id = {self._user.id} && user_id_followed = {self._original_poster_id};"""
-            self.cursor.execute(is_following_query)
-            is_following = len(self.cursor.fetchall()) == 1
-            self._can_access_post = is_following
-
-        if not self._can_access_post:  # The user is not allowed to view this post.
+        if row is None:
+            row = query.fetch_one(POST_QUERY + "WHERE Post.id = %s;", (user.id, user.id, id))
+            if row is None:
+                raise errors.PostNotExisting()
+
+        if not row["can_access"]:  # The user is not allowed to view this post.
             raise errors.PostAccessRestricted()
 
-        post_data_query = f"""SELECT * FROM Post WHERE id = {self.id};"""
-        self.cursor.execute(post_data_query)
-        result = self.cursor.fetchall()[0]
-        self._post_time = result["post_time"]
-        self._caption = result["caption"]
+        self._original_poster_id = row["user_id"]
+        self._can_modify = self._user.id == self._original_poster_id  # User accessing post is OP.
+        self._post_time = row["post_time"]
+        self._caption = row["caption"]
+        self._like_count = row["like_count"]
+        self._status = row["status"]
+
+    @staticmethod
+    def load_many(ids: [int], user) -> list:
+        """
+        Load several posts with one query.
+        :param ids: Ids of the posts.
+        :param user: User who is accessing the posts.
+        :type user: user.User
+        :return: The posts the user can access, in the order of ids. Posts not existing or restricted are left out.
+        """
+        ids = list(dict.fromkeys(ids))  # Removes duplicates, keeping the order.
+        if not ids:
+            return []
+        # The number of ids changes from one call to the other, not worth a prepared statement.
+        rows = query.fetch_all(POST_QUERY + f"WHERE Post.id IN ({query.placeholders(len(ids))});",
+                               [user.id, user.id] + ids, prepared=False)
+        rows = {row["id"]: row for row in rows if row["can_access"]}
+        return [Post(id, user, row=rows[id]) for id in ids if id in rows]
 
     @property
     def id(self):  # Only a getter.
         return self._id
 
+    @property
+    def user_id(self):
+        """
+        Id of the original poster.
+        """
+        return self._original_poster_id
+
     @property
     def post_time(self):
         return self._post_time
@@ -81,6 +105,44 @@ class Post:
     def caption(self):
         return self._caption
 
+    @property
+    def like_count(self):
+        return self._like_count
+
+    @property
+    def status(self) -> str:
+        """
+        Processing state of the image of the post : media_pipeline.PROCESSING, READY or FAILED.
+        """
+        return self._status
+
+    @property
+    def image_path(self) -> str:
+        """
+        Path of the largest image of the post, without extension (see images.save()).
+        """
+        return os.path.join(f"Medias/image/{self._original_poster_id}", str(self._id))
+
+    def image_file(self, size: int, accept=()) -> (str, str):
+        """
+        File of the image of the post to send to a client, in the smallest size of config.IMAGE_SIZES at least as big as
+        size.
+        :param accept: Formats accepted by the client (see images.negotiate()).
+        :return: Path of the file and its format.
+        :raise ImageNotAvailable: When the image is not ready.
+        """
+        if self._status != media_pipeline.READY:
+            raise errors.ImageNotAvailable()
+        sized_path = images.sized_path(self.image_path, images.closest_size(size, config.IMAGE_SIZES),
+                                       config.IMAGE_SIZES)
+        # Posts made before the smaller sizes were added only have the largest one.
+        for path in (sized_path, self.image_path):
+            try:
+                return images.negotiate(path, accept)
+            except FileNotFoundError:
+                continue
+        raise errors.ImageNotAvailable()
+
     @caption.setter
     def caption(self, caption):
         if self._can_modify:
@@ -92,67 +154,56 @@ class Post:
         Like this post.
         :return:
         """
-        like_query = f"""INSERT INTO LikeTable (user_id, post_id) VALUES ({self._user.id}, {self.id});"""
         try:
-            self.cursor.execute(like_query)
+            with query.transaction():
+                query.execute("""INSERT INTO LikeTable (user_id, post_id) VALUES (%s, %s);""", (self._user.id, self.id))
+                query.execute("""UPDATE Post SET like_count = like_count + 1 WHERE id = %s;""", (self.id,))
         except:
             # Post's already liked by this user.
             raise errors.PostAlreadyLiked()
 
     def unlike(self):
-        unlike_query = f"""DELETE FROM LikeTable WHERE post_id = {self.id} && user_id = {self._user.id};"""
-        try:
-            self.cursor.execute(unlike_query)
-        except:
-            # Post's not liked by this user.
-            raise errors.PostNotLiked()
+        with query.transaction():
+            deleted = query.execute("""DELETE FROM LikeTable WHERE post_id = %s && user_id = %s;""",
+                                    (self.id, self._user.id)).rowcount
+            if deleted == 0:
+                # Post's not liked by this user.
+                raise errors.PostNotLiked()
+            query.execute("""UPDATE Post SET like_count = like_count - 1 WHERE id = %s;""", (self.id,))
 
     @staticmethod
-    def create(user, image: Image, caption: str, tags: [tag.Tag]):
+    def create(user, upload: str, caption: str, tags: [tag.Tag]):
         """
-        Create a post..
-        :param image: Post's image.
+        Create a post. Its image is processed in the background (see media_pipeline.py), the post is returned with the
+        processing status.
+        :param upload: Path of the image uploaded, spooled with media_pipeline.spool(). It is removed once processed.
         :param caption: Caption provided with the post.
         :param tags: List of this post's tags.
         :type user: user.User
-        :return: The id of the newly created post.
-        """
-        files.prepare_directory(user.directory)
-
-        resized_image = images.resize_image(image, config.IMAGE_DIMENSION)
-
-        create_post_query = f"""
-        START TRANSACTION;
-            INSERT INTO Post
-            VALUES(
-            NULL, {user.id}, NOW(), "{caption}"
-            );
-
-            SELECT LAST_INSERT_ID();
-        COMMIT;
+        :return: The newly created post.
         """
-
-        iterable = user.cursor.execute(create_post_query, multi=True)
-        # 4 request are made a the same time. The third is the select one.
-        index = 0
-        result: list = []
-
-        for i in iterable:
-            if index == 2:
-                result = i.fetchall()
-            index += 1
-
-        post_id = result[0]["LAST_INSERT_ID()"]
-
-        image.filename = f"{post_id}.png"
-        # Dir where the image is stored.
-        final_image_path = os.path.join(user.directory, image.filename)
-        # Saving image.
-        resized_image.save(final_image_path)
-
-        for i in tags:
-            try:
-                i.save(post_id)
-            except errors.UserNotExisting:
-                print(f"User not existing. post_id : {post_id}, user_id : {i.user_id}")
-        return Post(id=post_id, user=user)
+        try:
+            files.prepare_directory(user.directory)
+            # The post and its tags are all saved or none of them is.
+            with query.transaction():
+                post_id = query.execute("""
+                INSERT INTO Post (user_id, post_time, caption, status)
+                VALUES(
+                %s, NOW(), %s, %s
+                );
+                """, (user.id, caption, media_pipeline.PROCESSING)).lastrowid
+                query.execute("""UPDATE UserTable SET post_count = post_count + 1 WHERE id = %s;""", (user.id,))
+
+                saved = tag.Tag.save_many(post_id, tags)
+                for i in tags:
+                    if i not in saved:
+                        print(f"User not existing. post_id : {post_id}, user_id : {i.user_id}")
+            created = Post(id=post_id, user=user)
+        except BaseException:
+            os.remove(upload)
+            raise
+
+        # Dir where the image is stored, the extension depends on the format.
+        final_image_path = os.path.join(user.directory, str(post_id))
+        media_pipeline.process_async(post_id, user.id, created.post_time, upload, final_image_path)
+        return created
@@ -1,10 +1,46 @@
 import os
 import images
+import cache
 import config
 import PIL.Image
 import files
 import errors
-from database import request_utils, mysql_connection
+import search_index
+from database import query, request_utils
+
+_default_avatar: bytes = None
+
+
+def default_avatar() -> bytes:
+    """
+    Picture of the users who didn't set one. It is read once, every user shares the same bytes.
+    """
+    global _default_avatar
+    if _default_avatar is None:
+        with open("default_avatar.png", 'rb') as f:
+            _default_avatar = f.read()
+    return _default_avatar
+
+
+def _picture_weight(entry: (bytes, str)) -> int:
+    # The default picture is in memory once, whatever the number of users using it.
+    return 0 if entry[0] is _default_avatar else len(entry[0])
+
+
+pictures = cache.LRUCache(max_size=config.PROFILE_PICTURE_CACHE_SIZE, max_weight=config.PROFILE_PICTURE_CACHE_BYTES,
+                          weigher=_picture_weight)
+"""
+Cache of the profile pictures sent, keyed by (user id, picture version, size, formats accepted), of (picture, format).
+A version of a picture never changes, so entries don't expire. Its stats give the hit ratio and the number of bytes
+cached (weight).
+"""
+
+
+def picture_route(id: int, version: int) -> str:
+    """
+    Route of a version of a profile picture. What it sends never changes, clients can cache it forever.
+    """
+    return f"/user/{id}/profile/picture/{version}"
 
 
 class Profile:
@@ -25,11 +61,6 @@ class Profile:
             - Through a user's id. This only allows to retrieve profile information.
         """
         self.user = user
-        if user:
-            self.cursor = user.cursor
-        else:
-            self.cursor = mysql_connection.cnx.cursor(dictionary=True)
-
         if user:
             self.id = user.id
         else:
@@ -37,10 +68,8 @@ class Profile:
 
     @property
     def use_default_image(self) -> bool:
-        query = f"""SELECT use_default_picture FROM UserTable WHERE id = {self.id};"""
-        self.cursor.execute(query)
-        result = self.cursor.fetchall()[0]["use_default_picture"]
-        return result
+        result = query.fetch_all("""SELECT use_default_picture FROM UserTable WHERE id = %s;""", (self.id,))
+        return result[0]["use_default_picture"]
 
     @property
     def profile_picture_directory(self) -> str:
@@ -52,23 +81,76 @@ class Profile:
 
     @property
     def default_profile_picture(self) -> bytes:
-        with open("default_avatar.png", 'rb') as f:
-            return f.read()
+        return default_avatar()
+
+    @property
+    def picture_version(self) -> int:
+        """
+        Version of the profile picture, increased each time the picture is changed (see picture_route()).
+        :raise UserNotExisting:
+        """
+        return self._picture_row()["picture_version"]
+
+    def _picture_row(self) -> dict:
+        row = query.fetch_one("""SELECT use_default_picture, picture_version FROM UserTable WHERE id = %s;""",
+                              (self.id,))
+        if row is None:
+            raise errors.UserNotExisting
+        return row
 
     @property
     def profile_picture(self) -> bytes:
+        return self.sized_profile_picture(config.PROFILE_PICTURE_DIMENSION)[0]
+
+    def sized_profile_picture(self, size: int, accept=(), version: int = None) -> (bytes, str, int):
+        """
+        Profile picture in the smallest size of config.PROFILE_PICTURE_SIZES at least as big as size. A version of a
+        picture sent recently comes from the cache (see pictures), without query nor file read.
+        :param accept: Formats accepted by the client (see images.negotiate()).
+        :param version: Version of the picture wanted (see picture_version), None for the current one.
+        :return: The picture, its format and its version. The picture and its format are None when the version asked is
+        not the current one anymore.
+        :raise UserNotExisting:
+        """
+        size = images.closest_size(size, config.PROFILE_PICTURE_SIZES)
+        accepted = images.accepted_formats(accept)
+        if version is not None:
+            # Ids taken from a route are strings.
+            picture = pictures.get((str(self.id), version, size, accepted))
+            if picture is not None:
+                return picture + (version,)
+
+        row = self._picture_row()
+        current_version = row["picture_version"]
+        if version is not None and version != current_version:
+            return None, None, current_version
+        key = (str(self.id), current_version, size, accepted)
+        picture = pictures.get(key) if version is None else None
+        if picture is None:
+            picture = self._read_profile_picture(size, accept, row["use_default_picture"])
+            pictures.put(key, picture)
+        return picture + (current_version,)
+
+    def _read_profile_picture(self, size: int, accept, use_default_picture: bool) -> (bytes, str):
         try:
-            if self.use_default_image:
-                return self.default_profile_picture
+            if use_default_picture:
+                return self.default_profile_picture, "PNG"
             else:
-                with open(os.path.join(self.profile_picture_directory, "picture.png"), 'rb') as f:
-                    return f.read()
+                path = os.path.join(self.profile_picture_directory, "picture")
+                try:
+                    file_path, format = images.negotiate(
+                        images.sized_path(path, size, config.PROFILE_PICTURE_SIZES), accept)
+                except FileNotFoundError:
+                    # Pictures set before the smaller sizes were added only exist in the largest one.
+                    file_path, format = images.negotiate(path, accept)
+                with open(file_path, 'rb') as f:
+                    return f.read(), format
         except Exception as e:
             raise errors.UserNotExisting
 
     @property
     def profile_picture_api_route(self) -> str:
-        return f"/user/{self.id}/profile/picture"
+        return picture_route(self.id, self.picture_version)
 
     def update(self, caption: str = None, profile_picture: PIL.Image = None, public_visibility: bool = None,
                username: str = None, name: str = None):
@@ -88,32 +170,45 @@ class Profile:
 
         profile_picture_path = None
         if profile_picture:
-            picture = images.resize_image(image=profile_picture, length=config.PROFILE_PICTURE_DIMENSION)
+            resized_pictures = images.resize_ladder(image=profile_picture, sizes=config.PROFILE_PICTURE_SIZES)
 
-            picture.filename = f"picture.png"
-
-            profile_picture_path = os.path.join(self.profile_picture_directory, picture.filename)
+            profile_picture_path = os.path.join(self.profile_picture_directory, "picture")
             files.prepare_directory(self.profile_picture_directory)
-            picture.save(profile_picture_path)
+            for (size, picture) in zip(config.PROFILE_PICTURE_SIZES, resized_pictures):
+                images.save(picture, images.sized_path(profile_picture_path, size, config.PROFILE_PICTURE_SIZES))
 
         update_query = """
         UPDATE UserTable SET """
+        params = {"id": self.user.id}
         if caption:
-            update_query += f"""caption = "{caption}","""
+            update_query += """caption = %(caption)s,"""
+            params["caption"] = caption
         if public_visibility:
             if str(public_visibility).lower() == "false" or str(public_visibility).lower() == "true":
-                update_query += f"""public_profile = {public_visibility},"""
+                update_query += """public_profile = %(public_profile)s,"""
+                params["public_profile"] = str(public_visibility).lower() == "true"
         if profile_picture_path:
-            update_query += f"""use_default_picture = FALSE,"""
+            # The picture gets a new route, the previous one may be cached by the clients.
+            update_query += """use_default_picture = FALSE, picture_version = picture_version + 1,"""
         if name:
-            update_query += f"""name = "{name}","""
+            update_query += """name = %(name)s,"""
+            params["name"] = name
         if username:
-            update_query += f"""username = "{username}","""
+            update_query += """username = %(username)s,"""
+            params["username"] = username
 
         update_query = update_query[:-1]  # Removes the coma ","
 
-        update_query += f" WHERE id = {self.user.id};"
-        self.cursor.execute(update_query)
+        update_query += " WHERE id = %(id)s;"
+        # The set of updated fields changes from one call to the other, not worth a prepared statement.
+        query.execute(update_query, params, prepared=False)
+        if profile_picture_path:
+            # The previous version of the picture is not asked anymore.
+            pictures.discard_keys_if(lambda key: key[0] == str(self.id))
+            search_index.index.picture_changed(self.id)
+        search_index.index.rename(self.id, username=username, name=name)
+        # The cached session holds the username and name.
+        self.user.invalidate_session()
 
     def get(self, token: str = None) -> dict:
         """
@@ -134,14 +229,12 @@ class Profile:
         if not profile_id:
             profile_id = self.user.id
 
-        get_profile_data_query = f"""
-        SELECT name, username, caption, public_profile, (SELECT COUNT(*) FROM Follow WHERE user_id_followed = id) AS follower, (SELECT COUNT(*) FROM Follow WHERE user_id = id) AS following FROM UserTable
-        WHERE id = {profile_id};
-        """
-        self.cursor.execute(get_profile_data_query)
-        results = self.cursor.fetchall()
-        if len(results) != 1:
+        results = query.fetch_one("""
+        SELECT name, username, caption, public_profile, follower_count AS follower, following_count AS following,
+        picture_version FROM UserTable
+        WHERE id = %s;
+        """, (profile_id,))
+        if results is None:
             raise errors.UserNotExisting(id=self.id)
-        results = results[0]
-        results["profile_picture_route"] = self.profile_picture_api_route
+        results["profile_picture_route"] = picture_route(profile_id, results.pop("picture_version"))
         return results
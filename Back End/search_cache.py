@@ -0,0 +1,108 @@
+import collections
+import threading
+import cache
+import config
+from search_index import fold, is_subsequence
+
+"""
+Typeahead cache of the user search. Clients search on every keystroke : "a", then "ab", then "abc"... Every name
+matching "abc" also matches "ab", and the results keep the same order, so the results of "abc" can be computed in memory
+by filtering the results of "ab" instead of querying the database again.
+
+For each user searching, the cache keeps the results of its last few searches (see config.SEARCH_CACHE_SEARCHES). Only
+the first config.SEARCH_CACHE_CANDIDATES results of a search are kept : filtering them gives the first results of the
+longer search, as many as needed while enough of them are left.
+
+Entries expire after config.SEARCH_CACHE_TTL seconds and are dropped when the user searching follows someone, as the
+users followed come first in the results.
+"""
+
+Entry = collections.namedtuple("Entry", ["search", "results", "complete"])
+"""
+Cached search. Results are the first results of the search, in order. Complete is True if they are all of them.
+"""
+
+
+class SearchCache:
+    """
+    Results of the last searches of each user. See the module documentation.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        """
+        :param max_size: Maximum number of users whose searches are cached.
+        :param ttl: Number of seconds after which the searches of a user expire.
+        """
+        self._entries = cache.LRUCache(max_size, ttl=ttl)  # User id -> tuple of entries, most recent first.
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, id: int, search: str, needed: int) -> [dict]:
+        """
+        Return the first results of a search from the cache.
+        :param id: Id of the user searching.
+        :param search: Search string.
+        :param needed: Number of results needed.
+        :return: At least needed results, or all the results if there are less. None if the cache can't tell.
+        """
+        folded = fold(search)
+        for entry in self._entries.get(id, ()):
+            if entry.search == search:
+                results = entry.results
+            elif is_subsequence(fold(entry.search), folded):
+                results = [row for row in entry.results if is_subsequence(folded, fold(row["name"]))]
+            else:
+                continue
+            # The results kept are the first ones, so are the filtered ones : they can only answer for as many results.
+            if entry.complete or len(results) >= needed:
+                self._count(hit=True)
+                if entry.search != search:
+                    self.put(id, search, results, entry.complete)
+                return results
+        self._count(hit=False)
+        return None
+
+    def put(self, id: int, search: str, results: [dict], complete: bool):
+        """
+        Cache the first results of a search.
+        :param id: Id of the user searching.
+        :param complete: True if these are all the results of the search.
+        """
+        entries = [entry for entry in self._entries.get(id, ()) if entry.search != search]
+        entries.insert(0, Entry(search, results[:config.SEARCH_CACHE_CANDIDATES],
+                                complete and len(results) <= config.SEARCH_CACHE_CANDIDATES))
+        self._entries.put(id, tuple(entries[:config.SEARCH_CACHE_SEARCHES]))
+
+    def invalidate(self, id: int):
+        """
+        Drop the searches of a user.
+        """
+        self._entries.pop(id)
+
+    def clear(self):
+        self._entries.clear()
+
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    @property
+    def stats(self) -> dict:
+        """
+        Number of users cached, searches answered from the cache (hits) and searches that needed the database (misses).
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0
+            }
+
+
+searches = SearchCache(config.SEARCH_CACHE_SIZE, ttl=config.SEARCH_CACHE_TTL)
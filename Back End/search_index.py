@@ -0,0 +1,262 @@
+import array
+import collections
+import heapq
+import itertools
+import re
+import threading
+import time
+import unicodedata
+import config
+from database import query
+
+"""
+In-memory index answering the user search without querying the database. The search "abc" matches every user whose
+name contains a, b and c in this order (same as the LIKE "%a%b%c%" used by the SQL search), case and accent insensitive.
+
+Users are sorted by rank : followers first, then name and id. For each character the index keeps a bitmap of the ranks
+whose name contains it. A search ANDs the bitmaps of its characters, which leaves the users having all of them, then
+checks the order of the characters of these names in rank order. It stops as soon as the requested page is full : short
+searches match almost everyone and stop after a few names, long searches have few candidates left.
+
+Sorting the posting lists is too expensive to be done on each change. Users registered or renamed since the last sort
+are kept apart and merged in at search time, new follower counts are taken into account at the next sort (see
+config.SEARCH_INDEX_RERANK_INTERVAL).
+
+The index lives in the memory of the process : every process serving the api loads its own copy at startup (see
+main.py). It is only enabled with config.SEARCH_INDEX_ENABLED.
+"""
+
+_Snapshot = collections.namedtuple("_Snapshot", ["ranked", "postings", "time"])
+"""
+Sorted part of the index. Ranked holds every id in rank order, postings maps each character to a bitmap (an int whose
+bit n is set when the name of the user ranked n contains this character). Never modified once built, searches can use it
+while the next one is built.
+"""
+
+_NON_ZERO_BYTE = re.compile(rb"[^\x00]")
+
+
+def fold(text: str) -> str:
+    """
+    Lower case and strip the accents of a text, so it compares like MySQL compares names (accent and case
+    insensitive).
+    """
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(character for character in decomposed if not unicodedata.combining(character)).casefold()
+
+
+def is_subsequence(search: str, text: str) -> bool:
+    """
+    Check if the characters of search appear in text in the same order, not necessarily next to each other.
+    """
+    characters = iter(text)
+    return all(character in characters for character in search)
+
+
+class SearchIndex:
+    """
+    Index of the users' names. See the module documentation.
+    """
+
+    def __init__(self):
+        self._usernames = {}
+        self._names = {}
+        self._search_names = {}  # Folded names (see fold()), the ones searched.
+        self._followers = {}
+        self._picture_versions = {}
+        self._pending = {}  # Id -> change number, for the users registered or renamed since the last sort.
+        self._changes = 0
+        self._lock = threading.Lock()
+        self._reranking = False
+        self._snapshot = _Snapshot(array.array("q"), {}, time.monotonic())
+        self.loaded = False
+
+    def __len__(self):
+        return len(self._names)
+
+    def _key(self, id: int) -> tuple:
+        return -self._followers[id], self._search_names[id], id
+
+    def _changed(self, id: int):
+        self._changes += 1
+        self._pending[id] = self._changes
+
+    def load(self):
+        """
+        Load every user from the database and sort the index. Must be called before the index is used, updates made
+        before it are ignored.
+        """
+        def rows():
+            last_id = 0
+            while True:
+                # Loading by chunks, so the rows of a big table are not all held by the connector at once.
+                chunk = query.fetch_all("""
+                SELECT id, username, name, follower_count, picture_version FROM UserTable
+                WHERE id > %s
+                ORDER BY id
+                LIMIT %s;
+                """, (last_id, config.SEARCH_INDEX_LOAD_CHUNK_SIZE))
+                yield from chunk
+                if len(chunk) < config.SEARCH_INDEX_LOAD_CHUNK_SIZE:
+                    return
+                last_id = chunk[-1]["id"]
+
+        self.replace(rows())
+
+    def replace(self, users):
+        """
+        Replace the content of the index and sort it.
+        :param users: Iterable of dictionaries with the id, username, name, follower_count and picture_version (0 when
+        missing) of each user.
+        """
+        usernames, names, followers, picture_versions = {}, {}, {}, {}
+        for row in users:
+            usernames[row["id"]] = row["username"]
+            names[row["id"]] = row["name"]
+            followers[row["id"]] = row["follower_count"]
+            picture_versions[row["id"]] = row.get("picture_version", 0)
+
+        with self._lock:
+            self._usernames = usernames
+            self._names = names
+            self._search_names = {id: fold(name) for (id, name) in names.items()}
+            self._followers = followers
+            self._picture_versions = picture_versions
+            self._pending = {}
+        self.rerank()
+        self.loaded = True
+
+    def add(self, id: int, username: str, name: str):
+        """
+        Add a newly registered user.
+        """
+        if not self.loaded:
+            return
+        with self._lock:
+            self._usernames[id] = username
+            self._names[id] = name
+            self._search_names[id] = fold(name)
+            self._followers[id] = 0
+            self._picture_versions[id] = 0
+            self._changed(id)
+
+    def rename(self, id: int, username: str = None, name: str = None):
+        """
+        Update the username and/or the name of a user.
+        """
+        if not self.loaded or id not in self._names:
+            return
+        with self._lock:
+            if username:
+                self._usernames[id] = username
+            if name:
+                self._names[id] = name
+                self._search_names[id] = fold(name)
+                self._changed(id)
+
+    def add_followers(self, id: int, delta: int = 1):
+        """
+        Update the follower count of a user. It is used to rank results from the next sort.
+        """
+        if not self.loaded or id not in self._followers:
+            return
+        with self._lock:
+            self._followers[id] += delta
+
+    def picture_changed(self, id: int):
+        """
+        Increase the picture version of a user, after its profile picture was changed.
+        """
+        if not self.loaded or id not in self._picture_versions:
+            return
+        with self._lock:
+            self._picture_versions[id] += 1
+
+    def rerank(self):
+        """
+        Sort the index again with the current names and follower counts, and replace the sorted part with it.
+        """
+        with self._lock:
+            keys = {id: self._key(id) for id in self._names}
+            pending = dict(self._pending)
+
+        ranked = sorted(keys, key=keys.__getitem__)
+        bitmaps = collections.defaultdict(lambda: bytearray((len(ranked) + 7) // 8))
+        for (rank, id) in enumerate(ranked):
+            for character in set(keys[id][1]):
+                bitmaps[character][rank >> 3] |= 1 << (rank & 7)
+        postings = {character: int.from_bytes(bitmap, "little") for (character, bitmap) in bitmaps.items()}
+
+        with self._lock:
+            self._snapshot = _Snapshot(array.array("q", ranked), postings, time.monotonic())
+            for (id, change) in pending.items():
+                # Users changed again while sorting stay pending.
+                if self._pending.get(id) == change:
+                    del self._pending[id]
+            self._reranking = False
+
+    def _rerank_if_needed(self):
+        if time.monotonic() - self._snapshot.time < config.SEARCH_INDEX_RERANK_INTERVAL:
+            return
+        with self._lock:
+            if self._reranking:
+                return
+            self._reranking = True
+        # Sorting a big index takes a while, searches keep using the current one meanwhile.
+        threading.Thread(target=self.rerank, daemon=True).start()
+
+    def _scan(self, snapshot: _Snapshot, search: str, excluded) -> iter:
+        """
+        Ids of the sorted part of the index matching the search, in rank order.
+        """
+        ranked = snapshot.ranked
+        if search:
+            candidates = -1
+            for character in set(search):
+                candidates &= snapshot.postings.get(character, 0)
+            if not candidates:
+                return
+            bitmap = candidates.to_bytes((len(ranked) + 7) // 8, "little")
+            ranks = (match.start() * 8 + bit for match in _NON_ZERO_BYTE.finditer(bitmap) for bit in range(8)
+                     if bitmap[match.start()] >> bit & 1)
+            candidates = (ranked[rank] for rank in ranks)
+        else:
+            candidates = ranked
+        for id in candidates:
+            if id not in excluded and is_subsequence(search, self._search_names[id]):
+                yield id
+
+    def search(self, search: str, id: int, followed: set, offset: int, row_count: int, after: dict = None) -> [dict]:
+        """
+        Search users by name. Same ranking as the SQL search : users followed first, then by number of followers and
+        name.
+        :param search: Search string.
+        :param id: Id of the user searching, never part of the results.
+        :param followed: Ids of the users followed by the user searching.
+        :param offset: Number of results to skip.
+        :param row_count: Number of results to return.
+        :param after: Only return the results ranked after this position (followed, followers, name and id).
+        :return: The results (id, username, name, followers, followed and picture_version).
+        """
+        self._rerank_if_needed()
+        search = fold(search)
+        snapshot = self._snapshot
+        pending = set(self._pending)
+
+        followed_results = sorted((i for i in followed if i in self._search_names and
+                                   is_subsequence(search, self._search_names[i])), key=self._key)
+        excluded = followed | {id}
+        pending_results = sorted((i for i in pending if i not in excluded and
+                                  is_subsequence(search, self._search_names[i])), key=self._key)
+        others = heapq.merge(self._scan(snapshot, search, excluded | pending), pending_results, key=self._key)
+
+        results = itertools.chain(((True, i) for i in followed_results), ((False, i) for i in others))
+        if after is not None:
+            position = (not after["followed"], -after["followers"], fold(after["name"]), after["id"])
+            results = ((is_followed, i) for (is_followed, i) in results
+                       if (not is_followed,) + self._key(i) > position)
+        results = itertools.islice(results, offset, offset + row_count)
+        return [{"id": i, "username": self._usernames[i], "name": self._names[i], "followers": self._followers[i],
+                 "followed": is_followed, "picture_version": self._picture_versions[i]} for (is_followed, i) in results]
+
+index = SearchIndex()
@@ -0,0 +1,295 @@
+import array
+import bisect
+import collections
+import threading
+import config
+from database import query
+
+"""
+In-memory copy of the Follow table, so checking if a user follows another one, listing the users followed or counting
+them doesn't cost a query.
+
+Each direction of the graph (following and followers) is stored as two flat arrays : targets holds the ids of the users
+followed by user 0, then those followed by user 1... each list sorted, and offsets[id] is the position in targets where
+the list of user id begins. Checking an edge is a binary search in one list, a degree is a subtraction. With 4 bytes per
+id an edge costs 8 bytes (both directions), tens of millions of edges fit in a few hundred MB.
+
+These arrays are never modified once built. Edges added afterwards are kept in sets on the side and merged into new
+arrays when there are config.SOCIAL_GRAPH_COMPACTION_THRESHOLD of them.
+
+The graph lives in the memory of the process : every process serving the api loads its own copy at startup (see
+main.py) and only sees the follows made through it. It is only enabled with config.SOCIAL_GRAPH_ENABLED.
+"""
+
+_EMPTY = ()
+
+
+def _typecode(max_value: int) -> str:
+    """
+    Smallest array type code holding values up to max_value.
+    """
+    return "I" if max_value < 2 ** 32 else "Q"
+
+
+def follow_edges() -> iter:
+    """
+    Iterate over every follow relation of the database, sorted by user_id then user_id_followed.
+    :return: Generator of (user_id, user_id_followed) pairs.
+    """
+    last = (0, 0)
+    while True:
+        # Loading by chunks in the order of the primary key, so no chunk needs a sort.
+        chunk = query.fetch_all("""
+        SELECT user_id, user_id_followed FROM Follow
+        WHERE user_id > %(user_id)s OR (user_id = %(user_id)s AND user_id_followed > %(user_id_followed)s)
+        ORDER BY user_id, user_id_followed
+        LIMIT %(row_count)s;
+        """, {"user_id": last[0], "user_id_followed": last[1], "row_count": config.SOCIAL_GRAPH_LOAD_CHUNK_SIZE})
+        for row in chunk:
+            yield row["user_id"], row["user_id_followed"]
+        if len(chunk) < config.SOCIAL_GRAPH_LOAD_CHUNK_SIZE:
+            return
+        last = (chunk[-1]["user_id"], chunk[-1]["user_id_followed"])
+
+
+class Adjacency:
+    """
+    Sorted adjacency lists of one direction of the graph. See the module documentation.
+    """
+
+    def __init__(self, offsets: array.array, targets: array.array):
+        self.offsets = offsets
+        self.targets = targets
+
+    @staticmethod
+    def build(edges, max_id: int) -> "Adjacency":
+        """
+        :param edges: Iterable of (source, target) pairs, sorted by source then target, without duplicates.
+        :param max_id: Highest id of the graph.
+        """
+        counts = array.array("Q", bytes(8 * (max_id + 2)))
+        targets = array.array(_typecode(max_id))
+        for (source, target) in edges:
+            if source + 1 >= len(counts):
+                # User created while loading.
+                counts.extend(array.array("Q", bytes(8 * (source + 2 - len(counts)))))
+            counts[source + 1] += 1
+            targets.append(target)
+        return Adjacency(Adjacency._prefix_sums(counts), targets)
+
+    @staticmethod
+    def _prefix_sums(counts: array.array) -> array.array:
+        total = 0
+        for index in range(len(counts)):
+            total += counts[index]
+            counts[index] = total
+        return array.array(_typecode(total), counts)
+
+    def transpose(self) -> "Adjacency":
+        """
+        The same edges in the other direction.
+        """
+        size = max(len(self.offsets), max(self.targets, default=-2) + 2)
+        counts = array.array("Q", bytes(8 * size))
+        for target in self.targets:
+            counts[target + 1] += 1
+        offsets = Adjacency._prefix_sums(counts)
+        positions = array.array("Q", offsets)
+        targets = array.array(self.targets.typecode, bytes(self.targets.itemsize * len(self.targets)))
+        # Sources are visited in increasing order, so each list of the transposed graph is filled already sorted.
+        for source in range(len(self.offsets) - 1):
+            for index in range(self.offsets[source], self.offsets[source + 1]):
+                target = self.targets[index]
+                targets[positions[target]] = source
+                positions[target] += 1
+        return Adjacency(offsets, targets)
+
+    def bounds(self, id: int) -> (int, int):
+        """
+        Position of the list of a user in targets.
+        """
+        if id + 1 >= len(self.offsets):
+            return 0, 0
+        return self.offsets[id], self.offsets[id + 1]
+
+    def contains(self, source: int, target: int) -> bool:
+        start, end = self.bounds(source)
+        index = bisect.bisect_left(self.targets, target, start, end)
+        return index < end and self.targets[index] == target
+
+    def degree(self, id: int) -> int:
+        start, end = self.bounds(id)
+        return end - start
+
+    def neighbours(self, id: int) -> array.array:
+        start, end = self.bounds(id)
+        return self.targets[start:end]
+
+    def merge(self, added: dict) -> "Adjacency":
+        """
+        New adjacency lists holding these edges and the added ones.
+        :param added: Dictionary mapping a source to the set of targets added.
+        """
+        max_id = max(len(self.offsets) - 2, max(added, default=0), max((max(targets) for targets in added.values()),
+                                                                       default=0))
+        offsets = array.array("Q", bytes(8 * (max_id + 2)))
+        targets = array.array(_typecode(max_id))
+        for source in range(max_id + 1):
+            start, end = self.bounds(source)
+            if source in added:
+                targets.extend(sorted(set(self.targets[start:end]) | added[source]))
+            else:
+                targets.extend(self.targets[start:end])
+            offsets[source + 1] = len(targets)
+        return Adjacency(array.array(_typecode(len(targets)), offsets), targets)
+
+
+def intersection(first, second) -> list:
+    """
+    Ids present in both sorted lists. Each id of the shortest list is searched in the longest one.
+    """
+    if len(first) > len(second):
+        first, second = second, first
+    common = []
+    start = 0
+    for id in first:
+        start = bisect.bisect_left(second, id, start)
+        if start == len(second):
+            break
+        if second[start] == id:
+            common.append(id)
+    return common
+
+
+_Snapshot = collections.namedtuple("_Snapshot", ["following", "followers"])
+
+
+class SocialGraph:
+    """
+    Follow relations between users. See the module documentation.
+    """
+
+    def __init__(self):
+        self._snapshot = _Snapshot(Adjacency(array.array("I"), array.array("I")),
+                                   Adjacency(array.array("I"), array.array("I")))
+        self._added_following = collections.defaultdict(set)
+        self._added_followers = collections.defaultdict(set)
+        self._added = 0
+        self._lock = threading.Lock()
+        self._compacting = False
+        self.loaded = False
+
+    def load(self):
+        """
+        Load every follow relation from the database. Must be called before the graph is used, follows made before it
+        are ignored.
+        """
+        max_id = query.fetch_one("SELECT MAX(id) AS max_id FROM UserTable;")["max_id"] or 0
+        self.replace(follow_edges(), max_id)
+
+    def replace(self, edges, max_id: int):
+        """
+        Replace the content of the graph.
+        :param edges: Iterable of (user_id, user_id_followed) pairs, sorted, without duplicates.
+        :param max_id: Highest user id.
+        """
+        following = Adjacency.build(edges, max_id)
+        followers = following.transpose()
+        with self._lock:
+            self._snapshot = _Snapshot(following, followers)
+            self._added_following.clear()
+            self._added_followers.clear()
+            self._added = 0
+        self.loaded = True
+
+    def add(self, user_id: int, user_id_followed: int):
+        """
+        Add a follow relation, once it is in the database.
+        """
+        if not self.loaded:
+            return
+        with self._lock:
+            self._added_following[user_id].add(user_id_followed)
+            self._added_followers[user_id_followed].add(user_id)
+            self._added += 1
+            if self._added < config.SOCIAL_GRAPH_COMPACTION_THRESHOLD or self._compacting:
+                return
+            self._compacting = True
+        # Merging takes a while, the graph can be used meanwhile.
+        threading.Thread(target=self.compact, daemon=True).start()
+
+    def compact(self):
+        """
+        Merge the edges added since the graph was built into new arrays.
+        """
+        with self._lock:
+            added_following = {id: set(targets) for (id, targets) in self._added_following.items()}
+            added_followers = {id: set(targets) for (id, targets) in self._added_followers.items()}
+        snapshot = self._snapshot
+        merged = _Snapshot(snapshot.following.merge(added_following), snapshot.followers.merge(added_followers))
+        with self._lock:
+            # The new arrays are in place before the merged edges leave the sets, so no edge is ever missing.
+            self._snapshot = merged
+            for (added, merged_edges) in ((self._added_following, added_following),
+                                          (self._added_followers, added_followers)):
+                for (id, targets) in merged_edges.items():
+                    added[id] -= targets
+                    if not added[id]:
+                        del added[id]
+            self._added = sum(len(targets) for targets in self._added_following.values())
+            self._compacting = False
+
+    def is_following(self, user_id: int, user_id_followed: int) -> bool:
+        # The added edges are checked first : an edge merged meanwhile is already in the new arrays.
+        if user_id_followed in self._added_following.get(user_id, _EMPTY):
+            return True
+        return self._snapshot.following.contains(user_id, user_id_followed)
+
+    def following(self, id: int) -> list:
+        """
+        Sorted ids of the users followed by a user.
+        """
+        with self._lock:
+            added = set(self._added_following.get(id, _EMPTY))
+        following = self._snapshot.following.neighbours(id)
+        return sorted(set(following) | added) if added else list(following)
+
+    def followers(self, id: int) -> list:
+        """
+        Sorted ids of the followers of a user.
+        """
+        with self._lock:
+            added = set(self._added_followers.get(id, _EMPTY))
+        followers = self._snapshot.followers.neighbours(id)
+        return sorted(set(followers) | added) if added else list(followers)
+
+    def following_count(self, id: int) -> int:
+        return self._snapshot.following.degree(id) + len(self._added_following.get(id, _EMPTY))
+
+    def follower_count(self, id: int) -> int:
+        return self._snapshot.followers.degree(id) + len(self._added_followers.get(id, _EMPTY))
+
+    def followed_among(self, id: int, ids) -> list:
+        """
+        Ids among the given ones of the users followed by a user.
+        """
+        return [i for i in ids if self.is_following(id, i)]
+
+    def common_following(self, first: int, second: int) -> list:
+        """
+        Sorted ids of the users followed by both users.
+        """
+        return intersection(self.following(first), self.following(second))
+
+
+graph = SocialGraph()
+
+
+def is_following(user_id: int, user_id_followed: int) -> bool:
+    """
+    Check if a user follows another one. Answered by the graph when it is enabled, by the database otherwise.
+    """
+    if config.SOCIAL_GRAPH_ENABLED and graph.loaded:
+        return graph.is_following(user_id, user_id_followed)
+    return query.fetch_one("""SELECT 1 FROM Follow WHERE user_id = %s && user_id_followed = %s;""",
+                           (user_id, user_id_followed)) is not None
@@ -0,0 +1,135 @@
+import array
+import multiprocessing
+import sys
+import numpy
+import scipy.sparse
+import config
+import database.mysql_connection
+import social_graph
+from database import query
+
+"""
+"People you may know" suggestions : the users followed by the users someone follows, ranked by how many of the users
+they follow follow them. Computing this live would join Follow with itself for every request, so it is computed by this
+batch job and stored in the Suggestion table, where the api reads it with one query.
+
+The follow graph is loaded in a sparse adjacency matrix A (A[i, j] = 1 when user i follows user j). Row i of A @ A
+counts, for each user j, the number of users followed by i who follow j. The product is computed by chunks of
+config.SUGGESTION_CHUNK_SIZE rows, in parallel in config.SUGGESTION_PROCESSES processes, and each chunk is written as
+soon as it is computed. The best config.SUGGESTION_COUNT users of each row, not already followed, are kept.
+
+Usage (from the "Back End" directory) :
+    python -m suggestions [database name]
+"""
+
+INSERT_CHUNK_SIZE = 1000
+"""
+Number of suggestions inserted per statement.
+"""
+
+_adjacency = None
+"""
+Adjacency matrix used by the processes computing the suggestions (see _init_worker()).
+"""
+
+
+def adjacency_matrix(edges, max_id: int) -> scipy.sparse.csr_matrix:
+    """
+    Sparse adjacency matrix of the follow graph.
+    :param edges: Iterable of (user_id, user_id_followed) pairs, without duplicates.
+    :param max_id: Highest user id.
+    """
+    sources = array.array("q")
+    targets = array.array("q")
+    for (source, target) in edges:
+        sources.append(source)
+        targets.append(target)
+    sources = numpy.frombuffer(sources, dtype=numpy.int64)
+    targets = numpy.frombuffer(targets, dtype=numpy.int64)
+    # Users created while loading may be above max_id.
+    size = max(max_id, sources.max(initial=0), targets.max(initial=0)) + 1
+    return scipy.sparse.csr_matrix((numpy.ones(len(sources), dtype=numpy.int32), (sources, targets)),
+                                   shape=(size, size))
+
+
+def top_suggestions(adjacency: scipy.sparse.csr_matrix, first: int, last: int, count: int) -> tuple:
+    """
+    Compute the suggestions of the users whose id is between first (included) and last (excluded).
+    :param count: Maximum number of suggestions per user.
+    :return: Four arrays of the same length : the user ids, the positions of the suggestions (0 for the best one), the
+    ids of the users suggested and their scores (number of users followed who follow them).
+    """
+    following = adjacency[first:last]
+    scores = following @ adjacency
+    # Users already followed are not suggested.
+    scores = (scores - scores.multiply(following)).tocoo()
+    users = scores.row.astype(numpy.int64) + first
+    suggested = scores.col.astype(numpy.int64)
+    keep = (scores.data > 0) & (users != suggested)
+    users, suggested, score = users[keep], suggested[keep], scores.data[keep]
+
+    # Sorted by user, then best score first, then id. The position of a suggestion is its index minus the index of the
+    # first suggestion of the same user.
+    order = numpy.lexsort((suggested, -score, users))
+    users, suggested, score = users[order], suggested[order], score[order]
+    positions = numpy.arange(len(users)) - numpy.searchsorted(users, users)
+    keep = positions < count
+    return users[keep], positions[keep], suggested[keep], score[keep]
+
+
+def _init_worker(adjacency: scipy.sparse.csr_matrix):
+    global _adjacency
+    _adjacency = adjacency
+
+
+def _compute_chunk(bounds: (int, int)) -> tuple:
+    return bounds + top_suggestions(_adjacency, bounds[0], bounds[1], config.SUGGESTION_COUNT)
+
+
+def write_chunk(first: int, last: int, users, positions, suggested, scores):
+    """
+    Replace the suggestions of the users whose id is between first (included) and last (excluded).
+    """
+    rows = list(zip(users.tolist(), positions.tolist(), suggested.tolist(), scores.tolist()))
+    with query.transaction():
+        query.execute("""DELETE FROM Suggestion WHERE user_id >= %s AND user_id < %s;""", (first, last))
+        for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+            chunk = rows[start:start + INSERT_CHUNK_SIZE]
+            query.execute(f"""
+            INSERT INTO Suggestion (user_id, position, user_id_suggested, score)
+            VALUES {", ".join(["(%s, %s, %s, %s)"] * len(chunk))};
+            """, [value for row in chunk for value in row], prepared=len(chunk) == INSERT_CHUNK_SIZE)
+
+
+def compute() -> int:
+    """
+    Compute the suggestions of every user and replace the content of the Suggestion table with them.
+    :return: Number of suggestions written.
+    """
+    max_id = query.fetch_one("SELECT MAX(id) AS max_id FROM UserTable;")["max_id"] or 0
+    adjacency = adjacency_matrix(social_graph.follow_edges(), max_id)
+    database.mysql_connection.release_connection()
+
+    chunks = [(first, min(first + config.SUGGESTION_CHUNK_SIZE, adjacency.shape[0]))
+              for first in range(0, adjacency.shape[0], config.SUGGESTION_CHUNK_SIZE)]
+    written = 0
+    with multiprocessing.Pool(config.SUGGESTION_PROCESSES, initializer=_init_worker, initargs=(adjacency,)) as pool:
+        # The chunks are written by this process while the next ones are computed.
+        for (first, last, users, positions, suggested, scores) in pool.imap(_compute_chunk, chunks):
+            write_chunk(first, last, users, positions, suggested, scores)
+            written += len(users)
+    # Users created after max_id was read have no suggestions yet, old ones must not stay.
+    query.execute("""DELETE FROM Suggestion WHERE user_id >= %s;""", (adjacency.shape[0],))
+    return written
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        database.mysql_connection.pool = database.mysql_connection.create_pool(sys.argv[1])
+    else:
+        database.mysql_connection.pool = database.mysql_connection.create_pool()
+    try:
+        print(f"{compute()} suggestion(s) written.")
+    finally:
+        database.mysql_connection.release_connection()
+        database.mysql_connection.pool.close()
@@ -1,5 +1,4 @@
-import database.mysql_connection
-import database.request_utils
+import database.query
 import errors
 
 
@@ -24,16 +23,34 @@ class Tag:
         """
         Save this object in the Tag table.
         :param post_id:
+
+        :raise UserNotExisting:
         """
-        if not database.request_utils.user_existing(self.user_id):
+        if not Tag.save_many(post_id, [self]):
             raise errors.UserNotExisting
-        query = f"""
-        INSERT INTO Tag
-        VALUES({post_id}, {self.user_id}, {self.pos_x}, {self.pos_y}); 
+
+    @staticmethod
+    def save_many(post_id: int, tags: list) -> list:
+        """
+        Save several tags of a post with one INSERT. Tags of users not existing are skipped.
+        :param post_id:
+        :param tags: Tags to save.
+        :return: The tags saved.
         """
-        cursor = database.mysql_connection.cnx.cursor(dictionary=True)
-        cursor.execute(query)
-        cursor.close()
+        if not tags:
+            return []
+        ids = list({i.user_id for i in tags})
+        # The number of ids changes from one post to the other, not worth prepared statements.
+        existing = {row["id"] for row in database.query.fetch_all(f"""
+        SELECT id FROM UserTable WHERE id IN ({database.query.placeholders(len(ids))});
+        """, ids, prepared=False)}
+        saved = [i for i in tags if i.user_id in existing]
+        if saved:
+            database.query.execute(f"""
+            INSERT INTO Tag (post_id, user_id, x_pos, y_pos)
+            VALUES {", ".join(["(%s, %s, %s, %s)"] * len(saved))};
+            """, [value for i in saved for value in (post_id, i.user_id, i.pos_x, i.pos_y)], prepared=False)
+        return saved
 
     def __eq__(self, other):
         try:
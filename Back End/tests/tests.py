@@ -4,17 +4,34 @@ import unittest
 import database.connection_credentials
 import mysql.connector
 import user
+import post
+import tag
+import hashing
 import os
 import config
 import database.request_utils
+import database.query
+import database.instrumentation
+import database.reconcile_counters
+import database.backfill_timelines
+import search_cache
+import search_index
+import social_graph
+import suggestions
+import timeline
+import media_pipeline
+import images
+import profile
+import cache
 import shutil
 import database.mysql_connection
 import errors
 import main
-from PIL import Image
+from PIL import Image, ImageChops, ImageStat
 import json
 import random
 import datetime
+import time
 from errors import *
 
 default_hash = "hash"
@@ -140,6 +157,10 @@ class Database:
 
         add_follow_query = f"""INSERT INTO Follow VALUES ({user_id}, {user_id_followed});"""
         self.cursor.execute(add_follow_query)
+        # The api keeps the counters up to date, so must the tests.
+        self.cursor.execute(f"""UPDATE UserTable SET following_count = following_count + 1 WHERE id = {user_id};""")
+        self.cursor.execute(
+            f"""UPDATE UserTable SET follower_count = follower_count + 1 WHERE id = {user_id_followed};""")
 
     def add_default_user(self, token: str = None, refresh_token: str = None) -> int:
         """
@@ -171,6 +192,18 @@ class Database:
             if index == 1:
                 post_id = i.fetchall()[0]["post_id"]
             index += 1
+        self.cursor.execute(f"""UPDATE UserTable SET post_count = post_count + 1 WHERE id = {user_id};""")
+        return post_id
+
+    def processing_post(self, user_id: int, age: int = 0) -> int:
+        """
+        Add a post whose image is still being processed DIRECTLY into the database.
+        :param age: Number of seconds since the post was created.
+        """
+        self.cursor.execute(f"""INSERT INTO Post (user_id, post_time, status)
+                            VALUES ({user_id}, NOW() - INTERVAL {age} SECOND, "processing");""")
+        post_id = self.cursor.lastrowid
+        self.cursor.execute(f"""UPDATE UserTable SET post_count = post_count + 1 WHERE id = {user_id};""")
         return post_id
 
     def get_id(self, default : bool, id : int = None):
@@ -185,6 +218,7 @@ class Database:
         user_id = self.get_id(default, user_id)
         add_like_query = f"""INSERT INTO LikeTable (user_id, post_id) VALUES ({user_id}, {post_id});"""
         self.cursor.execute(add_like_query)
+        self.cursor.execute(f"""UPDATE Post SET like_count = like_count + 1 WHERE id = {post_id};""")
 
 class API:
     """
@@ -293,7 +327,7 @@ class API:
         return code, content
 
     def post(self, default: bool, file: tuple, caption=None, tag: dict = None,
-             token: str = None) -> tuple:
+             token: str = None, wait: bool = True) -> tuple:
         """
         Post a picture.
 
@@ -304,6 +338,7 @@ class API:
         :param tag: Tag to register with the picture.
         :param token: If the default option is set to false then this is the token that goes with the username of the
         account to use for posting.
+        :param wait: Wait for the image to be processed.
         :return:
         """
         authorization = self.get_token(default, token)
@@ -314,6 +349,8 @@ class API:
             headers={"Authorization": authorization},
             file=file
         )
+        if wait:
+            media_pipeline.shutdown()
         return code, content
 
     def search(self, default: bool, search: str, offset: int, row_count: int, token: str = None) -> tuple:
@@ -327,6 +364,17 @@ class API:
         )
         return code, content
 
+    def search_page(self, default: bool, search: str, row_count: int, cursor: str, token: str = None) -> tuple:
+        authorization = self.get_token(default, token)
+
+        code, content = self.ex_request(
+            method="GET",
+            route="/user/search",
+            params={"rowCount": row_count, "search": search, "cursor": cursor},
+            headers={"Authorization": authorization}
+        )
+        return code, content
+
     def follow(self, default: bool, id_followed: int, token: str = None):
         authorization = self.get_token(default, token)
 
@@ -334,6 +382,41 @@ class API:
                                         headers={"Authorization": authorization})
         return code, content
 
+    def follow_batch(self, default: bool, ids: list, token: str = None):
+        authorization = self.get_token(default, token)
+
+        code, content = self.ex_request("POST", route="/user/follow/batch", params={"ids": json.dumps(ids)},
+                                        headers={"Authorization": authorization})
+        return code, content
+
+    def feed(self, default: bool, row_count: int, cursor: str = None, token: str = None):
+        authorization = self.get_token(default, token)
+        params = {"rowCount": row_count}
+        if cursor:
+            params["cursor"] = cursor
+
+        code, content = self.ex_request("GET", route="/user/feed", params=params,
+                                        headers={"Authorization": authorization})
+        return code, content
+
+    def suggestions(self, default: bool, row_count: int, token: str = None):
+        authorization = self.get_token(default, token)
+
+        code, content = self.ex_request("GET", route="/user/suggestions", params={"rowCount": row_count},
+                                        headers={"Authorization": authorization})
+        return code, content
+
+    def follow_list(self, default: bool, id: int, relation: str, row_count: int, cursor: str = None,
+                    token: str = None):
+        authorization = self.get_token(default, token)
+        params = {"rowCount": row_count}
+        if cursor:
+            params["cursor"] = cursor
+
+        code, content = self.ex_request("GET", route=f"/user/{id}/{relation}", params=params,
+                                        headers={"Authorization": authorization})
+        return code, content
+
     def refresh_token(self, refresh_token: str) -> (int, dict):
         """
         Refresh the token by using the dedicated endpoint.
@@ -352,15 +435,29 @@ class API:
                                                 "name": name}, file=image)
         return code, content
 
-    def profile_picture(self, id: int):
+    def profile_picture(self, id: int, size: int = None, accept: str = None):
         """
         Get the profile picture for this user's id.
         :param id:
+        :param size: Size of the picture wanted.
+        :param accept: Accept header, the image formats accepted.
         :return:
         """
-        code, content = self.ex_request("GET", route=f"/user/{id}/profile/picture")
+        params = {"size": size} if size else None
+        headers = {"Accept": accept} if accept else None
+        code, content = self.ex_request("GET", route=f"/user/{id}/profile/picture", params=params, headers=headers)
         return code, content
 
+    def post_image(self, default: bool, post_id: int, size: int = None, headers: dict = None, token: str = None):
+        """
+        Get the image of a post.
+        :param headers: Other request headers (If-None-Match, Range...).
+        :return: The response, for its headers.
+        """
+        headers = dict(headers or {}, Authorization=self.get_token(default, token))
+        params = {"size": size} if size else {}
+        return self.client.open(f"/media/{post_id}/image", query_string=params, method="GET", headers=headers)
+
     def get_profile(self, id: int):
         code, content = self.ex_request("GET", route=f"/user/{id}/profile/data")
         return code, content
@@ -426,19 +523,29 @@ class Tests(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
         create_db()
+        database.mysql_connection.pool = database.mysql_connection.create_pool("BestagramTest")
+
+    @classmethod
+    def tearDownClass(cls):
+        database.mysql_connection.release_connection()
+        database.mysql_connection.pool.close()
+        hashing.shutdown()
+        media_pipeline.shutdown()
+        timeline.shutdown()
 
     def setUp(self) -> None:
         main.app.testing = True
         self.client = main.app.test_client()
 
-        database.mysql_connection.cnx = mysql.connector.connect(
+        # The tests use their own connection so they never take one from the pool used by the api.
+        self.cnx = mysql.connector.connect(
             user=database.connection_credentials.databaseUserName,
             password=database.connection_credentials.password,
             host=database.connection_credentials.host,
             database="BestagramTest",
             use_pure=True)
-        database.mysql_connection.cnx.autocommit = True
-        self.cursor = database.mysql_connection.cnx.cursor(dictionary=True)
+        self.cnx.autocommit = True
+        self.cursor = self.cnx.cursor(dictionary=True)
 
         self.database = Database(self.cursor)
         self.api = API(cursor=self.cursor, client=self.client, database=self.database)
@@ -592,6 +699,25 @@ class Tests(unittest.TestCase):
         self.assertNotEqual(default_hash, user_data["hash"])
         self.assertEqual(default_email, user_data["email"])
 
+    def test_GivenNoUserWhenRegisteringThenOnlyOneStatementIsExecutedAndTokenIsUsable(self):
+        # Given no user.
+
+        # When registering.
+        database.instrumentation.start()
+        new_user = user.User.create(username=default_username, name=default_name, hash=default_hash,
+                                    email=default_email)
+        recording = database.instrumentation.stop()
+        database.mysql_connection.release_connection()
+
+        # Then only one statement is executed and token is usable.
+        self.assertEqual(1, recording.count)
+        success, user_data = user_in_db(cursor=self.cursor, username=default_username)
+        self.assertTrue(success)
+        self.assertEqual(new_user.id, user_data["id"])
+        self.assertEqual(new_user.refresh_token, user_data["refresh_token"])
+        code, content = self.api.search(default=False, search="", offset=0, row_count=10, token=new_user.token)
+        self.assertEqual(200, code)
+
     def test_GivenNoUserWhenRegisteringWithInvalidEmailThenIsNotCreatedAndRaiseInvalidEmail(self):
         # Given no user.
 
@@ -727,7 +853,7 @@ class Tests(unittest.TestCase):
         # Then is successful and created in correct size.
         self.assertEqual(code, 200)
         self.assertEqual(True, content["success"])
-        new_im = Image.open(f"""Medias/image/{id}/{content["id"]}.png""")
+        new_im = Image.open(f"""Medias/image/{id}/{content["id"]}.jpg""")
         self.assertEqual(new_im.size, (config.IMAGE_DIMENSION, config.IMAGE_DIMENSION))
         new_im.close()
 
@@ -742,7 +868,7 @@ class Tests(unittest.TestCase):
         # Then is successful and created in correct size.
         self.assertEqual(code, 200)
         self.assertEqual(True, content["success"])
-        new_im = Image.open(f"""Medias/image/{id}/{content["id"]}.png""")
+        new_im = Image.open(f"""Medias/image/{id}/{content["id"]}.jpg""")
         self.assertEqual(new_im.size, (config.IMAGE_DIMENSION, config.IMAGE_DIMENSION))
         new_im.close()
 
@@ -757,10 +883,124 @@ class Tests(unittest.TestCase):
         # Then is successful and created in correct size.
         self.assertEqual(code, 200)
         self.assertEqual(True, content["success"])
-        new_im = Image.open(f"""Medias/image/{id}/{content["id"]}.png""")
+        new_im = Image.open(f"""Medias/image/{id}/{content["id"]}.jpg""")
         self.assertEqual(new_im.size, (config.IMAGE_DIMENSION, config.IMAGE_DIMENSION))
         new_im.close()
 
+    def test_GivenImagePostedWhenCreatingPostThenProcessingUntilImageWritten(self):
+        id = self.database.add_default_user()
+
+        code, content = self.api.post(default=True, file=self.image_landscape_big, wait=False)
+        self.assertEqual(200, code)
+        self.assertEqual(media_pipeline.PROCESSING, content["status"])
+        media_pipeline.shutdown()
+
+        self.cursor.execute(f"""SELECT status FROM Post WHERE id = {content["id"]};""")
+        self.assertEqual(media_pipeline.READY, self.cursor.fetchall()[0]["status"])
+        new_im = Image.open(f"""Medias/image/{id}/{content["id"]}.jpg""")
+        self.assertEqual(new_im.size, (config.IMAGE_DIMENSION, config.IMAGE_DIMENSION))
+        new_im.close()
+        self.assertEqual([], os.listdir(media_pipeline.SPOOL_DIRECTORY))
+
+    def test_GivenFileNotAnImageWhenPostingThenPostFailedAndNotInFeed(self):
+        self.database.add_default_user()
+
+        code, content = self.api.post(default=True, file=(io.BytesIO(b"not an image"), "image.png"))
+        timeline.shutdown()
+
+        self.cursor.execute(f"""SELECT status FROM Post WHERE id = {content["id"]};""")
+        self.assertEqual(media_pipeline.FAILED, self.cursor.fetchall()[0]["status"])
+        self.assertEqual(0, user_in_db(self.cursor, default_username)[1]["post_count"])
+        code, content = self.api.feed(default=True, row_count=10)
+        self.assertEqual([], content["result"])
+
+    def test_GivenUnexpectedErrorWhenProcessingImageThenPostFailedAndNotCounted(self):
+        id = self.database.add_default_user()
+        post_id = self.database.processing_post(id)
+
+        # Not a path : neither Pillow nor os.remove() raise an OSError.
+        media_pipeline._process_job(post_id, id, None, None, f"Medias/image/{id}/{post_id}")
+
+        self.cursor.execute(f"""SELECT status FROM Post WHERE id = {post_id};""")
+        self.assertEqual(media_pipeline.FAILED, self.cursor.fetchall()[0]["status"])
+        self.assertEqual(0, user_in_db(self.cursor, default_username)[1]["post_count"])
+
+    def test_GivenProcessingLostWhenSweepingThenOldPostsFailedAndOldUploadsRemoved(self):
+        id = self.database.add_default_user()
+        lost_post_id = self.database.processing_post(id, age=config.MEDIA_PROCESSING_TIMEOUT + 60)
+        recent_post_id = self.database.processing_post(id)
+        lost_upload = media_pipeline.spool(io.BytesIO(b"upload"))
+        old = time.time() - config.MEDIA_PROCESSING_TIMEOUT - 60
+        os.utime(lost_upload, (old, old))
+        recent_upload = media_pipeline.spool(io.BytesIO(b"upload"))
+
+        media_pipeline.sweep()
+        database.mysql_connection.release_connection()
+
+        self.cursor.execute(f"""SELECT status FROM Post WHERE id IN ({lost_post_id}, {recent_post_id})
+                            ORDER BY id;""")
+        self.assertEqual([media_pipeline.FAILED, media_pipeline.PROCESSING],
+                         [row["status"] for row in self.cursor.fetchall()])
+        self.assertEqual(1, user_in_db(self.cursor, default_username)[1]["post_count"])
+        self.assertFalse(os.path.exists(lost_upload))
+        self.assertTrue(os.path.exists(recent_upload))
+        os.remove(recent_upload)
+
+    def test_GivenImagePostedWhenProcessedThenStoredInEachSize(self):
+        id = self.database.add_default_user()
+
+        code, content = self.api.post(default=True, file=self.image_portrait)
+
+        path = f"""Medias/image/{id}/{content["id"]}"""
+        for size in config.IMAGE_SIZES:
+            with Image.open(images.sized_path(path, size, config.IMAGE_SIZES) + ".jpg") as image:
+                self.assertEqual((size, size), image.size)
+        formats = images.stored_formats(transparent=False)
+        self.assertEqual(len(config.IMAGE_SIZES) * len(formats), len(os.listdir(f"Medias/image/{id}")))
+
+    def test_GivenPostedImageWhenGettingItAgainWithEtagOrRangeThenNotModifiedOrPartial(self):
+        self.database.add_default_user()
+        code, content = self.api.post(default=True, file=self.image_square)
+
+        response = self.api.post_image(default=True, post_id=content["id"], size=320)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual((320, 320), Image.open(io.BytesIO(response.data)).size)
+        self.assertIn("Accept", response.headers["Vary"])
+
+        headers = {"If-None-Match": response.headers["ETag"]}
+        not_modified = self.api.post_image(default=True, post_id=content["id"], size=320, headers=headers)
+        self.assertEqual(304, not_modified.status_code)
+        self.assertEqual(b"", not_modified.data)
+
+        partial = self.api.post_image(default=True, post_id=content["id"], size=320, headers={"Range": "bytes=0-99"})
+        self.assertEqual(206, partial.status_code)
+        self.assertEqual(response.data[:100], partial.data)
+
+    def test_GivenPostProcessingWhenGettingImageThenImageNotAvailable(self):
+        post_id = self.database.post(default=True)
+        self.cursor.execute(f"""UPDATE Post SET status = 'processing' WHERE id = {post_id};""")
+
+        response = self.api.post_image(default=True, post_id=post_id)
+
+        self.assertEqual(ImageNotAvailable.get_response(), (response.get_json(), response.status_code))
+
+    def test_GivenJpegImageWhenResizingThenDecodedSmallerAndSameAsFullResize(self):
+        jpeg = io.BytesIO()
+        with Image.open("1280-1920.png") as image:
+            image.convert("RGB").save(jpeg, format="JPEG")
+        with Image.open(jpeg) as image:
+            image.load()
+            expected = image.resize((150, 150), box=images.crop_box(image.size))
+
+        with Image.open(jpeg) as image:
+            resized = images.resize_image(image, 150)
+            # Decoded at 1/8 of its size, the smallest side still above 150 pixels.
+            self.assertEqual((160, 240), image.size)
+
+        self.assertEqual((150, 150), resized.size)
+        difference = ImageStat.Stat(ImageChops.difference(resized, expected)).mean
+        self.assertLess(max(difference), 4)
+
     def test_GivenPostingImageWhenRetrievingImageDataFromDatabaseThenIsCorrectData(self):
         # Given posting image.
         caption = "this is a caption"
@@ -838,6 +1078,21 @@ class Tests(unittest.TestCase):
         self.assertEqual(True, content["success"])
         self.assertEqual(1, len(result))
 
+    def test_GivenTagsOfExistingAndMissingUsersWhenSavingManyThenExistingSavedWithTwoQueries(self):
+        post_id = self.database.post(default=True)
+        ids = [self.database.add_user() for i in range(3)]
+        tags = [tag.Tag(user_id=id, pos_x=0.5, pos_y=0.5) for id in ids + [max(ids) + 1000]]
+
+        database.instrumentation.start()
+        saved = tag.Tag.save_many(post_id, tags)
+        recording = database.instrumentation.stop()
+        database.mysql_connection.release_connection()
+
+        self.assertEqual(ids, [i.user_id for i in saved])
+        self.assertEqual(2, recording.count)
+        self.cursor.execute(f"""SELECT user_id FROM Tag WHERE post_id = {post_id};""")
+        self.assertEqual(sorted(ids), sorted(row["user_id"] for row in self.cursor.fetchall()))
+
     """    
     --------------------------
     Search test
@@ -977,6 +1232,133 @@ class Tests(unittest.TestCase):
         for i in range(len(people_not_followed)):
             self.assertEqual(people_not_followed[i], content["result"][str(i + len(people_followed))]["username"])
 
+    def add_followed_and_not_followed_users(self):
+        for i in range(3):
+            self.database.follow(default=True, user_id_followed=self.database.add_user())
+        for i in range(5):
+            self.database.add_user()
+
+    def test_GivenFollowedAndNotFollowedUsersWhenSearchingPageByPageWithOffsetThenEveryUserReturnedOnce(self):
+        self.add_followed_and_not_followed_users()
+        code, content = self.api.search(default=True, search="", offset=0, row_count=100)
+        expected = [element["id"] for element in content["result"].values()]
+
+        # Without the typeahead cache, then with it.
+        for cache_candidates in (0, config.SEARCH_CACHE_CANDIDATES):
+            search_cache.searches.clear()
+            config.SEARCH_CACHE_CANDIDATES, candidates = cache_candidates, config.SEARCH_CACHE_CANDIDATES
+            results = []
+            try:
+                for offset in range(0, 8, 3):
+                    code, content = self.api.search(default=True, search="", offset=offset, row_count=3)
+                    results += [element["id"] for element in content["result"].values()]
+            finally:
+                config.SEARCH_CACHE_CANDIDATES = candidates
+
+            self.assertEqual(8, len(expected))
+            self.assertEqual(expected, results)
+
+    def test_GivenFollowedAndNotFollowedUsersWhenSearchingPageByPageWithCursorThenEveryUserReturnedOnce(self):
+        self.add_followed_and_not_followed_users()
+        code, content = self.api.search(default=True, search="", offset=0, row_count=100)
+        expected = content["result"]
+
+        # Without the typeahead cache, then with it.
+        for cache_candidates in (0, config.SEARCH_CACHE_CANDIDATES):
+            search_cache.searches.clear()
+            config.SEARCH_CACHE_CANDIDATES, candidates = cache_candidates, config.SEARCH_CACHE_CANDIDATES
+            results = {}
+            cursor = ""
+            try:
+                while cursor is not None:
+                    code, content = self.api.search_page(default=True, search="", row_count=3, cursor=cursor)
+                    self.assertEqual(200, code)
+                    results.update(content["result"])
+                    cursor = content["nextCursor"]
+            finally:
+                config.SEARCH_CACHE_CANDIDATES = candidates
+
+            self.assertEqual(8, len(expected))
+            self.assertEqual(expected, results)
+
+    def test_GivenInvalidCursorWhenSearchingThenRaiseInvalidCursor(self):
+        code, content = self.api.search_page(default=True, search="", row_count=3, cursor="invalid")
+
+        self.assertEqual(400, code)
+        self.assertEqual(InvalidCursor.get_response()[0], content)
+
+    def test_GivenSearchCachedWhenSearchingLongerStringThenAnsweredWithoutQuery(self):
+        for name in ["abc", "abd", "xbc", "acb"]:
+            self.database.add_user(username=name, name=name)
+        self.database.add_default_user()
+        viewer = user.User(username=default_username, hash=default_hash)
+
+        first = viewer.search_for("a", offset=0, row_count=10)
+        database.instrumentation.start()
+        second = viewer.search_for("ab", offset=0, row_count=10)
+        third = viewer.search_for("abc", offset=0, row_count=10)
+        recording = database.instrumentation.stop()
+        database.mysql_connection.release_connection()
+
+        self.assertEqual(3, len(first))
+        self.assertEqual(0, recording.count)
+        self.assertEqual(["abc", "abd", "acb"], sorted(element["username"] for element in second.values()))
+        self.assertEqual(["abc"], [element["username"] for element in third.values()])
+
+    def test_GivenSearchCachedWhenFollowingThenCacheInvalidated(self):
+        followed_id = self.database.add_user(username="abc", name="abc")
+        self.database.add_default_user()
+        viewer = user.User(username=default_username, hash=default_hash)
+        viewer.search_for("a", offset=0, row_count=10)
+
+        viewer.follow(followed_id)
+        database.instrumentation.start()
+        viewer.search_for("ab", offset=0, row_count=10)
+        recording = database.instrumentation.stop()
+        database.mysql_connection.release_connection()
+
+        self.assertGreater(recording.count, 0)
+
+    def test_GivenSearchIndexWhenSearchingThenSameResultsAsDatabase(self):
+        names = ["ABRACADABRA", "abcpopo", "_ab_c_", "cba", "amazing bullet", "peopalebfjskchdy", "zorro"]
+        for name in names:
+            self.database.add_user(username=name, name=name)
+        self.database.follow(default=True, username_followed="abcpopo")
+        self.database.follow(default=False, username_followed="_ab_c_", username="zorro")
+        searches = ["", "abc", "a", "zz"]
+        expected = [self.api.search(default=True, search=search, offset=0, row_count=100)[1] for search in searches]
+
+        search_index.index.load()
+        database.mysql_connection.release_connection()
+        config.SEARCH_INDEX_ENABLED = True
+        try:
+            results = [self.api.search(default=True, search=search, offset=0, row_count=100)[1] for search in searches]
+        finally:
+            config.SEARCH_INDEX_ENABLED = False
+            search_index.index = search_index.SearchIndex()
+
+        self.assertEqual(expected, results)
+
+    def test_GivenSearchIndexWhenUserRegisteredOrRenamedThenFoundWithoutReloading(self):
+        self.database.add_default_user()
+        search_index.index.load()
+        database.mysql_connection.release_connection()
+        config.SEARCH_INDEX_ENABLED = True
+        try:
+            self.api.register(username="new_user", name="abcdef", email="new.user@bestagram.com")
+            new_user = search_index.index.search("bdf", id=0, followed=set(), offset=0, row_count=10)
+            search_index.index.rename(new_user[0]["id"], name="xyz")
+            renamed_user = search_index.index.search("xz", id=0, followed=set(), offset=0, row_count=10)
+            old_name = search_index.index.search("bdf", id=0, followed=set(), offset=0, row_count=10)
+        finally:
+            config.SEARCH_INDEX_ENABLED = False
+            search_index.index = search_index.SearchIndex()
+
+        self.assertEqual(1, len(new_user))
+        self.assertEqual("new_user", new_user[0]["username"])
+        self.assertEqual(new_user[0]["id"], renamed_user[0]["id"])
+        self.assertEqual([], old_name)
+
     """
     --------------------------
     Follow Tests
@@ -1038,6 +1420,68 @@ class Tests(unittest.TestCase):
         result = self.cursor.fetchall()
         self.assertEqual(1, len(result))
 
+    def test_GivenUsersWhenFollowingThemInBatchThenNewOnesFollowedAndOthersSkipped(self):
+        user_id = self.database.add_default_user()
+        already_followed = self.database.add_user()
+        self.database.follow(default=True, user_id_followed=already_followed)
+        new_ids = [self.database.add_user() for i in range(3)]
+        not_existing = max(new_ids) + 100
+
+        code, content = self.api.follow_batch(default=True, ids=new_ids + [already_followed, not_existing])
+
+        self.assertEqual(200, code, content)
+        self.assertTrue(content["success"])
+        self.assertEqual(new_ids, content["followed"])
+        self.assertEqual([already_followed], content["alreadyFollowed"])
+        self.assertEqual([not_existing], content["notExisting"])
+        self.cursor.execute(f"""SELECT user_id_followed FROM Follow WHERE user_id = {user_id};""")
+        followed = sorted(row["user_id_followed"] for row in self.cursor.fetchall())
+        self.assertEqual(sorted(new_ids + [already_followed]), followed)
+        self.assertEqual(4, self.get_user_row(user_id)["following_count"])
+        for id in new_ids:
+            self.assertEqual(1, self.get_user_row(id)["follower_count"])
+
+    def test_GivenFollowersWhenListingThemPageByPageThenAllReturnedSortedById(self):
+        followed_id = self.database.add_user()
+        follower_ids = [self.database.add_user() for i in range(5)]
+        for id in follower_ids:
+            self.database.follow(default=False, user_id=id, user_id_followed=followed_id)
+
+        results = []
+        cursor = None
+        for page in range(3):
+            code, content = self.api.follow_list(default=True, id=followed_id, relation="followers", row_count=2,
+                                                 cursor=cursor)
+            self.assertEqual(200, code)
+            results += [element["id"] for element in content["result"]]
+            cursor = content["nextCursor"]
+
+        self.assertEqual(sorted(follower_ids), results)
+        self.assertIsNone(cursor)
+        code, content = self.api.follow_list(default=True, id=follower_ids[0], relation="following", row_count=10)
+        self.assertEqual([followed_id], [element["id"] for element in content["result"]])
+
+    def test_GivenPrivateAccountNotFollowedWhenListingFollowersThenRaiseProfileAccessRestricted(self):
+        private_id = self.database.add_user()
+        self.cursor.execute(f"""UPDATE UserTable SET public_profile = FALSE WHERE id = {private_id};""")
+
+        code, content = self.api.follow_list(default=True, id=private_id, relation="followers", row_count=10)
+        self.assertEqual(400, code)
+        self.assertEqual(errors.ProfileAccessRestricted.get_response()[0], content)
+
+        self.database.follow(default=True, user_id_followed=private_id)
+        code, content = self.api.follow_list(default=True, id=private_id, relation="followers", row_count=10)
+        self.assertEqual(200, code)
+        self.assertEqual(1, len(content["result"]))
+
+    def test_GivenTooManyIdsWhenFollowingInBatchThenRaiseBatchTooLarge(self):
+        code, content = self.api.follow_batch(default=True, ids=list(range(1, config.MAX_FOLLOW_BATCH_SIZE + 2)))
+
+        self.assertEqual(400, code)
+        self.assertEqual(errors.BatchTooLarge.get_response()[0], content)
+        self.cursor.execute("""SELECT * FROM Follow;""")
+        self.assertEqual(0, len(self.cursor.fetchall()))
+
     """
     --------------------------
     Profile update tests
@@ -1079,23 +1523,25 @@ class Tests(unittest.TestCase):
         self.assertEqual(content["success"], True)
         path = f'Medias/profile_picture/{id}'
         self.assertFalse(result["use_default_picture"])
-        self.assertTrue(os.path.isfile(path + "/picture.png"))
-        self.assertEqual(1, len(os.listdir(path)))
+        self.assertTrue(os.path.isfile(path + "/picture.jpg"))
+        formats = images.stored_formats(transparent=False)
+        self.assertEqual(len(config.PROFILE_PICTURE_SIZES) * len(formats), len(os.listdir(path)))
 
     def test_GivenProfilePictureWhenUpdatingWithNewProfilePictureThenIsReplacedInFiles(self):
         # Given profile picture.
         id = self.database.add_default_user()
         self.api.set_profile(default=True, image=self.image_landscape_small)
         path = f"Medias/profile_picture/{id}"
-        first_image = Image.open(path + "/picture.png")
+        first_image = Image.open(path + "/picture.jpg")
 
         # When updating...
         code, content = self.api.set_profile(default=True, image=self.image_portrait)
-        second_image = Image.open(path + "/picture.png")
+        second_image = Image.open(path + "/picture.jpg")
 
         self.assertEqual(200, code)
         self.assertEqual(content["success"], True)
-        self.assertEqual(1, len(os.listdir(path)))
+        formats = images.stored_formats(transparent=False)
+        self.assertEqual(len(config.PROFILE_PICTURE_SIZES) * len(formats), len(os.listdir(path)))
         self.assertNotEqual(first_image, second_image)
 
     def test_GivenUserWhenUpdatingAnotherUserProfileByReplacingUsernameWithSameUsernameAsOtherUserThenRaiseUsernameTaken(
@@ -1173,7 +1619,7 @@ class Tests(unittest.TestCase):
         id = self.database.add_default_user()
         self.api.set_profile(default=True, image=new_picture)
 
-        self.assertTrue(os.path.exists(f"Medias/profile_picture/{id}/picture.png"))
+        self.assertTrue(os.path.exists(f"Medias/profile_picture/{id}/picture.jpg"))
 
     def test_GivenProfilePictureWhenGettingProfileDataThenSendCorrectRoute(self):
         picture = self.image_square
@@ -1182,7 +1628,7 @@ class Tests(unittest.TestCase):
 
         code, content = self.api.get_profile(id)
 
-        self.assertEqual(f"/user/{id}/profile/picture", content["data"]["profile_picture_route"])
+        self.assertEqual(f"/user/{id}/profile/picture/1", content["data"]["profile_picture_route"])
 
     """
     --------------------------
@@ -1191,7 +1637,7 @@ class Tests(unittest.TestCase):
     """
 
     def profile_picture_path(self, id):
-        return f"Medias/profile_picture/{id}/picture.png"
+        return f"Medias/profile_picture/{id}/picture.jpg"
 
     def test_GivenProfilePictureWhenGettingItThenIsCorrectImage(self):
         id = self.database.add_default_user()
@@ -1203,6 +1649,67 @@ class Tests(unittest.TestCase):
         self.assertEqual(200, code)
         self.assertEqual(image, Image.open(self.profile_picture_path(id)))
 
+    def test_GivenProfilePictureWhenGettingItWithSizeThenSmallestPictureAtLeastAsBig(self):
+        id = self.database.add_default_user()
+        self.api.set_profile(default=True, image=self.image_square)
+
+        code, content = self.api.profile_picture(id, size=60)
+        image = Image.open(io.BytesIO(content))
+
+        self.assertEqual(200, code)
+        self.assertEqual((75, 75), image.size)
+        code, content = self.api.profile_picture(id, size=500)
+        self.assertEqual(config.PROFILE_PICTURE_DIMENSION, Image.open(io.BytesIO(content)).size[0])
+
+    def test_GivenProfilePictureWhenGettingItAcceptingWebpThenWebpElseJpeg(self):
+        id = self.database.add_default_user()
+        self.api.set_profile(default=True, image=self.image_square)
+
+        code, content = self.api.profile_picture(id, accept="image/webp,image/*;q=0.8")
+        self.assertEqual(200, code)
+        self.assertEqual("WEBP", Image.open(io.BytesIO(content)).format)
+
+        code, content = self.api.profile_picture(id, accept="image/*,*/*;q=0.8")
+        self.assertEqual(200, code)
+        self.assertEqual("JPEG", Image.open(io.BytesIO(content)).format)
+
+    def test_GivenTransparentPictureWhenReplacedByOpaqueOneThenPngReplacedByJpeg(self):
+        id = self.database.add_default_user()
+        transparent = io.BytesIO()
+        Image.new("RGBA", (200, 200), (255, 0, 0, 0)).save(transparent, format="PNG")
+        transparent.seek(0)
+        path = f"Medias/profile_picture/{id}/picture"
+
+        self.api.set_profile(default=True, image=(transparent, "transparent.png"))
+        self.assertTrue(os.path.isfile(path + ".png"))
+        self.assertFalse(os.path.isfile(path + ".jpg"))
+
+        self.api.set_profile(default=True, image=self.image_square)
+        self.assertFalse(os.path.isfile(path + ".png"))
+        self.assertTrue(os.path.isfile(path + ".jpg"))
+
+    def test_GivenPictureChangedWhenGettingOldVersionThenRedirectedToImmutableCurrentVersion(self):
+        id = self.database.add_default_user()
+        self.api.set_profile(default=True, image=self.image_square)
+        self.api.set_profile(default=True, image=self.image_portrait)
+
+        response = self.client.get(f"/user/{id}/profile/picture/1", query_string={"size": 75})
+        self.assertEqual(302, response.status_code)
+        self.assertTrue(response.headers["Location"].endswith(f"/user/{id}/profile/picture/2?size=75"))
+
+        response = self.client.get(f"/user/{id}/profile/picture/2", query_string={"size": 75})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual("public, max-age=31536000, immutable", response.headers["Cache-Control"])
+        self.assertEqual((75, 75), Image.open(io.BytesIO(response.data)).size)
+
+    def test_GivenUserWithPictureWhenSearchingThenResultHasVersionedPictureRoute(self):
+        id = self.database.add_user()
+        self.cursor.execute(f"""UPDATE UserTable SET picture_version = 3 WHERE id = {id};""")
+
+        code, content = self.api.search(default=True, search="", offset=0, row_count=10)
+
+        self.assertEqual(f"/user/{id}/profile/picture/3", content["result"]["0"]["profile_picture_route"])
+
     def test_GivenNoUserWhenGettingProfilePictureOfUserThenRaiseUserNotExisting(self):
         code, content = self.api.profile_picture(8)  # Should be an invalid id because no user have been created.
 
@@ -1218,6 +1725,29 @@ class Tests(unittest.TestCase):
 
         self.assertEqual(Image.open(self.profile_picture_path(id)), image)
 
+    def test_GivenPostsOfPublicAndPrivateAccountsWhenLoadingManyThenAccessiblePostsInOrderWithOneQuery(self):
+        self.database.add_default_user()
+        public_id = self.database.add_user()
+        private_id = self.database.add_user()
+        followed_private_id = self.database.add_user()
+        self.cursor.execute(f"""UPDATE UserTable SET public_profile = FALSE WHERE id IN ({private_id},
+                            {followed_private_id});""")
+        self.database.follow(default=True, user_id_followed=followed_private_id)
+        public_post = self.database.post(default=False, user_id=public_id)
+        private_post = self.database.post(default=False, user_id=private_id)
+        followed_private_post = self.database.post(default=False, user_id=followed_private_id)
+        own_post = self.database.post(default=True)
+        viewer = user.User(username=default_username, hash=default_hash)
+
+        database.instrumentation.start()
+        posts = post.Post.load_many([own_post, private_post, followed_private_post, own_post + 1000, public_post],
+                                    viewer)
+        recording = database.instrumentation.stop()
+        database.mysql_connection.release_connection()
+
+        self.assertEqual([own_post, followed_private_post, public_post], [p.id for p in posts])
+        self.assertEqual(1, recording.count)
+
     """
     --------------------------
     Like/Unlike tests.
@@ -1268,6 +1798,24 @@ class Tests(unittest.TestCase):
         result = self.cursor.fetchall()
         self.assertEqual(0, len(result))
 
+    def test_GivenNoPostWhenLikingThenRaisePostNotExisting(self):
+        self.database.add_default_user()
+
+        code, content = self.api.like(default=True, post_id=1)
+
+        self.assertEqual(400, code)
+        self.assertEqual(content, errors.PostNotExisting.get_response()[0])
+
+    def test_GivenPrivateAccountWhenLikingOwnPostThenIsSuccessful(self):
+        default_id = self.database.add_default_user()
+        self.cursor.execute(f"""UPDATE UserTable SET public_profile = FALSE WHERE id = {default_id};""")
+        post_id = self.database.post(default=True)
+
+        code, content = self.api.like(default=True, post_id=post_id)
+
+        self.assertEqual(200, code)
+        self.assertEqual(True, content["success"])
+
     def test_GivenLikeFromDefaultWhenLikingAgainThenRaiseErrorAndRelationStillInDatabase(self):
         default_id = self.database.add_default_user()
         post_id = self.database.post(default=True)
@@ -1283,9 +1831,520 @@ class Tests(unittest.TestCase):
         result = self.cursor.fetchall()
         self.assertEqual(1, len(result))
 
+    """
+    --------------------------
+    Hashing tests.
+    --------------------------
+    """
+
+    def test_GivenHashingPoolWhenHashingThenSameHashAsInline(self):
+        self.assertEqual(user.make_server_side_hash("hash", default_username),
+                         hashing.hash_password("hash", default_username))
+
+    def test_GivenHashingProcessKilledWhenHashingThenNewPoolStarted(self):
+        hashing.hash_password("hash", default_username)  # Makes sure the pool is started.
+        for process in list(hashing._pool.get()._processes.values()):
+            process.kill()
+            process.join()
+
+        self.assertEqual(user.make_server_side_hash("hash", default_username),
+                         hashing.hash_password("hash", default_username))
+
+    def test_GivenHashingPoolSaturatedWhenLoginThenRaiseServerBusy(self):
+        self.database.add_default_user()
+        hashing.hash_password("hash", default_username)  # Makes sure the pool is started.
+        taken_slots = 0
+        while hashing._slots.acquire(blocking=False):
+            taken_slots += 1
+
+        code, content = self.api.login(default_username, default_hash)
+        for _ in range(taken_slots):
+            hashing._slots.release()
+
+        self.assertEqual(ServerBusy.get_response(), (content, code))
+        self.assertEqual(200, self.api.login(default_username, default_hash)[0])
+
+    """
+    --------------------------
+    Profile picture cache tests.
+    --------------------------
+    """
+
+    def test_GivenCacheLimitedInBytesWhenFullThenLeastRecentlyUsedEvictedAndTooBigNotCached(self):
+        pictures = cache.LRUCache(max_size=10, max_weight=10, weigher=len)
+
+        pictures.put(1, b"1111")
+        pictures.put(2, b"2222")
+        pictures.get(1)
+        pictures.put(3, b"3333")
+        pictures.put(4, b"4" * 11)
+
+        self.assertEqual(b"1111", pictures.get(1))
+        self.assertIsNone(pictures.get(2))
+        self.assertIsNone(pictures.get(4))
+        self.assertEqual(8, pictures.stats["weight"])
+
+    def test_GivenPictureSentOnceWhenSentAgainThenFromCacheUntilUpdated(self):
+        id = self.database.add_default_user()
+        self.api.set_profile(default=True, image=self.image_square)
+        code, first = self.api.profile_picture(id)
+
+        hits = profile.pictures.stats["hits"]
+        database.instrumentation.start()
+        second, format, version = profile.Profile(id=id).sized_profile_picture(config.PROFILE_PICTURE_DIMENSION,
+                                                                               version=1)
+        recording = database.instrumentation.stop()
+        self.assertEqual(first, second)
+        self.assertEqual(hits + 1, profile.pictures.stats["hits"])
+        self.assertEqual(0, recording.count)
+
+        self.api.set_profile(default=True, image=self.image_portrait)
+        code, third = self.api.profile_picture(id)
+        self.assertNotEqual(first, third)
+        self.assertEqual(Image.open(self.profile_picture_path(id)), Image.open(io.BytesIO(third)))
+
+    """
+    --------------------------
+    Session cache tests.
+    --------------------------
+    """
+
+    def test_GivenAuthenticatedOnceWhenAuthenticatingAgainWithTokenThenSessionComesFromCache(self):
+        token = "token"
+        id = self.database.add_default_user(token=token)
+
+        user.User(token=token)
+        hits = user.sessions.stats["hits"]
+        database.instrumentation.start()
+        userobj = user.User(token=token)
+        recording = database.instrumentation.stop()
+
+        self.assertEqual(hits + 1, user.sessions.stats["hits"])
+        self.assertEqual(0, recording.count)
+        self.assertEqual(id, userobj.id)
+        self.assertEqual(default_username, userobj.username)
+        self.assertEqual(token, userobj.token)
+
+    def test_GivenCachedSessionWhenUpdatingUsernameThenSessionIsInvalidated(self):
+        token = "token"
+        self.database.add_default_user(token=token)
+        new_username = "newusername"
+        user.User(token=token)
+
+        self.api.set_profile(default=False, username=new_username, token=token)
+        userobj = user.User(token=token)
+
+        self.assertEqual(new_username, userobj.username)
+
+    def test_GivenCachedSessionWhenTokenIsRotatedThenOldTokenIsRejected(self):
+        token = "token"
+        self.database.add_default_user(token=token)
+        userobj = user.User(token=token)
+
+        userobj.token = "newtoken"
+
+        self.assertRaises(InvalidCredentials, user.User, token=token)
+        self.assertEqual(userobj.id, user.User(token="newtoken").id)
+
+    """
+    --------------------------
+    Counters tests.
+    --------------------------
+    """
+
+    def get_user_row(self, id: int) -> dict:
+        self.cursor.execute(f"""SELECT * FROM UserTable WHERE id = {id};""")
+        return self.cursor.fetchall()[0]
+
+    def test_GivenUserWhenFollowingAnotherUserThenCountersAreUpdated(self):
+        default_id = self.database.add_default_user()
+        followed_id = self.database.add_user()
+
+        self.api.follow(default=True, id_followed=followed_id)
+
+        self.assertEqual(1, self.get_user_row(default_id)["following_count"])
+        self.assertEqual(0, self.get_user_row(default_id)["follower_count"])
+        self.assertEqual(1, self.get_user_row(followed_id)["follower_count"])
+        self.assertEqual(0, self.get_user_row(followed_id)["following_count"])
+
+    def test_GivenUserWhenPostingThenPostCountIsUpdated(self):
+        default_id = self.database.add_default_user()
+
+        self.api.post(default=True, file=self.image_square)
+        self.api.post(default=True, file=self.image_square)
+
+        self.assertEqual(2, self.get_user_row(default_id)["post_count"])
+
+    def test_GivenPostWhenLikingAndUnlikingThenLikeCountIsUpdated(self):
+        self.database.add_default_user()
+        post_id = self.database.post(default=True)
+
+        self.api.like(default=True, post_id=post_id)
+        self.cursor.execute(f"""SELECT like_count FROM Post WHERE id = {post_id};""")
+        like_count_after_like = self.cursor.fetchall()[0]["like_count"]
+        self.api.unlike(default=True, post_id=post_id)
+        self.api.unlike(default=True, post_id=post_id)  # Not liked anymore, must not change the counter.
+        self.cursor.execute(f"""SELECT like_count FROM Post WHERE id = {post_id};""")
+        like_count_after_unlike = self.cursor.fetchall()[0]["like_count"]
+
+        self.assertEqual(1, like_count_after_like)
+        self.assertEqual(0, like_count_after_unlike)
+
+    def test_GivenCountersDriftedWhenReconcilingThenAreRepaired(self):
+        default_id = self.database.add_default_user()
+        other_id = self.database.add_user()
+        self.database.follow(default=False, user_id_followed=other_id, user_id=default_id)
+        post_id = self.database.post(default=True)
+        self.database.like(default=False, post_id=post_id, user_id=other_id)
+        self.cursor.execute("""UPDATE UserTable SET follower_count = 42, following_count = 7, post_count = 3;""")
+        self.cursor.execute("""UPDATE Post SET like_count = 5;""")
+
+        repaired = database.reconcile_counters.reconcile()
+        database.mysql_connection.release_connection()
+
+        self.assertEqual({"UserTable": 2, "Post": 1}, repaired)
+        self.assertEqual((0, 1, 1), tuple(self.get_user_row(default_id)[column] for column in
+                                          ("follower_count", "following_count", "post_count")))
+        self.assertEqual((1, 0, 0), tuple(self.get_user_row(other_id)[column] for column in
+                                          ("follower_count", "following_count", "post_count")))
+        self.cursor.execute(f"""SELECT like_count FROM Post WHERE id = {post_id};""")
+        self.assertEqual(1, self.cursor.fetchall()[0]["like_count"])
+
+    """
+    --------------------------
+    Social graph tests.
+    --------------------------
+    """
+
+    def test_GivenFollowsInDatabaseWhenLoadingSocialGraphThenSameRelations(self):
+        ids = [self.database.add_user() for i in range(4)]
+        follows = [(ids[0], ids[1]), (ids[0], ids[2]), (ids[1], ids[2]), (ids[3], ids[0])]
+        for (user_id, user_id_followed) in follows:
+            self.database.follow(default=False, user_id=user_id, user_id_followed=user_id_followed)
+
+        graph = social_graph.SocialGraph()
+        graph.load()
+        database.mysql_connection.release_connection()
+
+        self.assertTrue(graph.is_following(ids[0], ids[1]))
+        self.assertFalse(graph.is_following(ids[1], ids[0]))
+        self.assertEqual([ids[1], ids[2]], graph.following(ids[0]))
+        self.assertEqual([ids[0], ids[1]], graph.followers(ids[2]))
+        self.assertEqual(2, graph.follower_count(ids[2]))
+        self.assertEqual(0, graph.following_count(ids[2]))
+        self.assertEqual([ids[2]], graph.common_following(ids[0], ids[1]))
+
+    def test_GivenSocialGraphWhenFollowingThenGraphUpdatedAndFollowingAgainRaisesWithoutQuery(self):
+        followed_id = self.database.add_user()
+        self.database.add_default_user()
+        social_graph.graph.load()
+        database.mysql_connection.release_connection()
+        config.SOCIAL_GRAPH_ENABLED = True
+        try:
+            viewer = user.User(username=default_username, hash=default_hash)
+            viewer.follow(followed_id)
+            database.instrumentation.start()
+            with self.assertRaises(UserAlreadyFollowed):
+                viewer.follow(followed_id)
+            recording = database.instrumentation.stop()
+            database.mysql_connection.release_connection()
+            is_following = social_graph.graph.is_following(viewer.id, followed_id)
+        finally:
+            config.SOCIAL_GRAPH_ENABLED = False
+            social_graph.graph = social_graph.SocialGraph()
+
+        self.assertTrue(is_following)
+        self.assertEqual(0, recording.count)
+
+    """
+    --------------------------
+    Feed tests.
+    --------------------------
+    """
+
+    def test_GivenFollowedUserPostingWhenReadingFeedPageByPageThenNewestPostsFirst(self):
+        self.database.add_default_user()
+        followed_id = self.database.add_user()
+        followed_token = user.generate_token()
+        self.cursor.execute(f"""UPDATE UserTable SET token = "{followed_token}", token_registration_date = NOW()
+                            WHERE id = {followed_id};""")
+        self.database.follow(default=True, user_id_followed=followed_id)
+        post_ids = []
+        for i in range(3):
+            code, content = self.api.post(default=False, file=self.image_square, token=followed_token)
+            post_ids.append(content["id"])
+        post_ids.append(self.api.post(default=True, file=self.image_square)[1]["id"])
+        # Waiting for the fan-outs.
+        timeline.shutdown()
+
+        results = []
+        cursor = None
+        for page in range(2):
+            code, content = self.api.feed(default=True, row_count=2, cursor=cursor)
+            self.assertEqual(200, code)
+            results += [element["id"] for element in content["result"]]
+            cursor = content["nextCursor"]
+
+        self.assertEqual(sorted(post_ids, reverse=True), results)
+        code, content = self.api.feed(default=True, row_count=2, cursor=cursor)
+        self.assertEqual([], content["result"])
+        self.assertIsNone(content["nextCursor"])
+
+    def test_GivenUsersWithPostsWhenFollowingThemThenTheirPostsInFeed(self):
+        self.database.add_default_user()
+        followed_id = self.database.add_user()
+        post_ids = [self.database.post(default=False, user_id=followed_id) for i in range(2)]
+        batch_followed_id = self.database.add_user()
+        post_ids.append(self.database.post(default=False, user_id=batch_followed_id))
+
+        self.api.follow(default=True, id_followed=followed_id)
+        self.api.follow_batch(default=True, ids=[batch_followed_id])
+
+        code, content = self.api.feed(default=True, row_count=10)
+        self.assertEqual(200, code)
+        self.assertEqual(sorted(post_ids, reverse=True), [element["id"] for element in content["result"]])
+
+    def test_GivenMoreUsersInFollowBatchWhenFollowingThenSameNumberOfQueries(self):
+        self.database.add_default_user()
+        viewer = user.User(username=default_username, hash=default_hash)
+        counts = []
+        post_ids = []
+        for batch_size in (1, 5):
+            ids = [self.database.add_user() for i in range(batch_size)]
+            post_ids += [self.database.post(default=False, user_id=id) for id in ids]
+
+            database.instrumentation.start()
+            viewer.follow_many(ids)
+            counts.append(database.instrumentation.stop().count)
+        database.mysql_connection.release_connection()
+
+        self.assertEqual(counts[0], counts[1])
+        self.cursor.execute(f"""SELECT post_id FROM Timeline WHERE viewer_id = {viewer.id} ORDER BY post_id;""")
+        self.assertEqual(sorted(post_ids), [row["post_id"] for row in self.cursor.fetchall()])
+
+    def test_GivenUserOverFanOutThresholdWhenReadingFeedThenPostsMergedFromPost(self):
+        self.database.add_default_user()
+        followed_id = self.database.add_user()
+        self.database.follow(default=True, user_id_followed=followed_id)
+        self.cursor.execute(f"""UPDATE UserTable SET follower_count = {config.TIMELINE_FAN_OUT_MAX_FOLLOWERS}
+                            WHERE id = {followed_id};""")
+        post_id = self.database.post(default=False, user_id=followed_id)
+        self.cursor.execute(f"""SELECT post_time FROM Post WHERE id = {post_id};""")
+        timeline.fan_out(post_id, followed_id, self.cursor.fetchall()[0]["post_time"])
+        database.mysql_connection.release_connection()
+
+        self.cursor.execute(f"""SELECT viewer_id FROM Timeline WHERE post_id = {post_id};""")
+        self.assertEqual([followed_id], [row["viewer_id"] for row in self.cursor.fetchall()])
+        code, content = self.api.feed(default=True, row_count=10)
+        self.assertEqual([post_id], [element["id"] for element in content["result"]])
+
+    def test_GivenFewUsersFollowedWhenReadingMergedFeedThenSameAsTimelineWithBoundedQueries(self):
+        default_id = self.database.add_default_user()
+        followed_ids = [self.database.add_user() for i in range(5)]
+        post_ids = []
+        for id in followed_ids:
+            self.database.follow(default=True, user_id_followed=id)
+            post_ids += [self.database.post(default=False, user_id=id) for i in range(3)]
+        post_ids.append(self.database.post(default=True))
+        database.backfill_timelines.backfill()
+
+        config.FEED_MERGE_BATCH_SIZE = 2
+        try:
+            expected = [row["id"] for row in timeline.timeline(default_id, row_count=7)]
+            database.instrumentation.start()
+            merged = [row["id"] for row in timeline.merged_timeline(default_id, row_count=7)]
+            recording = database.instrumentation.stop()
+            database.instrumentation.start()
+            first = [row["id"] for row in timeline.merged_timeline(default_id, row_count=1)]
+            small_page_recording = database.instrumentation.stop()
+            database.mysql_connection.release_connection()
+        finally:
+            config.FEED_MERGE_BATCH_SIZE = 10
+
+        self.assertEqual(sorted(post_ids, reverse=True)[:7], merged)
+        self.assertEqual(expected, merged)
+        # One query, then at most one per batch of posts of the page (row_count // FEED_MERGE_BATCH_SIZE).
+        self.assertLessEqual(recording.count, 1 + 7 // 2)
+        self.assertEqual(merged[:1], first)
+        self.assertEqual(1, small_page_recording.count)
+
+    def test_GivenPostsWithoutTimelineWhenBackfillingThenInFollowersFeeds(self):
+        self.database.add_default_user()
+        followed_id = self.database.add_user()
+        self.database.follow(default=True, user_id_followed=followed_id)
+        post_id = self.database.post(default=False, user_id=followed_id)
+
+        added = database.backfill_timelines.backfill()
+        database.mysql_connection.release_connection()
+
+        self.assertEqual(2, added)
+        code, content = self.api.feed(default=True, row_count=10)
+        self.assertEqual([post_id], [element["id"] for element in content["result"]])
+
+    """
+    --------------------------
+    Suggestion tests.
+    --------------------------
+    """
+
+    def test_GivenFriendsOfFriendsWhenComputingSuggestionsThenRankedByUsersFollowedFollowingThem(self):
+        default_id = self.database.add_default_user()
+        ids = [self.database.add_user() for i in range(4)]
+        follows = [(default_id, ids[0]), (default_id, ids[1]), (ids[0], ids[2]), (ids[0], ids[3]), (ids[1], ids[3]),
+                   (ids[1], default_id)]
+        for (user_id, user_id_followed) in follows:
+            self.database.follow(default=False, user_id=user_id, user_id_followed=user_id_followed)
+
+        suggestions.compute()
+        database.mysql_connection.release_connection()
+
+        code, content = self.api.suggestions(default=True, row_count=10)
+        self.assertEqual(200, code)
+        self.assertEqual([(ids[3], 2), (ids[2], 1)], [(row["id"], row["followedBy"]) for row in content["result"]])
+
+    def test_GivenSuggestedUserFollowedSinceComputingWhenGettingSuggestionsThenLeftOut(self):
+        default_id = self.database.add_default_user()
+        ids = [self.database.add_user() for i in range(3)]
+        for (user_id, user_id_followed) in [(default_id, ids[0]), (ids[0], ids[1]), (ids[0], ids[2])]:
+            self.database.follow(default=False, user_id=user_id, user_id_followed=user_id_followed)
+        suggestions.compute()
+        database.mysql_connection.release_connection()
+
+        self.database.follow(default=False, user_id=default_id, user_id_followed=ids[1])
+        code, content = self.api.suggestions(default=True, row_count=10)
+        self.assertEqual([ids[2]], [row["id"] for row in content["result"]])
+
+    """
+    --------------------------
+    Connection pool tests.
+    --------------------------
+    """
+
+    def test_GivenEveryConnectionInUseWhenCheckingOutAnotherOneThenRaiseServerBusy(self):
+        pool = database.mysql_connection.create_pool("BestagramTest")
+        pool.size = 1
+        pool.timeout = 0.1
+        connection = pool.acquire()
+
+        self.assertRaises(ServerBusy, pool.acquire)
+        self.assertEqual(1, pool.stats["exhausted"])
+        self.assertEqual(1, pool.stats["in_use"])
+
+        pool.release(connection)
+        pool.close()
+
+    def test_GivenReleasedConnectionWhenCheckingOutAgainThenIsReused(self):
+        pool = database.mysql_connection.create_pool("BestagramTest")
+        connection = pool.acquire()
+        pool.release(connection)
+
+        reused = pool.acquire()
+
+        self.assertIs(connection, reused)
+        self.assertEqual(1, pool.stats["opened"])
+        self.assertEqual(2, pool.stats["checkouts"])
+        pool.release(reused)
+        pool.close()
+
+    """
+    --------------------------
+    Query tests.
+    --------------------------
+    """
+
+    def test_GivenValueWithQuotesWhenCheckingIfInDatabaseThenIsFoundWithoutError(self):
+        name = 'john "the" o\'neil'
+        id = self.database.add_user()
+        self.cursor.execute("UPDATE UserTable SET name = %s WHERE id = %s;", (name, id))
+
+        self.assertTrue(database.request_utils.value_in_database("UserTable", "name", name))
+        self.assertFalse(database.request_utils.value_in_database("UserTable", "name", name + '"'))
+
+    def test_GivenStatementExecutedTwiceWhenQueryingThenPreparedStatementIsReused(self):
+        self.database.add_default_user()
+        statement = "SELECT id FROM UserTable WHERE username = %(username)s;"
+
+        database.query.fetch_all(statement, {"username": default_username})
+        connection = database.mysql_connection.get_pooled_connection()
+        cached_statements = len(connection.statements)
+        result = database.query.fetch_one(statement, {"username": default_username})
+
+        self.assertEqual(cached_statements, len(connection.statements))
+        self.assertEqual(user_in_db(self.cursor, default_username)[1]["id"], result["id"])
+        database.mysql_connection.release_connection()
+
+    def test_GivenPreparedStatementWhenExecutedAgainWithOtherParametersThenRowsOfTheseParameters(self):
+        # Executions after the first one bypass the connector's execute() (see database.query._PreparedCursor), this
+        # fails if a new version of mysql-connector-python breaks that.
+        ids = [self.database.add_user(username=f"prepared{i}") for i in range(2)]
+        statement = "SELECT username FROM UserTable WHERE id = %s;"
+
+        rows = [database.query.fetch_all(statement, (id,)) for id in ids]
+        connection = database.mysql_connection.get_pooled_connection()
+        statement_id = connection.statements[statement][1]._prepared["statement_id"]
+        rows.append(database.query.fetch_all(statement, (ids[0],)))
+        result = database.query.execute("UPDATE UserTable SET name = %s WHERE id = %s;", ("renamed", ids[1]))
+        second_result = database.query.execute("UPDATE UserTable SET name = %s WHERE id = %s;", ("renamed", ids[0]))
+
+        self.assertEqual([[{"username": "prepared0"}], [{"username": "prepared1"}], [{"username": "prepared0"}]], rows)
+        self.assertEqual(statement_id, connection.statements[statement][1]._prepared["statement_id"])
+        self.assertEqual((1, 1), (result.rowcount, second_result.rowcount))
+        self.assertEqual("renamed", user_in_db(self.cursor, "prepared0")[1]["name"])
+        database.mysql_connection.release_connection()
+
+    def test_GivenFullStatementCacheWhenPreparingNewStatementThenOldestIsEvicted(self):
+        connection = database.mysql_connection.get_pooled_connection()
+        for i in range(config.PREPARED_STATEMENT_CACHE_SIZE + 1):
+            database.query.fetch_all(f"SELECT {i} AS number;")
+
+        self.assertEqual(config.PREPARED_STATEMENT_CACHE_SIZE, len(connection.statements))
+        self.assertNotIn("SELECT 0 AS number;", connection.statements)
+        database.mysql_connection.release_connection()
+
+    """
+    --------------------------
+    SQL instrumentation tests.
+    --------------------------
+    """
+
+    def test_GivenStatementsWithDifferentValuesWhenNormalizingThenAreTheSame(self):
+        first = database.instrumentation.normalize("""SELECT * FROM Follow
+        WHERE user_id = 4 AND user_id_followed IN (1, 2, 3);""")
+        second = database.instrumentation.normalize("SELECT * FROM Follow WHERE user_id = %s AND user_id_followed IN (%s, %s);")
+
+        self.assertEqual(first, second)
+        self.assertEqual("SELECT * FROM Follow WHERE user_id = ? AND user_id_followed IN (?+)", first)
+
+    def test_GivenDebugModeWhenMakingRequestThenQuerySummaryInHeaders(self):
+        token = "token"
+        self.database.add_user(token=token)
+        main.app.debug = True
+
+        response = self.client.get("/user/search", query_string={"search": "", "offset": 0, "rowCount": 10},
+                                   headers={"Authorization": token})
+        main.app.debug = False
+
+        self.assertEqual(200, response.status_code)
+        self.assertGreater(int(response.headers["X-SQL-Query-Count"]), 0)
+        self.assertIn("X-SQL-Time", response.headers)
+        self.assertEqual({}, json.loads(response.headers["X-SQL-N-Plus-One"]))
+
+    def test_GivenSameStatementExecutedManyTimesWhenSummarizingThenReportedAsNPlusOne(self):
+        database.instrumentation.start()
+        for i in range(config.SQL_N_PLUS_ONE_THRESHOLD):
+            database.query.fetch_all("SELECT 1 FROM UserTable WHERE id = %s;", (i,))
+        recording = database.instrumentation.stop()
+        database.mysql_connection.release_connection()
+
+        summary = recording.summary(config.SQL_N_PLUS_ONE_THRESHOLD)
+        self.assertEqual(config.SQL_N_PLUS_ONE_THRESHOLD, summary["count"])
+        self.assertEqual({"SELECT ? FROM UserTable WHERE id = ?": config.SQL_N_PLUS_ONE_THRESHOLD},
+                         summary["n_plus_one"])
 
     def remove_all_from_db(self):
         delete_all_query = """
+                DELETE FROM Suggestion;
+                DELETE FROM Timeline;
                 DELETE FROM Follow;
                 DELETE FROM Tag;
                 DELETE FROM LikeTable;
@@ -1298,6 +2357,11 @@ class Tests(unittest.TestCase):
 
     def tearDown(self) -> None:
         self.remove_all_from_db()
+        # The rows behind the cached sessions are gone.
+        user.sessions.clear()
+        search_cache.searches.clear()
+        profile.pictures.clear()
+        self.cnx.close()
         try:
             shutil.rmtree("Medias")
         except:
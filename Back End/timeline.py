@@ -0,0 +1,250 @@
+import base64
+import collections
+import concurrent.futures
+import datetime
+import heapq
+import itertools
+import json
+import config
+import database.mysql_connection
+import errors
+import executors
+from database import query
+
+"""
+Home feed timelines. When a user posts, the post is written into the timeline of each of its followers (fan-out on
+write), so reading a feed is a range scan of the primary key of the Timeline table instead of a join of Follow and Post
+sorted on every request.
+
+Users following few people can instead get their feed built when it is read (see merged_timeline()) : the newest posts
+of each user followed are read from Post and merged.
+
+The fan-out of a post runs in a pool of threads (see config.TIMELINE_FAN_OUT_WORKERS) once its image is processed, by
+batches of config.TIMELINE_FAN_OUT_BATCH_SIZE followers : posting doesn't wait for it, and followers see the post a
+moment later.
+
+Writing a post into millions of timelines is not worth it : the posts of users with at least
+config.TIMELINE_FAN_OUT_MAX_FOLLOWERS followers are not fanned out, they are read from Post and merged with the timeline
+when a feed is read. Follower counts only grow (users can't unfollow), so a post missing from the timelines is always
+one of a user above the threshold.
+"""
+
+_pool = executors.LazyExecutor(lambda: concurrent.futures.ThreadPoolExecutor(
+    max_workers=config.TIMELINE_FAN_OUT_WORKERS, thread_name_prefix="fan-out"))
+
+FEED_START = (datetime.datetime(9999, 12, 31, 23, 59, 59), 0)
+"""
+Position before the first post of a feed. Posts are sorted by (post_time, id), newest first.
+"""
+
+
+def is_fanned_out(follower_count: int) -> bool:
+    """
+    Check if the posts of a user with this number of followers are written into the timelines of its followers.
+    """
+    return follower_count < config.TIMELINE_FAN_OUT_MAX_FOLLOWERS
+
+
+def fan_out(post_id: int, user_id: int, post_time: datetime.datetime):
+    """
+    Write a post into the timeline of its poster and, unless it has too many of them, of its followers.
+    """
+    query.execute("""INSERT IGNORE INTO Timeline (viewer_id, post_time, post_id) VALUES (%s, %s, %s);""",
+                  (user_id, post_time, post_id))
+    follower_count = query.fetch_one("""SELECT follower_count FROM UserTable WHERE id = %s;""",
+                                     (user_id,))["follower_count"]
+    if not is_fanned_out(follower_count):
+        return
+
+    batch_size = config.TIMELINE_FAN_OUT_BATCH_SIZE
+    after = 0
+    while True:
+        followers = [row["user_id"] for row in query.fetch_all("""
+        SELECT user_id FROM Follow
+        WHERE user_id_followed = %s AND user_id > %s
+        ORDER BY user_id
+        LIMIT %s;
+        """, (user_id, after, batch_size))]
+        if followers:
+            # Only the last batch has a different number of rows, the full ones share a prepared statement.
+            query.execute(f"""
+            INSERT IGNORE INTO Timeline (viewer_id, post_time, post_id)
+            VALUES {", ".join(["(%s, %s, %s)"] * len(followers))};
+            """, [value for id in followers for value in (id, post_time, post_id)],
+                          prepared=len(followers) == batch_size)
+        if len(followers) < batch_size:
+            return
+        after = followers[-1]
+
+
+def copy_posts(viewer_id: int, user_ids: [int]):
+    """
+    Write the newest posts of users into the timeline of a new follower : posts are only fanned out when they are
+    created, without this the follower would only see the next ones. Nothing is written for the users whose posts are
+    not fanned out, they are merged when the feed is read.
+
+    One statement for all the users : the newest config.TIMELINE_FOLLOW_POST_COUNT posts of each of them are read from
+    ind_user_id_post_time, like merged_timeline() does.
+    :param viewer_id: Id of the new follower.
+    :param user_ids: Ids of the users followed.
+    """
+    if not user_ids:
+        return
+    # The number of ids changes from one call to the other, only a single follow is worth a prepared statement.
+    query.execute(f"""
+    INSERT IGNORE INTO Timeline (viewer_id, post_time, post_id)
+    SELECT %s, Newest.post_time, Newest.id FROM (
+        SELECT id FROM UserTable WHERE id IN ({query.placeholders(len(user_ids))}) AND follower_count < %s
+    ) AS Followed
+    JOIN LATERAL (
+        SELECT id, post_time FROM Post
+        WHERE Post.user_id = Followed.id AND status = 'ready'
+        ORDER BY post_time DESC, id DESC
+        LIMIT %s
+    ) AS Newest;
+    """, [viewer_id] + list(user_ids) + [config.TIMELINE_FAN_OUT_MAX_FOLLOWERS, config.TIMELINE_FOLLOW_POST_COUNT],
+                  prepared=len(user_ids) == 1)
+
+
+def _fan_out_job(post_id: int, user_id: int, post_time: datetime.datetime):
+    try:
+        fan_out(post_id, user_id, post_time)
+    except Exception as e:
+        # The post is still readable, only missing from the feeds. The backfill command writes it again.
+        print(f"Fan-out failed. post_id : {post_id}, error : {e}")
+    finally:
+        database.mysql_connection.release_connection()
+
+
+def fan_out_async(post_id: int, user_id: int, post_time: datetime.datetime):
+    """
+    Same as fan_out() but run in the fan-out pool. Runs right away when config.TIMELINE_FAN_OUT_WORKERS is 0.
+    """
+    if config.TIMELINE_FAN_OUT_WORKERS == 0:
+        fan_out(post_id, user_id, post_time)
+        return
+    _pool.get().submit(_fan_out_job, post_id, user_id, post_time)
+
+
+def shutdown():
+    """
+    Wait for the pending fan-outs and stop the fan-out threads. They are started again on the next post.
+    """
+    _pool.shutdown()
+
+
+def encode_cursor(post_time: datetime.datetime, id: int) -> str:
+    """
+    Cursor pointing right after a post of a feed.
+    """
+    position = [post_time.isoformat(), id]
+    return base64.urlsafe_b64encode(json.dumps(position).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> (datetime.datetime, int):
+    """
+    Position pointed by a cursor returned by encode_cursor().
+    :raise InvalidCursor:
+    """
+    try:
+        post_time, id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        post_time = datetime.datetime.fromisoformat(post_time)
+    except Exception:
+        raise errors.InvalidCursor
+    if not isinstance(id, int):
+        raise errors.InvalidCursor
+    return post_time, id
+
+
+def timeline(viewer_id: int, row_count: int, before: (datetime.datetime, int) = FEED_START) -> [dict]:
+    """
+    Newest posts of the users followed by a user (and of the user itself) : its timeline, merged with the posts of the
+    users it follows whose posts are not fanned out.
+    :param viewer_id: Id of the user.
+    :param row_count: Maximum number of posts returned.
+    :param before: Only return the posts older than this position (post_time, id).
+    :return: The id and post_time of each post, newest first.
+    """
+    params = {"viewer_id": viewer_id, "post_time": before[0], "id": before[1], "row_count": row_count,
+              "max_followers": config.TIMELINE_FAN_OUT_MAX_FOLLOWERS}
+    fanned_out = query.fetch_all("""
+    SELECT post_id AS id, post_time FROM Timeline
+    WHERE viewer_id = %(viewer_id)s AND (post_time < %(post_time)s OR (post_time = %(post_time)s AND post_id < %(id)s))
+    ORDER BY post_time DESC, post_id DESC
+    LIMIT %(row_count)s;
+    """, params)
+    not_fanned_out = query.fetch_all("""
+    SELECT Post.id, Post.post_time FROM Follow
+    JOIN UserTable ON UserTable.id = Follow.user_id_followed
+    JOIN Post ON Post.user_id = Follow.user_id_followed
+    WHERE Follow.user_id = %(viewer_id)s AND UserTable.follower_count >= %(max_followers)s AND Post.status = 'ready'
+    AND (Post.post_time < %(post_time)s OR (Post.post_time = %(post_time)s AND Post.id < %(id)s))
+    ORDER BY Post.post_time DESC, Post.id DESC
+    LIMIT %(row_count)s;
+    """, params)
+
+    # Posts made before their poster went over the threshold are in both.
+    results = []
+    seen = set()
+    for row in heapq.merge(fanned_out, not_fanned_out, key=lambda row: (row["post_time"], row["id"]), reverse=True):
+        if row["id"] not in seen:
+            seen.add(row["id"])
+            results.append(row)
+    return results[:row_count]
+
+
+def _followed_posts(user_id: int, rows: [dict]) -> iter:
+    """
+    Posts of a user, newest first : the rows already fetched, then the next ones, fetched by batches of
+    config.FEED_MERGE_BATCH_SIZE when they are needed.
+    :param rows: First posts of the user, as many as the batch size unless there are no others. Fewer when the page is
+    smaller than a batch : then no more posts are needed.
+    """
+    while True:
+        yield from rows
+        if len(rows) < config.FEED_MERGE_BATCH_SIZE:
+            return
+        before = (rows[-1]["post_time"], rows[-1]["id"])
+        rows = query.fetch_all("""
+        SELECT id, user_id, post_time FROM Post
+        WHERE user_id = %(user_id)s AND status = 'ready'
+        AND (post_time < %(post_time)s OR (post_time = %(post_time)s AND id < %(id)s))
+        ORDER BY post_time DESC, id DESC
+        LIMIT %(row_count)s;
+        """, {"user_id": user_id, "post_time": before[0], "id": before[1], "row_count": config.FEED_MERGE_BATCH_SIZE})
+
+
+def merged_timeline(viewer_id: int, row_count: int, before: (datetime.datetime, int) = FEED_START) -> [dict]:
+    """
+    Same as timeline() but built from Post when it is read, without the Timeline table.
+
+    One query reads the newest config.FEED_MERGE_BATCH_SIZE posts (row_count if it is smaller) of each user followed
+    (and of the user itself), each of them a range of ind_user_id_post_time. They are merged with a heap. The next posts of a user are only fetched
+    when all of its posts fetched so far made it into the page : a page of row_count posts takes at most
+    row_count / config.FEED_MERGE_BATCH_SIZE more queries, whatever the number of users followed.
+    """
+    params = {"viewer_id": viewer_id, "post_time": before[0], "id": before[1],
+              "row_count": min(config.FEED_MERGE_BATCH_SIZE, row_count)}
+    rows = query.fetch_all("""
+    SELECT Newest.id, Newest.user_id, Newest.post_time FROM (
+        SELECT user_id_followed AS id FROM Follow WHERE user_id = %(viewer_id)s
+        UNION ALL
+        SELECT %(viewer_id)s
+    ) AS Followed
+    JOIN LATERAL (
+        SELECT id, user_id, post_time FROM Post
+        WHERE Post.user_id = Followed.id AND status = 'ready'
+        AND (post_time < %(post_time)s OR (post_time = %(post_time)s AND Post.id < %(id)s))
+        ORDER BY post_time DESC, id DESC
+        LIMIT %(row_count)s
+    ) AS Newest;
+    """, params)
+
+    posts = collections.defaultdict(list)
+    for row in rows:
+        posts[row["user_id"]].append(row)
+    for user_rows in posts.values():
+        user_rows.sort(key=lambda row: (row["post_time"], row["id"]), reverse=True)
+    streams = [_followed_posts(user_id, user_rows) for (user_id, user_rows) in posts.items()]
+    merged = heapq.merge(*streams, key=lambda row: (row["post_time"], row["id"]), reverse=True)
+    return [{"id": row["id"], "post_time": row["post_time"]} for row in itertools.islice(merged, row_count)]
@@ -1,18 +1,30 @@
+import base64
+import collections
 import datetime
+import json
 import os
 import random
 import re
 import werkzeug
+import mysql.connector
+import mysql.connector.errorcode
+import cache
 import config
 import database.mysql_connection
-from database import request_utils
+from database import query
 from errors import *
 import tag
 from PIL import Image
-import hashlib
+import hashing
+from hashing import make_server_side_hash  # Still used from here by the tests.
 import profile
+import search_cache
+import search_index
+import social_graph
 import images
 import files
+import post
+import timeline
 
 
 def generate_token() -> str:
@@ -50,16 +62,159 @@ def name_is_valid(name: str) -> bool:
     return len(re.findall(regex, name)) == 1
 
 
-def make_server_side_hash(old_hash: str, username: str) -> str:
+Session = collections.namedtuple("Session", ["id", "username", "name", "caption", "token",
+                                             "token_registration_date"])
+"""
+Data of an authenticated user, cached by token.
+"""
+
+sessions = cache.LRUCache(max_size=config.SESSION_CACHE_SIZE, ttl=config.SESSION_CACHE_TTL)
+"""
+Cache of the sessions, keyed by token. It is consulted before the database when a user is authenticated with a token.
+"""
+
+
+def invalidate_sessions(id: int):
+    """
+    Remove every cached session of a user.
+    :param id: Id of the user.
+    """
+    sessions.discard_if(lambda session: session.id == id)
+
+
+def update_counters(following: int, followed: int, delta: int = 1):
+    """
+    Update the follower/following counters after a follow relation has been added (or removed with a negative delta).
+    Must be called in the same transaction as the change in the Follow table.
+    :param following: Id of the user following.
+    :param followed: Id of the user followed.
+    :param delta: Number of relations added.
+    """
+    query.execute("""
+    UPDATE UserTable
+    SET following_count = following_count + IF(id = %(following)s, %(delta)s, 0),
+        follower_count = follower_count + IF(id = %(followed)s, %(delta)s, 0)
+    WHERE id IN (%(following)s, %(followed)s);
+    """, {"following": following, "followed": followed, "delta": delta})
+
+
+SEARCH_START = {"followed": True, "followers": 2 ** 63 - 1, "name": "", "id": 0}
+"""
+Position before the first result of a search. Results are ranked by (followed, followers, name, id) : users followed
+first, then by number of followers (descending), name and id.
+"""
+
+
+def search_pattern(search: str) -> str:
+    """
+    LIKE pattern matching the names containing the characters of the search in the same order.
+
+    If the string is abc it transforms it to %a%b%c% which allow us to match suggestions for string like :
+
+     - ABraCadabra
+     - ABC
+     - hellow A B hellow C
+
+    It allows for matches even if the charaters doesn't touch each other as long as they appear in the same order
+    """
+    return "%" + "%".join(search) + "%"
+
+
+def search_results(results: [dict], rank: int) -> dict:
+    """
+    Format search results for the api : a dictionary whose keys are the ranks of the results.
+    :param rank: Rank of the first result.
+    """
+    return {index + rank: {"id": element["id"], "username": element["username"], "name": element["name"],
+                           "profile_picture_route": profile.picture_route(element["id"], element["picture_version"])}
+            for (index, element) in enumerate(results)}
+
+
+def encode_search_cursor(result: dict, rank: int) -> str:
+    """
+    Cursor pointing right after a search result.
+    :param result: Last result of the page.
+    :param rank: Rank of the first result of the next page.
+    """
+    position = [result["followed"], result["followers"], result["name"], result["id"], rank]
+    return base64.urlsafe_b64encode(json.dumps(position).encode("utf-8")).decode("ascii")
+
+
+def decode_search_cursor(cursor: str) -> dict:
     """
-    Calculate the hash for a given password. This hashing process is described in the global readme.
-    :param old_hash:
-    :param username:
-    :return: The new hash.
+    Position pointed by a cursor returned by encode_search_cursor().
+    :raise InvalidCursor:
     """
-    new_hash = hashlib.pbkdf2_hmac("sha256", password=old_hash.encode("utf-8"), salt=username.encode("utf-8"),
-                                   iterations=10000, dklen=32).hex()
-    return new_hash
+    try:
+        followed, followers, name, id, rank = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception:
+        raise InvalidCursor
+    if not (isinstance(followed, bool) and isinstance(followers, int) and isinstance(name, str)
+            and isinstance(id, int) and isinstance(rank, int)):
+        raise InvalidCursor
+    return {"followed": followed, "followers": followers, "name": name, "id": id, "rank": rank}
+
+
+def can_access(viewer_id: int, id: int) -> bool:
+    """
+    Check if a user can see the posts and the relations of another user : public accounts can be seen by everyone,
+    private accounts only by their followers.
+    :param viewer_id: Id of the user accessing the account.
+    :param id: Id of the account accessed.
+
+    :raise UserNotExisting:
+    """
+    result = query.fetch_one("""SELECT public_profile FROM UserTable WHERE id = %s;""", (id,))
+    if result is None:
+        raise UserNotExisting
+    if viewer_id == id or result["public_profile"]:
+        return True
+    return social_graph.is_following(viewer_id, id)
+
+
+FOLLOW_LISTS = {
+    "followers": """
+    SELECT UserTable.id, UserTable.username, UserTable.name FROM Follow
+    JOIN UserTable ON UserTable.id = Follow.user_id
+    WHERE Follow.user_id_followed = %(id)s AND Follow.user_id > %(after)s
+    ORDER BY Follow.user_id
+    LIMIT %(row_count)s;
+    """,
+    "following": """
+    SELECT UserTable.id, UserTable.username, UserTable.name FROM Follow
+    JOIN UserTable ON UserTable.id = Follow.user_id_followed
+    WHERE Follow.user_id = %(id)s AND Follow.user_id_followed > %(after)s
+    ORDER BY Follow.user_id_followed
+    LIMIT %(row_count)s;
+    """
+}
+"""
+Query reading a page of each list, sorted by id. The followers are read in the order of ind_user_id_followed and the
+users followed in the order of the primary key, starting right after the last id of the previous page.
+"""
+
+
+def follow_list(id: int, relation: str, after: int, row_count: int) -> iter:
+    """
+    Iterate over the followers of a user or the users it follows, sorted by id. The rows are fetched by chunks of
+    config.FOLLOW_LIST_CHUNK_SIZE, so a long list is never held in memory at once.
+    :param id: Id of the user.
+    :param relation: "followers" or "following".
+    :param after: Only the users whose id is greater than this one are returned.
+    :param row_count: Maximum number of users returned.
+    :return: Generator of dictionaries (id, username and name).
+    """
+    statement = FOLLOW_LISTS[relation]
+    while row_count > 0:
+        chunk_size = min(row_count, config.FOLLOW_LIST_CHUNK_SIZE)
+        rows = query.fetch_all(statement, {"id": id, "after": after, "row_count": chunk_size})
+        # The rows are sent to the client before the next chunk is fetched, the connection isn't kept meanwhile.
+        database.mysql_connection.release_connection()
+        yield from rows
+        if len(rows) < chunk_size:
+            return
+        row_count -= len(rows)
+        after = rows[-1]["id"]
 
 
 class User:
@@ -79,44 +234,45 @@ class User:
 
         :raise InvalidCredentials: When the username and hash don't both correspond to the data of a user.
         """
+        if token and not (username or refresh_token):
+            session = sessions.get(token)
+            if session is not None:
+                # Authenticated without touching the database.
+                self._load(session._asdict())
+                self.hash = None
+                return
+
         if hash:
-            hash = make_server_side_hash(old_hash=hash, username=username)
+            hash = hashing.hash_password(old_hash=hash, username=username)
 
         if username:
             # This query fetch all the user data of this user in the table UserTable.
-            user_query = f"""
+            result = query.fetch_one("""
             SELECT *
             FROM UserTable
-            WHERE UserTable.username = "{username}" AND UserTable.hash = "{hash}";
-            """
+            WHERE UserTable.username = %s AND UserTable.hash = %s;
+            """, (username, hash))
         elif refresh_token:
-            user_query = f"""
-            SELECT * 
+            result = query.fetch_one("""
+            SELECT *
             FROM UserTable
-            WHERE UserTable.refresh_token = "{refresh_token}";
-            """
+            WHERE UserTable.refresh_token = %s;
+            """, (refresh_token,))
         else:
-            user_query = f"""
-            SELECT * 
+            result = query.fetch_one("""
+            SELECT *
             FROM UserTable
-            WHERE UserTable.token = "{token}";
-            """
-
-        self.cursor = database.mysql_connection.cnx.cursor(dictionary=True)
-        self.cursor.execute(user_query)
-        result = self.cursor.fetchall()
+            WHERE UserTable.token = %s;
+            """, (token,))
 
-        if len(result) == 0:
+        if result is None:
             if token:
                 # Token authentication
                 raise InvalidCredentials(token=token)
             else:
                 raise InvalidCredentials(username=username, hash=hash)
 
-        result = result[0]
-        self._token = result["token"]
-        self._token_registration_date: datetime.datetime = result["token_registration_date"]
-        self.id = result["id"]
+        self._load(result)
 
         if token and self.token != token:
             """
@@ -126,64 +282,84 @@ class User:
             """
             raise InvalidCredentials(token=token)
 
-        self.username = result["username"]
-        self.name = result["name"]
-
         self.hash = hash
-        self._caption = result["caption"]
+        self._cache_session()
+
+    def _load(self, data: dict):
+        """
+        Set the attributes of this user from a row of UserTable (or a cached Session).
+        """
+        self._token = data["token"]
+        self._token_registration_date: datetime.datetime = data["token_registration_date"]
+        self.id = data["id"]
+        self.username = data["username"]
+        self.name = data["name"]
+        self._caption = data["caption"]
+        # Sessions don't hold the refresh token, it is fetched when needed.
+        self._refresh_token = data.get("refresh_token")
         self._profile = None
 
-    def __del__(self):
-        try:
-            self.cursor.fetchall()
-        except:
-            pass
-        self.cursor.close()
+    @property
+    def _token_lifetime(self) -> float:
+        """
+        Number of seconds before the token expires. Negative if it is already expired, None if there is no token.
+        """
+        if not self._token_registration_date:
+            return None
+        elapsed = (datetime.datetime.today() - self._token_registration_date).total_seconds()
+        return config.TOKEN_EXPIRATION - elapsed
+
+    def _cache_session(self):
+        """
+        Cache this user's session so the next requests made with its token don't query the database. The entry never
+        outlives the token.
+        """
+        lifetime = self._token_lifetime
+        if self._token and lifetime and lifetime > 0:
+            session = Session(id=self.id, username=self.username, name=self.name, caption=self._caption,
+                              token=self._token, token_registration_date=self._token_registration_date)
+            sessions.put(self._token, session, ttl=min(lifetime, config.SESSION_CACHE_TTL))
+
+    def invalidate_session(self):
+        """
+        Remove this user's session from the cache. Must be called whenever data held in the session changes.
+        """
+        invalidate_sessions(self.id)
 
     @property
     def token(self) -> str:
-        if self._token_registration_date:
-            # Checking if token is expired.
-            if (datetime.datetime.today() - self._token_registration_date).total_seconds() < config.TOKEN_EXPIRATION:
-                # Token is not expired, fetching it from the database.
-                token_query = f"""
-                SELECT token
-                FROM UserTable
-                WHERE UserTable.id = {self.id};
-                """
-                self.cursor.execute(token_query)
-                result = self.cursor.fetchall()[0]
-                return result["token"]
+        lifetime = self._token_lifetime
+        if lifetime is not None and lifetime > 0:
+            # Token is not expired.
+            return self._token
 
         # Token is expired or has never been created.
         # generating new token.
-        new_token = generate_token()
-        self._token_registration_date = (
-                    datetime.datetime.today() + datetime.timedelta(seconds=config.TOKEN_EXPIRATION)).replace(
-            microsecond=0)
-        update_token_registration_query = f"""
-        UPDATE UserTable
-        SET token_registration_date = "{self._token_registration_date}"
-        WHERE id = "{self.id}";
-        """
-        self.cursor.execute(update_token_registration_query)
-        self.token = new_token
-        return new_token
+        self.token = generate_token()
+        return self._token
 
     @token.setter
     def token(self, value: str):
         # Update the token value in the database AND the registration date
+        registration_date = datetime.datetime.today().replace(microsecond=0)
         self._set_value(values={
             "token": value,
-            "token_registration_date": datetime.datetime.today().replace(microsecond=0)
+            "token_registration_date": registration_date
         })
+        if self._token:
+            # The old token is not valid anymore.
+            sessions.pop(self._token)
+        self._token = value
+        self._token_registration_date = registration_date
+        self._cache_session()
 
     @property
     def refresh_token(self):
-        get_refresh_token_query = f"""SELECT refresh_token FROM UserTable WHERE UserTable.id = {self.id}"""
-        self.cursor.execute(get_refresh_token_query)
-        result = self.cursor.fetchall()
-        return result[0]["refresh_token"]
+        if self._refresh_token:
+            return self._refresh_token
+        result = query.fetch_one("""SELECT refresh_token FROM UserTable WHERE UserTable.id = %s""", (self.id,))
+        self._refresh_token = result["refresh_token"]
+        return self._refresh_token
 
     @property
     def token_expiration_date(self):
@@ -203,12 +379,11 @@ class User:
         Number of post this user has made.
         :return:
         """
-        get_posts_request = f"""
-        SELECT * FROM Post
-        WHERE Post.user_id = {self.id};
-        """
-        self.cursor.execute(get_posts_request)
-        return len(self.cursor.fetchall())
+        result = query.fetch_one("""
+        SELECT post_count FROM UserTable
+        WHERE UserTable.id = %s;
+        """, (self.id,))
+        return result["post_count"]
 
     @property
     def profile(self) -> profile.Profile:
@@ -223,48 +398,155 @@ class User:
         :param values: This is a dictionary. Each key is a field and the value is the new value to put in the database.
         :return:
         """
-        query = f"""
+        update_query = """
         UPDATE UserTable
         SET 
         """
 
-        for (key, value) in values.items():
-            # Adding each field specified.
-            query += f"""{key} = "{value}","""
+        for key in values.keys():
+            # Adding each field specified. Fields are never user input, values are sent as parameters.
+            update_query += f"""{key} = %({key})s,"""
         # Last element is an unwanted comma.
-        query = query[:-1]
-        query += f"""
-        WHERE UserTable.id = {self.id};
+        update_query = update_query[:-1]
+        update_query += """
+        WHERE UserTable.id = %(id)s;
         """
-        self.cursor.execute(query)
+        query.execute(update_query, dict(values, id=self.id))
 
     def follow(self, id: int):
         """
         Follow another user.
         :param id: Id of the user to follow.
+
+        :raise UserAlreadyFollowed:
+        :raise UserNotExisting:
         """
         # TODO: - This function currently doesn't check if the account is private or not.
 
-        follow_query = f"""
-        INSERT INTO Follow
-        VALUES({self.id}, {id});
-        """
-        # This query check if this user is already following the other user.
-        check_if_already_follow_query = f"""
-        SELECT * FROM Follow
-        WHERE user_id = {self.id} && user_id_followed = {id};
-        """
-        self.cursor.execute(check_if_already_follow_query)
-        result = self.cursor.fetchall()
-        if len(result) > 0:
-            # This user already follow the other user.
+        if config.SOCIAL_GRAPH_ENABLED and social_graph.graph.loaded and social_graph.graph.is_following(self.id, id):
             raise UserAlreadyFollowed
+        # The primary key (user_id, user_id_followed) tells if this user already follows the other one, and the
+        # foreign key if the other user exists.
         try:
-            self.cursor.execute(follow_query)
-        except Exception as e:
-            raise UserNotExisting
+            with query.transaction():
+                query.execute("""
+                INSERT INTO Follow (user_id, user_id_followed)
+                VALUES(%s, %s);
+                """, (self.id, id))
+                update_counters(following=self.id, followed=id)
+                timeline.copy_posts(self.id, [id])
+        except mysql.connector.errors.IntegrityError as e:
+            if e.errno == mysql.connector.errorcode.ER_DUP_ENTRY:
+                raise UserAlreadyFollowed
+            if e.errno == mysql.connector.errorcode.ER_NO_REFERENCED_ROW_2:
+                raise UserNotExisting
+            raise
+        self._followed([id])
         return True
 
+    def follow_many(self, ids: [int]) -> dict:
+        """
+        Follow several users at once. Users already followed and users not existing are skipped.
+        :param ids: Ids of the users to follow. At most config.MAX_FOLLOW_BATCH_SIZE.
+
+        :raise BatchTooLarge:
+
+        :return: Ids of the users followed, of the users already followed and of the users not existing.
+        """
+        ids = list(dict.fromkeys(ids))  # Removes duplicates, keeping the order.
+        if len(ids) > config.MAX_FOLLOW_BATCH_SIZE:
+            raise BatchTooLarge
+        if not ids:
+            return {"followed": [], "alreadyFollowed": [], "notExisting": []}
+
+        for attempt in range(2):
+            try:
+                with query.transaction():
+                    # The number of ids changes from one call to the other, not worth prepared statements.
+                    rows = query.fetch_all(f"""
+                    SELECT UserTable.id, Follow.user_id IS NOT NULL AS followed FROM UserTable
+                    LEFT JOIN Follow ON Follow.user_id_followed = UserTable.id AND Follow.user_id = %s
+                    WHERE UserTable.id IN ({query.placeholders(len(ids))});
+                    """, [self.id] + ids, prepared=False)
+                    existing = {row["id"]: row["followed"] for row in rows}
+                    followed = [i for i in ids if i in existing and not existing[i]]
+                    if followed:
+                        query.execute(f"""
+                        INSERT INTO Follow (user_id, user_id_followed)
+                        VALUES {", ".join(["(%s, %s)"] * len(followed))};
+                        """, [value for i in followed for value in (self.id, i)], prepared=False)
+                        query.execute("""
+                        UPDATE UserTable SET following_count = following_count + %s WHERE id = %s;
+                        """, (len(followed), self.id))
+                        query.execute(f"""
+                        UPDATE UserTable SET follower_count = follower_count + 1
+                        WHERE id IN ({query.placeholders(len(followed))});
+                        """, followed, prepared=False)
+                        timeline.copy_posts(self.id, followed)
+                break
+            except mysql.connector.errors.IntegrityError:
+                # Another request followed or removed one of these users in the meantime, checking them again.
+                if attempt == 1:
+                    raise
+
+        self._followed(followed)
+        return {
+            "followed": followed,
+            "alreadyFollowed": [i for i in ids if existing.get(i)],
+            "notExisting": [i for i in ids if i not in existing]
+        }
+
+    def suggestions(self, row_count: int) -> [dict]:
+        """
+        Users this user may know, computed by the suggestion job (see suggestions.py). Users followed since the job ran
+        are left out.
+        :param row_count: Maximum number of users returned.
+        :return: List of dictionaries (id, username, name and followedBy, the number of users followed by this user who
+        follow this one), best suggestion first.
+        """
+        return query.fetch_all("""
+        SELECT UserTable.id, UserTable.username, UserTable.name, Suggestion.score AS followedBy FROM Suggestion
+        JOIN UserTable ON UserTable.id = Suggestion.user_id_suggested
+        WHERE Suggestion.user_id = %(id)s AND NOT EXISTS (
+            SELECT 1 FROM Follow
+            WHERE Follow.user_id = %(id)s AND Follow.user_id_followed = Suggestion.user_id_suggested
+        )
+        ORDER BY Suggestion.position
+        LIMIT %(row_count)s;
+        """, {"id": self.id, "row_count": row_count})
+
+    def feed(self, row_count: int, cursor: str = None) -> ([dict], str):
+        """
+        Page of the home feed of this user : the posts of the users it follows and its own posts, newest first.
+        :param row_count: Maximum number of posts returned.
+        :param cursor: Cursor returned with the previous page, None for the first page.
+        :return: The posts (id, userId, postTime, caption and likeCount) and the cursor of the next page, None if this
+        is the last one.
+
+        :raise InvalidCursor:
+        """
+        before = timeline.decode_cursor(cursor) if cursor else timeline.FEED_START
+        if config.FEED_MERGE_MAX_FOLLOWING and self._following_count() <= config.FEED_MERGE_MAX_FOLLOWING:
+            rows = timeline.merged_timeline(self.id, row_count, before)
+        else:
+            rows = timeline.timeline(self.id, row_count, before)
+        posts = post.Post.load_many([row["id"] for row in rows], self)
+        next_cursor = None
+        if len(rows) == row_count and rows:
+            next_cursor = timeline.encode_cursor(rows[-1]["post_time"], rows[-1]["id"])
+        return [{"id": p.id, "userId": p.user_id, "postTime": p.post_time.isoformat(), "caption": p.caption,
+                 "likeCount": p.like_count} for p in posts], next_cursor
+
+    def _followed(self, ids: [int]):
+        """
+        Update the caches after this user followed other users.
+        """
+        for id in ids:
+            social_graph.graph.add(self.id, id)
+            search_index.index.add_followers(id)
+        # The users followed come first in the search results.
+        search_cache.searches.invalidate(self.id)
+
     @staticmethod
     def create(username: str, name: str, hash: str, email: str):
         """
@@ -281,7 +563,6 @@ class User:
         """
         username = username.lower()
         name = name.lower()
-        print(hash)
         # TODO: update requirements for parameters in documentation.
         if not email_is_valid(email):
             raise InvalidEmail(email=email)
@@ -292,27 +573,38 @@ class User:
         if not name_is_valid(name):
             raise InvalidName(name=name)
 
-        if request_utils.value_in_database("UserTable", "username", username):
-            # Username is taken.
-            raise UsernameTaken(username=username)
-
-        if request_utils.value_in_database("UserTable", "email", email):
-            # Email is taken.
-            raise EmailTaken(email=email)
-
-        # Account can be created, server-side hashing can now take place following the protocol described in the global
-        # readme.
-        new_hash = make_server_side_hash(old_hash=hash, username=username)
-        refresh_token = generate_token()
+        # Server-side hashing can now take place following the protocol described in the global readme.
+        new_hash = hashing.hash_password(old_hash=hash, username=username)
+        data = {
+            "username": username,
+            "name": name,
+            "caption": None,
+            "token": generate_token(),
+            "refresh_token": generate_token(),
+            "token_registration_date": datetime.datetime.today().replace(microsecond=0)
+        }
 
-        add_user_query = f"""
-        INSERT INTO UserTable (username, name, hash, email, refresh_token) VALUES
-        ("{username}", "{name}", "{new_hash}", "{email}", "{refresh_token}");
-        """
-        cursor = database.mysql_connection.cnx.cursor()
-        cursor.execute(add_user_query)
-        cursor.close()
-        return User(username, hash=hash)
+        # The user is logged in right away : the token is written with the rest of the data. The unique indexes on the
+        # username and the email tell if one of them is already taken.
+        try:
+            data["id"] = query.execute("""
+            INSERT INTO UserTable (username, name, hash, email, token, refresh_token, token_registration_date) VALUES
+            (%(username)s, %(name)s, %(hash)s, %(email)s, %(token)s, %(refresh_token)s, %(token_registration_date)s);
+            """, dict(data, hash=new_hash, email=email)).lastrowid
+        except mysql.connector.errors.IntegrityError as e:
+            if e.errno == mysql.connector.errorcode.ER_DUP_ENTRY and "ind_username" in e.msg:
+                raise UsernameTaken(username=username)
+            if e.errno == mysql.connector.errorcode.ER_DUP_ENTRY and "ind_email" in e.msg:
+                raise EmailTaken(email=email)
+            raise
+
+        search_index.index.add(data["id"], username=username, name=name)
+
+        userobj = User.__new__(User)
+        userobj._load(data)
+        userobj.hash = new_hash
+        userobj._cache_session()
+        return userobj
 
     def search_for(self, search: str, offset: int, row_count: int) -> dict:
         """
@@ -325,43 +617,149 @@ class User:
         :return: Returns a dictionary of dictionary containing the id of the user (+ its name and username) whose username match the
         search. First dctionary keys are the rank in the search (the lowest, the more matching), begins from the offset.
         """
-
-        search_str = "%" + "%".join(search) + "%"
-        """
-        If the string is abc it transforms it to %a%b%c% which allow us to match suggestions for string like : 
-        
-         - ABraCadabra
-         - ABC
-         - hellow A B hellow C
-         
-        It allows for matches even if the charaters doesn't touch each other as long as they appear in the same order
-        """
         if offset < 0:
             offset = 0
         if row_count > 100:
             row_count = 100
-        search_str = self.cursor._connection.converter.escape(search_str)
+        if config.SEARCH_INDEX_ENABLED and search_index.index.loaded:
+            results = search_index.index.search(search, id=self.id, followed=self._followed_ids(), offset=offset,
+                                                row_count=row_count)
+            return search_results(results, rank=offset)
+        if offset + row_count <= config.SEARCH_CACHE_CANDIDATES:
+            results = self._first_search_results(search, offset + row_count)
+            return search_results(results[offset:offset + row_count], rank=offset)
+
+        search_str = search_pattern(search)
+        results = self._search_followed(search_str, SEARCH_START, offset, row_count)
+        if len(results) < row_count:
+            # Not enough results in the first query targeting followed user. Executing search on not followed user.
+            # The offset left for them is the offset minus the number of followed users matching.
+            if results or offset == 0:
+                followed_count = offset + len(results)
+            else:
+                followed_count = query.fetch_one("""
+                SELECT COUNT(*) AS count FROM UserTable
+                JOIN Follow ON Follow.user_id_followed = UserTable.id
+                WHERE UserTable.name LIKE %(search)s AND Follow.user_id = %(id)s;
+                """, {"search": search_str, "id": self.id})["count"]
+            results += self._search_not_followed(search_str, SEARCH_START, max(offset - followed_count, 0),
+                                                 row_count - len(results))
+        return search_results(results, rank=offset)
+
+    def search_page(self, search: str, row_count: int, cursor: str = None) -> (dict, str):
+        """
+        Same search as search_for() but paginated with a cursor instead of an offset : each page starts right after the
+        last result of the previous one, so every page costs the same to the database whatever its depth.
+
+        :param search: Search string.
+        :param row_count: Number of results to have. At most 100.
+        :param cursor: Cursor returned with the previous page, None for the first page.
+        :raise InvalidCursor:
+        :return: The results (same format as search_for()) and the cursor of the next page, None if this is the last
+        one.
+        """
+        if row_count > 100:
+            row_count = 100
+        position = decode_search_cursor(cursor) if cursor else dict(SEARCH_START, rank=0)
+        if config.SEARCH_INDEX_ENABLED and search_index.index.loaded:
+            results = search_index.index.search(search, id=self.id, followed=self._followed_ids(), offset=0,
+                                                row_count=row_count, after=position)
+        else:
+            results = self._cached_search_page(search, row_count, position)
+        if results is None:
+            search_str = search_pattern(search)
+            results = []
+            if position["followed"]:
+                results = self._search_followed(search_str, position, 0, row_count)
+                position = dict(SEARCH_START, followed=False, rank=position["rank"])
+            if len(results) < row_count:
+                results += self._search_not_followed(search_str, position, 0, row_count - len(results))
+
+        next_cursor = None
+        if results and len(results) == row_count:
+            next_cursor = encode_search_cursor(results[-1], rank=position["rank"] + len(results))
+        return search_results(results, rank=position["rank"]), next_cursor
+
+    def _first_search_results(self, search: str, needed: int) -> [dict]:
+        """
+        First results of a search, from the typeahead cache when possible (see search_cache.py).
+        :param needed: Number of results needed.
+        :return: At least needed results, or all of them if there are less.
+        """
+        results = search_cache.searches.get(self.id, search, needed)
+        if results is not None:
+            return results
+
+        # Fetching more results than needed, so the next keystrokes can be answered from the cache.
+        limit = max(needed, config.SEARCH_CACHE_CANDIDATES)
+        search_str = search_pattern(search)
+        results = self._search_followed(search_str, SEARCH_START, 0, limit + 1)
+        if len(results) <= limit:
+            results += self._search_not_followed(search_str, SEARCH_START, 0, limit + 1 - len(results))
+        search_cache.searches.put(self.id, search, results[:limit], complete=len(results) <= limit)
+        return results[:limit]
+
+    def _cached_search_page(self, search: str, row_count: int, position: dict) -> [dict]:
+        """
+        Page of a search paginated with a cursor, from the typeahead cache.
+        :return: The results, None if the page is too deep for the cache or the cursor doesn't point to a cached result.
+        """
+        rank = position["rank"]
+        if rank + row_count > config.SEARCH_CACHE_CANDIDATES:
+            return None
+        results = self._first_search_results(search, rank + row_count)
+        if rank > 0 and (len(results) < rank or results[rank - 1]["id"] != position["id"]):
+            # The results changed since the previous page was sent.
+            return None
+        return results[rank:rank + row_count]
+
+    def _following_count(self) -> int:
+        if config.SOCIAL_GRAPH_ENABLED and social_graph.graph.loaded:
+            return social_graph.graph.following_count(self.id)
+        return query.fetch_one("""SELECT following_count FROM UserTable WHERE id = %s;""",
+                               (self.id,))["following_count"]
+
+    def _followed_ids(self) -> set:
+        """
+        Ids of the users this user follows.
+        """
+        if config.SOCIAL_GRAPH_ENABLED and social_graph.graph.loaded:
+            return set(social_graph.graph.following(self.id))
+        rows = query.fetch_all("SELECT user_id_followed FROM Follow WHERE user_id = %s;", (self.id,))
+        return {row["user_id_followed"] for row in rows}
+
+    def _search_followed(self, search_str: str, position: dict, offset: int, row_count: int) -> [dict]:
+        """
+        Search the users this user follows.
+        :param search_str: LIKE pattern (see search_pattern()).
+        :param position: Only the users ranked after this one are returned (see SEARCH_START).
+        :param offset: Number of results to skip.
+        :param row_count: Maximum number of results.
+        """
         # This query select user matching the search query which the current user follow.
-        followed_search_query = f"""
-        SELECT name, username, id, (SELECT COUNT(*) FROM Follow WHERE user_id_followed = id) AS followers FROM UserTable 
+        results = query.fetch_all("""
+        SELECT name, username, id, follower_count AS followers, picture_version FROM UserTable
         JOIN Follow ON Follow.user_id_followed = UserTable.id
-        WHERE UserTable.name LIKE "{search_str}" AND Follow.user_id = {self.id}
-        ORDER BY followers DESC, name ASC
-        LIMIT {offset}, {row_count};
+        WHERE UserTable.name LIKE %(search)s AND Follow.user_id = %(id)s
+        AND (follower_count < %(followers)s OR (follower_count = %(followers)s AND
+             (name > %(name)s OR (name = %(name)s AND id > %(last_id)s))))
+        ORDER BY followers DESC, name ASC, id ASC
+        LIMIT %(offset)s, %(row_count)s;
+        """, {"search": search_str, "id": self.id, "followers": position["followers"], "name": position["name"],
+              "last_id": position["id"], "offset": offset, "row_count": row_count})
+        return [dict(row, followed=True) for row in results]
+
+    def _search_not_followed(self, search_str: str, position: dict, offset: int, row_count: int) -> [dict]:
         """
-        self.cursor.execute(followed_search_query)
-        results = self.cursor.fetchall()
-        if len(results) < row_count:
-            # Not enough results in the first query targeting followed user. Executing search on not followed user.
-            not_followed_search_query = f"""
-            SELECT name, username, id, (SELECT COUNT(*) FROM Follow WHERE user_id_followed = id) AS followers FROM UserTable
-            WHERE UserTable.name LIKE "{search_str}" AND id NOT IN (SELECT user_id_followed FROM Follow WHERE user_id = {self.id}) AND id != {self.id}
-            ORDER BY followers DESC, name ASC
-            LIMIT {offset}, {row_count - len(results)};
-            """
-            self.cursor.execute(not_followed_search_query)
-            results += self.cursor.fetchall()
-        usernames = [i["id"] for i in results]
-        dictionary = {index + int(offset): {"id": element["id"], "username": element["username"], "name": element["name"]} for (index, element)
-                      in enumerate(results)}
-        return dictionary
+        Same as _search_followed() for the users this user doesn't follow.
+        """
+        results = query.fetch_all("""
+        SELECT name, username, id, follower_count AS followers, picture_version FROM UserTable
+        WHERE UserTable.name LIKE %(search)s AND id NOT IN (SELECT user_id_followed FROM Follow WHERE user_id = %(id)s) AND id != %(id)s
+        AND (follower_count < %(followers)s OR (follower_count = %(followers)s AND
+             (name > %(name)s OR (name = %(name)s AND id > %(last_id)s))))
+        ORDER BY followers DESC, name ASC, id ASC
+        LIMIT %(offset)s, %(row_count)s;
+        """, {"search": search_str, "id": self.id, "followers": position["followers"], "name": position["name"],
+              "last_id": position["id"], "offset": offset, "row_count": row_count})
+        return [dict(row, followed=False) for row in results]